@@ -110,6 +110,7 @@ class StatusChangeHandler(ApiHandlerBase):
         #                           user, ["pending", "approved"], local_today())
 
         future_puts = []
+        suspended = []
         for event in events:
             logging.debug("Suspending event '%s'." % (event.name))
 
@@ -118,6 +119,7 @@ class StatusChangeHandler(ApiHandlerBase):
             event.owner_suspended_time = datetime.datetime.now()
             event_future = db.put_async(event)
             future_puts.append(event_future)
+            suspended.append(event)
 
             # Write a log of it.
             log_entry = HDLog(event=event,
@@ -130,6 +132,8 @@ class StatusChangeHandler(ApiHandlerBase):
         logging.debug("Waiting for all writes to finish...")
         for future_put in future_puts:
             future_put.get_result()
+        # These didn't go through Event.put(), so the room index doesn't know.
+        Event.note_changes(suspended)
 
     """ Restores all the user's events that were put on hold because they were
     suspended to their original status. """
@@ -142,6 +146,7 @@ class StatusChangeHandler(ApiHandlerBase):
         events = Event.get_future_suspended_events_by_member(member=user)
 
         future_puts = []
+        restored = []
         for event in events.run():
             logging.debug("Restoring event '%s'." % (event.name))
 
@@ -150,6 +155,7 @@ class StatusChangeHandler(ApiHandlerBase):
             event.owner_suspended_time = None
             event_future = db.put_async(event)
             future_puts.append(event_future)
+            restored.append(event)
 
             # Write a log of it.
             log_entry = HDLog(event=event,
@@ -162,6 +168,7 @@ class StatusChangeHandler(ApiHandlerBase):
         logging.debug("Waiting for all writes to finish...")
         for future_put in future_puts:
             future_put.get_result()
+        Event.note_changes(restored)
 
     """ Sets that the user's status has changed.
     Request parameters:
@@ -0,0 +1,62 @@
+""" Counts the upper() calls and measures the time it takes to build and render a
+calendar like our ICS export, with and without the cache of upper cased keys
+that CaselessDict uses.
+
+  python benchmarks/caselessdict_benchmark.py [events] [repeats]
+"""
+
+# This sets up our externals, so it has to come first.
+from common import make_calendar
+
+import sys
+import timeit
+
+from icalendar import caselessdict
+
+
+""" Counts how many times str.upper() and unicode.upper() get called.
+function: What to call.
+Returns: The number of calls. """
+def count_upper_calls(function):
+  calls = [0]
+
+  def profile(frame, event, arg):
+    if event == "c_call" and arg.__name__ == "upper":
+      calls[0] += 1
+
+  sys.setprofile(profile)
+  try:
+    function()
+  finally:
+    sys.setprofile(None)
+  return calls[0]
+
+
+def run():
+  count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+  repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+  cached = dict(caselessdict.UPPER_KEYS)
+  try:
+    results = []
+    for name, keys in (("uncached", {}), ("cached", cached)):
+      # The CaselessDict methods look this up every time, so we can swap the
+      # contents out from under them.
+      caselessdict.UPPER_KEYS.clear()
+      caselessdict.UPPER_KEYS.update(keys)
+
+      render = lambda: make_calendar(count).as_string()
+      results.append(render())
+      calls = count_upper_calls(render)
+      best = min(timeit.repeat(render, number=1, repeat=repeats))
+      print "%-8s %8d upper() calls %8.1f ms" % (name, calls, best * 1e3)
+  finally:
+    caselessdict.UPPER_KEYS.clear()
+    caselessdict.UPPER_KEYS.update(cached)
+
+  assert results[0] == results[1]
+  print "%d events, %d bytes" % (count, len(results[0]))
+
+
+if __name__ == "__main__":
+  run()
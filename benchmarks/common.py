@@ -0,0 +1,83 @@
+""" Setup shared by the benchmarks. Run them from the top of the repo, in the
+same environment as the unit tests, for example:
+
+  python benchmarks/export_benchmark.py [events] [repeats]
+"""
+
+# We need to have our externals.
+import appengine_config
+
+import contextlib
+import datetime
+import os
+
+from google.appengine.ext import testbed
+
+os.environ["DJANGO_SETTINGS_MODULE"] = "settings"
+
+from icalendar import Calendar, Event
+import models
+from utils import local_today
+
+
+""" Sets up the same App Engine service stubs that the unit tests use, and takes
+them down again afterwards. """
+@contextlib.contextmanager
+def stubbed_services():
+  bed = testbed.Testbed()
+  bed.activate()
+  bed.init_datastore_v3_stub()
+  bed.init_memcache_stub()
+  bed.init_user_stub()
+  bed.setup_env(user_email="bench@example.com", overwrite=True)
+  try:
+    yield bed
+  finally:
+    bed.deactivate()
+
+
+""" Saves approved events an hour apart, starting a few days from now so that
+they show up in the export feeds.
+count: How many events to make.
+Any other arguments are properties to give every event.
+Returns: The events. """
+def make_events(count, **properties):
+  start = datetime.datetime.combine(local_today(), datetime.time(12)) + \
+          datetime.timedelta(days=3)
+  events = []
+  for i in range(count):
+    event_start = start + datetime.timedelta(hours=i)
+    event = dict(name=u"Benchmark Event %d" % i, start_time=event_start,
+                 end_time=event_start + datetime.timedelta(hours=1),
+                 type=u"Meetup", estimated_size=u"10", status=u"approved",
+                 rooms=[models.ROOM_OPTIONS[0][0]])
+    event.update(properties)
+    events.append(models.Event(**event))
+  models.db.put(events)
+  return events
+
+
+""" Makes a calendar that looks like our ICS export.
+count: How many events to put in it.
+description: The description to give every event.
+organizer_name: The CN parameter of every event's organizer.
+Returns: The Calendar. """
+def make_calendar(count, description="Come and learn about things. " * 20,
+                  organizer_name="Someone"):
+  calendar = Calendar()
+  calendar.add("prodid", "-//Hacker Dojo//Events//EN")
+  calendar.add("version", "2.0")
+  start = datetime.datetime(2015, 1, 1, 12)
+  for i in range(count):
+    event = Event()
+    event.add("summary", "Benchmark Event %d" % i)
+    event.add("description", description)
+    event.add("url", "https://events.hackerdojo.com/event/%d-benchmark" % i)
+    event.add("uid", "%d-benchmark" % i)
+    event.add("location", "Hacker Dojo")
+    event.add("organizer", "MAILTO:someone@example.com")
+    event["organizer"].params["cn"] = organizer_name
+    event.add("dtstart", start + datetime.timedelta(hours=i))
+    event.add("dtend", start + datetime.timedelta(hours=i + 1))
+    calendar.add_component(event)
+  return calendar
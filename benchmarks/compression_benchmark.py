@@ -0,0 +1,83 @@
+""" Measures the bytes on the wire and the CPU time per request for the cached
+export feeds, with and without compression. It also shows what compressing the
+feed on every request would cost, which is what caching the compressed feed
+saves.
+
+  python benchmarks/compression_benchmark.py [events] [requests]
+"""
+
+# This sets up our externals, so it has to come first.
+from common import make_events, stubbed_services
+
+import gzip
+import StringIO
+import sys
+import time
+
+import webob
+
+import main
+
+
+FORMATS = ("ics", "csv", "json")
+ENCODINGS = (None, "gzip", "deflate")
+
+
+""" Makes a request straight to the app. WebTest takes the Content-Encoding
+off of responses, so we can't use it here.
+Returns: The response. """
+def get(url, headers={}):
+  return webob.Request.blank(url, headers=headers).get_response(main.app)
+
+
+""" Returns: The CPU time for a request, in seconds, and the response. """
+def timed_get(url, headers):
+  start = time.clock()
+  response = get(url, headers)
+  return time.clock() - start, response
+
+
+""" What it would cost to gzip the feed for every request instead. """
+def gzip_per_request(body):
+  start = time.clock()
+  out = StringIO.StringIO()
+  gzip_file = gzip.GzipFile(fileobj=out, mode="wb", compresslevel=6)
+  gzip_file.write(body)
+  gzip_file.close()
+  return time.clock() - start
+
+
+def run():
+  count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+  requests = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+  with stubbed_services():
+    make_events(count, contact_name=u"Someone",
+                details=u"Come and learn about things. " * 40,
+                notes=u"Bring a laptop.")
+
+    print "%-6s %-9s %10s %12s" % ("format", "encoding", "bytes", "us/request")
+    for format in FORMATS:
+      url = "/events.%s" % format
+      # Build the cache entry, which is when the compression happens.
+      get(url)
+
+      for encoding in ENCODINGS:
+        headers = {"Accept-Encoding": encoding} if encoding else {}
+        times = []
+        for _ in range(requests):
+          cpu, response = timed_get(url, headers)
+          times.append(cpu)
+        assert response.headers.get("Content-Encoding") == encoding
+        print "%-6s %-9s %10d %12.1f" % (format, encoding or "identity",
+                                         len(response.body),
+                                         min(times) * 1e6)
+
+      body = get(url).body
+      cost = min([gzip_per_request(body) for _ in range(requests)])
+      print "%-6s gzipping on every request would add %.1f us" % (format,
+                                                                   cost * 1e6)
+
+
+if __name__ == "__main__":
+  run()
@@ -0,0 +1,67 @@
+""" Measures how long it takes to split every content line of a big calendar into
+its parts, comparing the old character-by-character parser with the one
+Contentline.parts() uses now.
+
+  python benchmarks/contentline_benchmark.py [events] [repeats]
+"""
+
+# This sets up our externals, so it has to come first.
+from common import make_calendar
+
+import sys
+import timeit
+
+from icalendar.parser import Contentlines, Parameters, validate_token
+
+
+""" The way Contentline.parts() used to work. It's kept here as the baseline. """
+def legacy_parts(line):
+  try:
+    name_split = None
+    value_split = None
+    inquotes = 0
+    for i in range(len(line)):
+      ch = line[i]
+      if not inquotes:
+        if ch in ':;' and not name_split:
+          name_split = i
+        if ch == ':' and not value_split:
+          value_split = i
+      if ch == '"':
+        inquotes = not inquotes
+    name = line[:name_split]
+    if not name:
+      raise ValueError, 'Key name is required'
+    validate_token(name)
+    if name_split+1 == value_split:
+      raise ValueError, 'Invalid content line'
+    params = Parameters.from_string(line[name_split+1:value_split],
+                                    strict=line.strict)
+    values = line[value_split+1:]
+    return (name, params, values)
+  except:
+    raise ValueError, 'Content line could not be parsed into parts'
+
+
+def run():
+  count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+  repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+  # Long descriptions, and a parameter that has to be quoted.
+  text = make_calendar(count, description="Come and learn about things: " * 40,
+                       organizer_name="Someone; Somewhere: Else").as_string()
+  lines = [line for line in Contentlines.from_string(text) if line]
+  print "%d bytes, %d content lines" % (len(text), len(lines))
+
+  for line in lines:
+    assert legacy_parts(line) == line.parts()
+
+  for name, parts in (("legacy", legacy_parts),
+                      ("current", lambda line: line.parts())):
+    best = min(timeit.repeat(lambda: [parts(line) for line in lines],
+                             number=1, repeat=repeats))
+    print "%-8s %8.3f s %8.2f us/line" % (name, best, best / len(lines) * 1e6)
+
+
+if __name__ == "__main__":
+  run()
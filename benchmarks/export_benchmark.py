@@ -0,0 +1,67 @@
+""" Measures how long it takes to turn events into export feed entries, using
+the shared export projection compared with the way each feed used to build its
+entries from scratch.
+
+  python benchmarks/export_benchmark.py [events] [repeats]
+"""
+
+# This sets up our externals, so it has to come first.
+from common import make_events, stubbed_services
+
+import re
+import sys
+import timeit
+
+import main
+import pytz
+
+
+""" The ICS rendering that export_ics did for every event before the projection
+existed. It's kept here as the baseline. """
+def legacy_vevent(event):
+  iev = main.CalendarEvent()
+  iev.add('summary',
+          event.name if event.status == 'approved' else event.name + ' (%s)' % event.status.upper())
+  ev_desc = '__Status: %s\n__Member: %s\n__Type: %s\n__Estimated size: %s\n__Info URL: %s\n__Fee: %s\n__Contact: %s, %s\n__Rooms: %s\n\n__Details: %s\n\n__Notes: %s' % (
+      event.status, event.owner(), event.type, event.estimated_size,
+      event.url, event.fee, event.contact_name, event.contact_phone,
+      event.roomlist(), event.details, event.notes)
+  ev_desc = re.sub(re.compile(r'^__.*?:[ ,]*$\n*', re.M), '', ev_desc)
+  ev_desc = re.sub(re.compile(r'^__', re.M), '', ev_desc)
+  ev_url = "https://events.hackerdojo.com%s" % main.event_path(event)
+  iev.add('description', ev_desc + '\n--\n' + ev_url)
+  iev.add('url', ev_url)
+  iev.add('uid', main.event_uid(event))
+  iev.add('organizer', event.owner())
+  if event.start_time:
+    iev.add('dtstart', event.start_time.replace(tzinfo=pytz.timezone('US/Pacific')))
+  if event.end_time:
+    iev.add('dtend', event.end_time.replace(tzinfo=pytz.timezone('US/Pacific')))
+  return iev.as_string()
+
+
+def projected_vevent(event):
+  record = main._export_record(event)
+  return main._record_to_vevent(record, record['title'])
+
+
+def run():
+  count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+  repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+  with stubbed_services():
+    events = make_events(count, contact_name=u"Someone",
+                         details=u"Line one.\n\nLine two.")
+
+    for event in events:
+      assert legacy_vevent(event) == projected_vevent(event)
+
+    for name, render in (("legacy", legacy_vevent),
+                         ("projected", projected_vevent)):
+      best = min(timeit.repeat(lambda: [render(e) for e in events],
+                               number=1, repeat=repeats))
+      print "%-10s %8.1f us/event" % (name, best / count * 1e6)
+
+
+if __name__ == "__main__":
+  run()
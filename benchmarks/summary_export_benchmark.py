@@ -0,0 +1,69 @@
+""" Measures how many bytes of RPC responses a page of the JSON export has to
+decode, comparing loading whole events with the projection query and cached
+summaries that it uses now.
+
+  python benchmarks/summary_export_benchmark.py [events] [details_bytes]
+"""
+
+# This sets up our externals, so it has to come first.
+from common import make_events, stubbed_services
+
+import sys
+
+from google.appengine.api import apiproxy_stub_map
+
+import models
+
+
+""" Counts the bytes in every datastore and memcache response.
+function: What to call.
+Returns: The total size of the responses to the calls it makes. """
+def response_bytes(function):
+  total = [0]
+
+  # The hooks check how many arguments this takes, so it has to be a plain
+  # function.
+  def count(service, call, request, response):
+    total[0] += response.ByteSize()
+
+  hooks = apiproxy_stub_map.apiproxy.GetPostCallHooks()
+  hooks.Append("response_bytes", count)
+  try:
+    function()
+  finally:
+    hooks.Clear()
+  return total[0]
+
+
+""" The way the JSON export used to work. """
+def full_entities(count):
+  query = models.Event.get_ongoing_and_future_query()
+  return [event.to_dict(summarize=True) for event in query.fetch(count)]
+
+
+""" The way it works now. """
+def summaries(count):
+  query = models.Event.get_ongoing_and_future_query(summary=True)
+  return models.Event.get_summaries([event.key() for event in query.fetch(count)])
+
+
+def run():
+  count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+  details_bytes = int(sys.argv[2]) if len(sys.argv) > 2 else 4000
+
+  with stubbed_services():
+    make_events(count, details=u"x" * details_bytes,
+                notes=u"y" * (details_bytes / 4))
+    assert full_entities(count) == summaries(count)
+    models.memcache.flush_all()
+
+    results = [("full entities", response_bytes(lambda: full_entities(count))),
+               ("summaries, cold", response_bytes(lambda: summaries(count))),
+               ("summaries, warm", response_bytes(lambda: summaries(count)))]
+    for name, total in results:
+      print "%-16s %10d bytes %8.1f bytes/event" % (name, total,
+                                                    float(total) / count)
+
+
+if __name__ == "__main__":
+  run()
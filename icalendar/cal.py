@@ -17,6 +17,7 @@ import re
 # from this package
 from icalendar.caselessdict import CaselessDict
 from icalendar.parser import Contentlines, Contentline, Parameters
+from icalendar.parser import iter_contentlines, foldline
 from icalendar.parser import q_split, q_join
 from icalendar.prop import TypesFactory, vText
 
@@ -332,13 +333,15 @@ class Component(CaselessDict):
         return properties
 
 
-    def from_string(st, multiple=False):
+    def _iter_components(lines, containers=()):
         """
-        Populates the component recursively from a string
+        Builds components out of content lines, yielding each top-level one as
+        soon as it ends. Components directly inside one named in containers
+        count as top-level too, and the container is yielded last, without
+        them.
         """
         stack = [] # a stack of components
-        comps = []
-        for line in Contentlines.from_string(st): # raw parsing
+        for line in lines: # raw parsing
             if not line:
                 continue
             name, params, vals = line.parts()
@@ -358,8 +361,8 @@ class Component(CaselessDict):
                 # we are done adding properties to this component
                 # so pop it from the stack and add it to the new top.
                 component = stack.pop()
-                if not stack: # we are at the end
-                    comps.append(component)
+                if not stack or stack[-1].name.upper() in containers:
+                    yield component
                 else:
                     stack[-1].add_component(component)
             # we are adding properties to the current top of the stack
@@ -368,6 +371,14 @@ class Component(CaselessDict):
                 vals = factory(factory.from_ical(vals))
                 vals.params = params
                 stack[-1].add(name, vals, encode=0)
+    _iter_components = staticmethod(_iter_components)
+
+
+    def from_string(st, multiple=False):
+        """
+        Populates the component recursively from a string
+        """
+        comps = list(Component._iter_components(Contentlines.from_string(st)))
         if multiple:
             return comps
         if not len(comps) == 1:
@@ -377,6 +388,35 @@ class Component(CaselessDict):
     from_string = staticmethod(from_string)
 
 
+    def iter_from_file(fileobj, containers=('VCALENDAR',)):
+        """
+        Reads components from a file-like object as it goes, so that big
+        calendars can be imported without holding all of them in memory.
+        Components are yielded one at a time as soon as they end. The ones in
+        a VCALENDAR (or whatever else is named in containers) come out on
+        their own, and the calendar comes last with just its own properties.
+
+        >>> from StringIO import StringIO
+        >>> cal = Calendar()
+        >>> cal.add('prodid', '-//My calendar product//mxm.dk//')
+        >>> for summary in ('First event', 'Second event'):
+        ...     event = Event()
+        ...     event.add('summary', summary)
+        ...     cal.add_component(event)
+        >>> [(c.name, c.get('summary', c.get('prodid')))
+        ...  for c in Component.iter_from_file(StringIO(cal.as_string()))]
+        [('VEVENT', vText(u'First event')), ('VEVENT', vText(u'Second event')), ('VCALENDAR', vText(u'-//My calendar product//mxm.dk//'))]
+
+        Without any containers, it's the same as from_string(multiple=True)
+        >>> comps = Component.iter_from_file(StringIO(cal.as_string()), ())
+        >>> [c.as_string() for c in comps] == [cal.as_string()]
+        True
+        """
+        return Component._iter_components(iter_contentlines(fileobj),
+                                          containers)
+    iter_from_file = staticmethod(iter_from_file)
+
+
     def __repr__(self):
         return '%s(' % self.name + dict.__repr__(self) + ')'
 
@@ -396,8 +436,55 @@ class Component(CaselessDict):
         return contentlines
 
 
+    def _write(self, out):
+        """
+        Adds the folded content lines for the component and its
+        subcomponents to out, each one followed by CRLF. The lines are the
+        same as the ones from content_lines(), but they're written straight
+        out instead of going through property_items() and Contentline.
+        """
+        name = vText(self.name).ical()
+        out.append(foldline('BEGIN:' + name))
+        out.append('\r\n')
+        items = dict.items(self)
+        items.sort()
+        for key, values in items:
+            key = str(key)
+            if type(values) != ListType:
+                values = (values,)
+            for value in values:
+                params = getattr(value, 'params', None)
+                if params:
+                    line = '%s;%s:%s' % (key, str(params), str(value))
+                else:
+                    line = '%s:%s' % (key, str(value))
+                out.append(foldline(line))
+                out.append('\r\n')
+        for subcomponent in self.subcomponents:
+            subcomponent._write(out)
+        out.append(foldline('END:' + name))
+        out.append('\r\n')
+
+
     def as_string(self):
-        return str(self.content_lines())
+        """
+        Renders the component, exactly like str(self.content_lines()) does.
+
+        >>> from icalendar.prop import vCalAddress
+        >>> cal = Calendar()
+        >>> cal.add('prodid', '-//My calendar product//mxm.dk//')
+        >>> event = Event()
+        >>> event.add('summary', u'Caf\xe9 ' * 30)
+        >>> event.add('attendee', 'MAILTO:a@example.com')
+        >>> event.add('attendee', 'MAILTO:b@example.com')
+        >>> event['attendee'][0].params['cn'] = 'Rasmussen, Max'
+        >>> cal.add_component(event)
+        >>> cal.as_string() == str(cal.content_lines())
+        True
+        """
+        out = []
+        self._write(out)
+        return ''.join(out)
 
 
     def __str__(self):
@@ -1,5 +1,46 @@
 # -*- coding: latin-1 -*-
 
+# The names that RFC 2445 defines for components, properties, parameters,
+# value types and recurrence rule parts. These are nearly all the keys that
+# ever go into a CaselessDict.
+KNOWN_KEYS = """
+    BEGIN END
+    VCALENDAR VEVENT VTODO VJOURNAL VFREEBUSY VTIMEZONE VALARM STANDARD DAYLIGHT
+    CALSCALE METHOD PRODID VERSION ATTACH CATEGORIES CLASS COMMENT DESCRIPTION
+    GEO LOCATION PERCENT-COMPLETE PRIORITY RESOURCES STATUS SUMMARY COMPLETED
+    DTEND DUE DTSTART DURATION FREEBUSY TRANSP TZID TZNAME TZOFFSETFROM
+    TZOFFSETTO TZURL ATTENDEE CONTACT ORGANIZER RECURRENCE-ID RELATED-TO URL UID
+    EXDATE EXRULE RDATE RRULE ACTION REPEAT TRIGGER CREATED DTSTAMP
+    LAST-MODIFIED SEQUENCE REQUEST-STATUS
+    ALTREP CN CUTYPE DELEGATED-FROM DELEGATED-TO DIR ENCODING FMTTYPE FBTYPE
+    LANGUAGE MEMBER PARTSTAT RANGE RELATED RELTYPE ROLE RSVP SENT-BY VALUE
+    BINARY BOOLEAN CAL-ADDRESS DATE DATE-TIME FLOAT INTEGER PERIOD RECUR TEXT
+    TIME URI UTC-OFFSET INLINE
+    FREQ UNTIL COUNT INTERVAL BYSECOND BYMINUTE BYHOUR BYDAY BYMONTHDAY
+    BYYEARDAY BYWEEKNO BYMONTH BYSETPOS WKST
+    """.split()
+
+# Maps the ways those names are usually written to the interned upper case
+# name, so that looking one up doesn't have to make a new string every time.
+# Anything else just gets upper()'ed. We don't add those to the cache, since
+# they come from whatever files we parse.
+UPPER_KEYS = {}
+for _name in KNOWN_KEYS:
+    _name = intern(_name)
+    for _spelling in (_name, _name.lower(), _name.capitalize()):
+        UPPER_KEYS[_spelling] = _name
+del _name, _spelling
+
+
+def upper_key(key):
+    """Returns the upper case version of a key, using UPPER_KEYS if we can. The
+    table only has byte strings in it, and a unicode key that looks the same
+    would find them too, so those always get upper()'ed to stay unicode."""
+    if type(key) is str:
+        return UPPER_KEYS.get(key) or key.upper()
+    return key.upper()
+
+
 class CaselessDict(dict):
     """
     A dictionary that isn't case sensitive, and only use string as keys.
@@ -38,43 +79,50 @@ class CaselessDict(dict):
     >>> keys.sort()
     >>> keys
     ['KEY1', 'KEY2', 'KEY3', 'KEY5', 'KEY6']
+
+    The RFC 2445 names are upper cased from a cache, so every dict shares the
+    same key strings. Unicode keys stay unicode.
+    >>> CaselessDict(dtstart=1).keys()[0] is CaselessDict(DTSTART=1).keys()[0]
+    True
+    >>> CaselessDict({u'Summary': 1})
+    CaselessDict({u'SUMMARY': 1})
     """
 
     def __init__(self, *args, **kwargs):
         "Set keys to upper for initial dict"
         dict.__init__(self, *args, **kwargs)
         for k,v in self.items():
-            k_upper = k.upper()
+            k_upper = upper_key(k)
             if k != k_upper:
                 dict.__delitem__(self, k)
                 self[k_upper] = v
 
     def __getitem__(self, key):
-        return dict.__getitem__(self, key.upper())
+        return dict.__getitem__(self, upper_key(key))
 
     def __setitem__(self, key, value):
-        dict.__setitem__(self, key.upper(), value)
+        dict.__setitem__(self, upper_key(key), value)
 
     def __delitem__(self, key):
-        dict.__delitem__(self, key.upper())
+        dict.__delitem__(self, upper_key(key))
 
     def __contains__(self, item):
-        return dict.__contains__(self, item.upper())
+        return dict.__contains__(self, upper_key(item))
 
     def get(self, key, default=None):
-        return dict.get(self, key.upper(), default)
+        return dict.get(self, upper_key(key), default)
 
     def setdefault(self, key, value=None):
-        return dict.setdefault(self, key.upper(), value)
+        return dict.setdefault(self, upper_key(key), value)
 
     def pop(self, key, default=None):
-        return dict.pop(self, key.upper(), default)
+        return dict.pop(self, upper_key(key), default)
 
     def popitem(self):
         return dict.popitem(self)
 
     def has_key(self, key):
-        return dict.has_key(self, key.upper())
+        return dict.has_key(self, upper_key(key))
 
     def update(self, indict):
         """
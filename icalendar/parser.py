@@ -17,7 +17,7 @@ from types import TupleType, ListType
 SequenceTypes = [TupleType, ListType]
 import re
 # from this package
-from icalendar.caselessdict import CaselessDict
+from icalendar.caselessdict import CaselessDict, upper_key
 
 
 #################################################################
@@ -34,6 +34,13 @@ NAME = re.compile('[\w-]+')
 UNSAFE_CHAR = re.compile('[\x00-\x08\x0a-\x1f\x7F",:;]')
 QUNSAFE_CHAR = re.compile('[\x00-\x08\x0a-\x1f\x7F"]')
 FOLD = re.compile('([\r]?\n)+[ \t]{1}')
+# The first character of a content line that can't be part of its name.
+NAME_END = re.compile('[:;"]')
+# One part of a folded content line. That's up to 74 characters, but if
+# that would split a UTF-8 character, we back up to the byte that starts it:
+# http://lists.osafoundation.org/pipermail/ietf-calsify/2006-August/001126.html
+# A line that isn't UTF-8 at all just gets folded anywhere.
+FOLD_PIECE = re.compile('.{1,74}(?![\x80-\xbf])|.{1,74}', re.S)
 
 def validate_token(name):
     match = NAME.findall(name)
@@ -199,7 +206,7 @@ class Parameters(CaselessDict):
         items.sort() # To make doctests work
         for key, value in items:
             value = paramVal(value)
-            result.append('%s=%s' % (key.upper(), value))
+            result.append('%s=%s' % (upper_key(key), value))
         return ';'.join(result)
 
 
@@ -347,6 +354,18 @@ class Contentline(str):
         ...
     ValueError: Content line could not be parsed into parts
 
+    Separators inside quoted parameter values don't count:
+    >>> c = Contentline('ATTENDEE;CN="Rasmussen; Max: Jr.";ROLE=CHAIR:MAILTO:maxm@example.com')
+    >>> c.parts()
+    ('ATTENDEE', Parameters({'ROLE': 'CHAIR', 'CN': 'Rasmussen; Max: Jr.'}), 'MAILTO:maxm@example.com')
+
+    But they have to be closed:
+    >>> c = Contentline('ATTENDEE;CN="Rasmussen:MAILTO:maxm@example.com')
+    >>> c.parts()
+    Traceback (most recent call last):
+        ...
+    ValueError: Content line could not be parsed into parts
+
     >>> c = Contentline('key;param=pvalue:value', strict=False)
     >>> c.parts()
     ('key', Parameters({'PARAM': 'pvalue'}), 'value')
@@ -387,31 +406,44 @@ class Contentline(str):
     def parts(self):
         """ Splits the content line up into (name, parameters, values) parts
         """
+        # The name ends at the first ';' or ':'. Names can't have quotes in
+        # them, so we don't have to look out for those yet.
+        match = NAME_END.search(self)
+        if match is None or match.group() == '"':
+            raise ValueError, 'Content line could not be parsed into parts'
+        name_split = match.start()
+        name = self[:name_split]
         try:
-            name_split = None
-            value_split = None
-            inquotes = 0
-            for i in range(len(self)):
-                ch = self[i]
-                if not inquotes:
-                    if ch in ':;' and not name_split:
-                        name_split = i
-                    if ch == ':' and not value_split:
-                        value_split = i
-                if ch == '"':
-                    inquotes = not inquotes
-            name = self[:name_split]
-            if not name:
-                raise ValueError, 'Key name is required'
             validate_token(name)
-            if name_split+1 == value_split:
-                raise ValueError, 'Invalid content line'
+        except ValueError:
+            raise ValueError, 'Content line could not be parsed into parts'
+
+        if match.group() == ':':
+            return (name, Parameters(), self[name_split+1:])
+
+        # The values start at the first ':' that isn't in a quoted parameter
+        # value, so skip over whole quoted strings at a time.
+        start = name_split + 1
+        while True:
+            value_split = self.find(':', start)
+            if value_split == -1:
+                raise ValueError, 'Content line could not be parsed into parts'
+            quote = self.find('"', start, value_split)
+            if quote == -1:
+                break
+            start = self.find('"', quote + 1) + 1
+            if not start:
+                raise ValueError, 'Content line could not be parsed into parts'
+
+        if name_split+1 == value_split:
+            raise ValueError, 'Content line could not be parsed into parts'
+        try:
             params = Parameters.from_string(self[name_split+1:value_split],
                                             strict=self.strict)
-            values = self[value_split+1:]
-            return (name, params, values)
-        except:
+        except ValueError:
             raise ValueError, 'Content line could not be parsed into parts'
+        values = self[value_split+1:]
+        return (name, params, values)
 
     def from_string(st, strict=False):
         "Unfolds the content lines in an iCalendar into long content lines"
@@ -424,40 +456,37 @@ class Contentline(str):
 
     def __str__(self):
         "Long content lines are folded so they are less than 75 characters wide"
-        l_line = len(self)
-        new_lines = []
-        start = 0
-        end = 74
-        while True:
-            if end >= l_line:
-                end = l_line
-            else:
-                # Check that we don't fold in the middle of a UTF-8 character:
-                # http://lists.osafoundation.org/pipermail/ietf-calsify/2006-August/001126.html
-                while True:
-                    char_value = ord(self[end])
-                    if char_value < 128 or char_value >= 192:
-                        # This is not in the middle of a UTF-8 character, so we
-                        # can fold here:
-                        break
-                    else:
-                        end -= 1
+        return foldline(str.__str__(self))
 
-            new_lines.append(self[start:end])
-            if end == l_line:
-                # Done
-                break
-            start = end
-            end = start + 74
-        return '\r\n '.join(new_lines)
+
+
+def foldline(line):
+    """
+    Folds a content line so that no part of it is more than 74 characters
+    wide. This is what str() does to a Contentline.
+
+    Short lines come back as they are
+    >>> foldline('DTSTART:20050101T120000')
+    'DTSTART:20050101T120000'
+
+    ASCII lines get cut every 74 characters
+    >>> foldline('x' * 148)
+    'xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx\\r\\n xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx'
+
+    But a fold never splits a UTF-8 character, so that part is shorter
+    >>> foldline('x' * 73 + '\\xc3\\xab' + 'x' * 10).split('\\r\\n ')
+    ['xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx', '\\xc3\\xabxxxxxxxxxx']
+    """
+    if len(line) <= 74:
+        return line
+    return '\r\n '.join(FOLD_PIECE.findall(line))
 
 
 
 class Contentlines(list):
     """
     I assume that iCalendar files generally are a few kilobytes in size. Then
-    this should be efficient. for Huge files, an iterator should probably be
-    used instead.
+    this should be efficient. For huge files, use iter_contentlines() instead.
 
     >>> c = Contentlines([Contentline('BEGIN:VEVENT\\r\\n')])
     >>> str(c)
@@ -495,6 +524,54 @@ class Contentlines(list):
     from_string = staticmethod(from_string)
 
 
+def iter_contentlines(fileobj, strict=False):
+    """
+    Reads content lines from a file-like object one at a time, unfolding them
+    as it goes, so that the whole file never has to be in memory. The lines
+    are exactly the same as the ones from Contentlines.from_string(), without
+    the empty string at the end.
+
+    >>> from StringIO import StringIO
+    >>> list(iter_contentlines(StringIO('A short line\\r\\n')))
+    ['A short line']
+    >>> list(iter_contentlines(StringIO('A faked\\r\\n  long line\\r\\nAnd another lin\\r\\n\\te that is folded\\r\\n')))
+    ['A faked long line', 'And another line that is folded']
+
+    Blank lines are skipped, even in the middle of a folded line
+    >>> list(iter_contentlines(StringIO('First\\n\\nSecond\\r\\n\\r\\n  line')))
+    ['First', 'Second line']
+    """
+    # The line we're unfolding, which can't be finished until we see whether
+    # the next one continues it.
+    current = ''
+    # Only lines after a newline can be folded.
+    after_newline = False
+    for physical in fileobj:
+        if physical.endswith('\n'):
+            physical = physical[:-1]
+            if physical.endswith('\r'):
+                physical = physical[:-1]
+        if not physical:
+            after_newline = True
+            continue
+        # A lone carriage return ends a line too, but it can't start a fold.
+        pieces = physical.split('\r')
+        first = pieces[0]
+        if after_newline and first[:1] in (' ', '\t'):
+            current += first[1:]
+        else:
+            if current:
+                yield Contentline(current, strict=strict)
+            current = first
+        for piece in pieces[1:]:
+            if current:
+                yield Contentline(current, strict=strict)
+            current = piece
+        after_newline = True
+    if current:
+        yield Contentline(current, strict=strict)
+
+
 # ran this:
 #    sample = open('./samples/test.ics', 'rb').read() # binary file in windows!
 #    lines = Contentlines.from_string(sample)
@@ -0,0 +1,73 @@
+# -*- coding: latin-1 -*-
+
+import random
+import unittest
+
+from icalendar.parser import Contentline, foldline
+
+
+def reference_foldline(line):
+    "The way lines used to be folded, one character at a time."
+    l_line = len(line)
+    new_lines = []
+    start = 0
+    end = 74
+    while True:
+        if end >= l_line:
+            end = l_line
+        else:
+            while True:
+                char_value = ord(line[end])
+                if char_value < 128 or char_value >= 192:
+                    break
+                else:
+                    end -= 1
+        new_lines.append(line[start:end])
+        if end == l_line:
+            break
+        start = end
+        end = start + 74
+    return '\r\n '.join(new_lines)
+
+
+class TestFoldline(unittest.TestCase):
+
+    def assertSameFolding(self, line):
+        self.assertEqual(reference_foldline(line), foldline(line))
+        self.assertEqual(reference_foldline(line), str(Contentline(line)))
+
+    def test_ascii(self):
+        for length in range(0, 300):
+            self.assertSameFolding('DESCRIPTION:' + 'x' * length)
+        self.assertSameFolding('x' * 74)
+        self.assertSameFolding('x' * 148)
+
+    def test_multibyte(self):
+        # Two, three and four byte characters, so that every length of
+        # character ends up across a fold somewhere.
+        for char in (u'\xeb', u'\u2603', u'\U0001f600'):
+            encoded = char.encode('utf-8')
+            for prefix in range(0, 80):
+                self.assertSameFolding('x' * prefix + encoded * 40)
+            self.assertSameFolding(encoded * 200)
+
+    def test_long_descriptions(self):
+        # Event details can be pages long.
+        random.seed(0)
+        words = [u'hacker', u'dojo', u'caf\xe9', u'\u2603', u'na\xefve',
+                 u'\u65e5\u672c\u8a9e', u'\U0001f600', u'x' * 90]
+        for _ in range(50):
+            text = u' '.join([random.choice(words)
+                              for _ in range(random.randint(1, 2000))])
+            self.assertSameFolding('DESCRIPTION:' + text.encode('utf-8'))
+            self.assertSameFolding(
+                'DESCRIPTION:' + text.encode('ascii', 'replace'))
+
+    def test_short_lines_untouched(self):
+        line = 'SUMMARY:Short'
+        self.assertTrue(foldline(line) is line)
+        self.assertEqual(str, type(str(Contentline(line))))
+
+
+if __name__ == '__main__':
+    unittest.main()
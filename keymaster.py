@@ -26,6 +26,13 @@ class Keymaster(db.Model):
             k = cls(key_name=str(key_name), secret=str(secret))
         return k.put()
     
+    @classmethod
+    def encrypt_once(cls, key_name, secret):
+        """Like encrypt(), but if there's already a secret, it's kept. Everyone
+        who does this at the same time ends up with the same secret."""
+        secret  = ARC4.new(os.environ['APPLICATION_ID']).encrypt(secret)
+        return cls.get_or_insert(str(key_name), secret=str(secret)).key()
+
     @classmethod
     def decrypt(cls, key_name):
         k = cls.get_by_key_name(str(key_name))
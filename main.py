@@ -1,7 +1,15 @@
+import base64
+import bisect
 import cPickle as pickle
 import cgi
+import csv
+import hashlib
+import hmac
+import itertools
 import json
 import logging
+import os
+import StringIO
 import urllib
 from datetime import datetime, timedelta
 
@@ -14,11 +22,15 @@ from google.appengine.ext.webapp import util, template
 from webapp2_extras import jinja2
 
 import keymaster
-from icalendar import Calendar, Event as CalendarEvent
-from models import Event, Feedback, HDLog, ROOM_OPTIONS, PENDING_LIFETIME
+from icalendar import Event as CalendarEvent
+from models import Event, ExportSnapshot, Feedback, HDLog, ROOM_OPTIONS, \
+    PENDING_LIFETIME, calendar_generation
+from occupancy import free_windows
+from recurrence import Recurrence
 from notices import *
 from utils import human_username, set_cookie, local_today, local_now, is_phone_valid, UserRights, dojo, \
-    generate_wifi_password
+    generate_wifi_password, LRUCache, COMPRESSED_ENCODINGS, precompress, \
+    encode_precompressed, constant_time_equal
 
 template.register_template_library("templatefilters.templatefilters")
 
@@ -39,33 +51,94 @@ def event_path(event):
     return '/event/%s-%s' % (event.key().id(), slugify(event.name))
 
 
-""" Checks if a user needs to enter contact info for another member.
+""" The result of a check that might still be waiting on RPCs. This lets us start
+all the slow parts of validating an event up front, and then collect the results
+in whatever order we want errors reported in.
+finish: A function that waits for any RPCs the check made, and then returns the
+result of the check, or raises a ValueError if it failed. """
+
+
+class _AsyncCheck(object):
+    def __init__(self, finish):
+        self._finish = finish
+        self._result = None
+        self._error = None
+        self._done = False
+
+    """ Waits for the check to finish.
+    Raises the ValueError from the check if it failed.
+    Returns: The result of the check. """
+
+    def get_result(self):
+        if not self._done:
+            try:
+                self._result = self._finish()
+            except ValueError, e:
+                self._error = e
+            self._done = True
+
+        if self._error:
+            raise self._error
+        return self._result
+
+
+""" Reads the start and end times of an event from the request.
+handler: The handler to read request parameters from.
+Raises a ValueError if they are not valid times.
+Returns: A tuple of the start and end time. """
+
+
+def _get_event_times(handler):
+    start_time = datetime.strptime('%s %s:%s %s' % (
+        handler.request.get('start_date'),
+        handler.request.get('start_time_hour'),
+        handler.request.get('start_time_minute'),
+        handler.request.get('start_time_ampm')), '%m/%d/%Y %I:%M %p')
+    end_time = datetime.strptime('%s %s:%s %s' % (
+        handler.request.get('end_date'),
+        handler.request.get('end_time_hour'),
+        handler.request.get('end_time_minute'),
+        handler.request.get('end_time_ampm')), '%m/%d/%Y %I:%M %p')
+    return start_time, end_time
+
+
+""" Checks if a user needs to enter contact info for another member. This starts
+the check with the signup app, but doesn't wait for it.
 handler: The handler to read request parameters from.
 start_time: Start time of the event. (datetime)
 end_time: End time of the event. (datetime)
-Returns: Either the member email that they entered, or an empty string if they
-don't need to enter one. """
+Returns: An _AsyncCheck whose result is either the member email that they
+entered, or an empty string if they don't need to enter one. """
 
 
-def _get_other_member(handler, start_time, end_time):
+def _get_other_member_async(handler, start_time, end_time):
     if end_time - start_time < timedelta(hours=24):
         # No need to do this.
-        return ""
+        return _AsyncCheck(lambda: "")
 
     # If the event lasts for 24 hours or more, they must specify a
     # second person to be in charge of it.
     member = handler.request.get('other_member')
     if not member:
-        raise ValueError('Need to specify second responsible member' \
-                         ' for multi-day event.')
+        def missing_member():
+            raise ValueError('Need to specify second responsible member' \
+                             ' for multi-day event.')
+
+        return _AsyncCheck(missing_member)
 
     conf = Config()
-    if not conf.is_testing:
-        # Make sure this person is a member.
-        base_url = conf.SIGNUP_URL + '/api/v1/user'
-        query = urllib.urlencode({'email': member, 'properties[]': ''})
-        result = urlfetch.fetch("%s?%s" % (base_url, query),
-                                follow_redirects=False)
+    if conf.is_testing:
+        return _AsyncCheck(lambda: member)
+
+    # Make sure this person is a member.
+    base_url = conf.SIGNUP_URL + '/api/v1/user'
+    query = urllib.urlencode({'email': member, 'properties[]': ''})
+    rpc = urlfetch.create_rpc()
+    urlfetch.make_fetch_call(rpc, "%s?%s" % (base_url, query),
+                             follow_redirects=False)
+
+    def check_member():
+        result = rpc.get_result()
         logging.debug("Got response: %s" % (result.content))
 
         if result.status_code != 200:
@@ -76,21 +149,65 @@ def _get_other_member(handler, start_time, end_time):
             raise ValueError('Backend API call failed. Please try again' \
                              ' later.')
 
-    return member
+        return member
+
+    return _AsyncCheck(check_member)
+
+
+""" Same as _get_other_member_async, but waits for the result. """
+
+
+def _get_other_member(handler, start_time, end_time):
+    return _get_other_member_async(handler, start_time, end_time).get_result()
+
+
+""" Checks whether adding some events would put too many of a user's events
+within a four-week period.
+existing: A list of the start times of the events that the user already has.
+proposed: A list of the start times of the events that we want to add.
+limit: The most events that are allowed in any four-week period.
+Returns: True if some four-week period near one of the proposed events would
+end up with more than limit events in it. """
+
+
+def _violates_four_week_limit(existing, proposed, limit):
+    four_weeks = timedelta(days=28)
+    proposed = sorted(proposed)
+    starts = sorted(existing + proposed)
+
+    # Slide a window of limit + 1 consecutive events along the timeline. If it
+    # ever spans four weeks or less, that's too many events.
+    for last in range(limit, len(starts)):
+        first = last - limit
+        if starts[last] - starts[first] > four_weeks:
+            continue
+
+        # We only care about this group if it is within four weeks of one of
+        # the events we are adding, because otherwise the new events didn't
+        # cause the problem.
+        nearest = bisect.bisect_left(proposed, starts[last] - four_weeks)
+        if nearest < len(proposed) and \
+                proposed[nearest] <= starts[first] + four_weeks:
+            return True
+
+    return False
 
 
 """ Checks that this particular user is clear to create an event. Mainly, this
-means that they don't have too many future events already scheduled.
+means that they don't have too many future events already scheduled. This
+starts the datastore query, but doesn't wait for it.
 event_times: A list of tuples, with each tuple containing the start and end
 times for a particular event. These are the events that we are checking if we
 can create.
 ignore_admin: Forces it to always perform the check as if the user were a
 regular user. Defaults to False.
 editing: The event that we are editing, if we are editing one. Defaults to
-None. """
+None.
+Returns: An _AsyncCheck that raises a ValueError if the user can't create the
+events. """
 
 
-def _check_user_can_create(event_times, ignore_admin=False, editing=None):
+def _check_user_can_create_async(event_times, ignore_admin=False, editing=None):
     logging.debug("User wants to add %d events." % (len(event_times)))
 
     # If they are an admin, they can do whatever they want.
@@ -98,13 +215,36 @@ def _check_user_can_create(event_times, ignore_admin=False, editing=None):
     user_status = UserRights()
     if (not ignore_admin and user_status.is_admin):
         logging.info("User %s is admin, not performing checks." % (user.email()))
-        return
+        return _AsyncCheck(lambda: None)
+
+    now = datetime.now()
+    four_weeks = timedelta(days=28)
+    proposed = [start_time for start_time, _ in event_times]
 
+    # Get everything we need for both checks in one go: all their future events,
+    # and anything recent enough to share a four-week period with a proposed
+    # event.
+    earliest_start = min(now, min(proposed) - four_weeks)
     events_query = db.GqlQuery("SELECT * FROM Event WHERE member = :1 AND" \
-                               " start_time > :2 AND status IN :3", user,
-                               datetime.now(), ["approved", "pending", "on_hold"])
+                               " start_time >= :2 AND status IN :3" \
+                               " ORDER BY start_time", user, earliest_start,
+                               ["approved", "pending", "on_hold"])
+    # This starts fetching the first batch in the background.
+    user_events = events_query.run(batch_size=100)
 
-    num_events = events_query.count()
+    return _AsyncCheck(lambda: _check_user_events(list(user_events),
+                                                  event_times, now, editing))
+
+
+""" Does the actual checking for _check_user_can_create_async, once we have the
+user's events. """
+
+
+def _check_user_events(user_events, event_times, now, editing):
+    four_weeks = timedelta(days=28)
+    proposed = [start_time for start_time, _ in event_times]
+
+    num_events = len([e for e in user_events if e.start_time > now])
     logging.debug("User has %d events." % (num_events))
     num_events += len(event_times)
     # If we're editing events, subtract one so that we don't count the same event
@@ -119,97 +259,29 @@ def _check_user_can_create(event_times, ignore_admin=False, editing=None):
 
     # We have a limit on how many events we can have within a four-week period
     # too.
-    for start_time, end_time in event_times:
-        # Find the subset of events that this event could possibly cause to be in
-        # violation of this rule.
-        earliest_start = start_time - timedelta(days=28)
-        latest_start = start_time + timedelta(days=28)
-        possible_violators = db.GqlQuery("SELECT * FROM Event WHERE member = :1 AND" \
-                                         " start_time >= :2 AND" \
-                                         " start_time <= :3 AND status IN :4" \
-                                         " ORDER BY start_time",
-                                         user, earliest_start, latest_start,
-                                         ["approved", "pending", "on_hold"])
-
-        # Find the subset of events we want to add that could be in violation of
-        # this rule.
-        possible_pending_violators = []
-        for event in event_times:
-            if (event[0] >= earliest_start and event[0] <= latest_start):
-                possible_pending_violators.append(event[0])
-
-        logging.debug("Have %d possible violators." % (possible_violators.count()))
-        logging.debug("Have %d possible pending violators." % \
-                      (len(possible_pending_violators)))
-
-        if (possible_violators.count() + len(possible_pending_violators)) <= \
-                conf.USER_MAX_FOUR_WEEKS:
-            # There's no way we could be violating this rule.
-            return
+    latest_start = max(proposed) + four_weeks
+    existing = []
+    for event in user_events:
+        # If we are editing an event, ignore it, so that it doesn't get
+        # double-counted.
+        if (editing and event.key().id() == editing.key().id()):
+            continue
+        if event.start_time <= latest_start:
+            existing.append(event.start_time)
 
-        # Group the possible violators into those before and after the event.
-        before_event = []
-        after_event = []
-        for event in possible_violators:
-            # If we are editing an event, ignore it, so that it doesn't get
-            # double-counted.
-            if (editing and event.key().id() == editing.key().id()):
-                continue
+    logging.debug("Have %d possible violators." % (len(existing)))
+
+    if _violates_four_week_limit(existing, proposed, conf.USER_MAX_FOUR_WEEKS):
+        raise ValueError("You may only have %d events within a 4-week period." % \
+                         (conf.USER_MAX_FOUR_WEEKS))
 
-            # Split it into groups of events that happen before and after our proposed
-            # event.
-            if event.start_time < start_time:
-                before_event.append(event.start_time)
-            else:
-                after_event.append(event.start_time)
-
-        # Do the same with the pending events we want to add.
-        for pending_start in possible_pending_violators:
-            if pending_start < start_time:
-                before_event.append(pending_start)
-            # It's actually possible to get an event that is at the same time, if we
-            # were editing and didn't change the start time. If that happens, we don't
-            # want to randomly add it to the after_event list.
-            elif pending_start > start_time:
-                after_event.append(pending_start)
-
-        # If we have extraneous events, it means that the rule was already violated,
-        # or that it will be violated just by adding recurring events.
-        if (len(before_event) > conf.USER_MAX_FOUR_WEEKS or \
-                len(after_event) > conf.USER_MAX_FOUR_WEEKS):
-            raise ValueError("You may only have %d events within a 4-week period." % \
-                             (conf.USER_MAX_FOUR_WEEKS))
-
-        # Recombine the lists.
-        possible_violators = before_event
-        # Sandwhich in the time of the event we want to create.
-        possible_violators.append(start_time)
-        possible_violators.extend(after_event)
-
-        possible_violators.sort()
-
-        # Now look through every possible combination of USER_MAX_FOUR_WEEKS + 1
-        # consecutive events and see if it violates our rule. (The + 1 is so that
-        # every group we come up with will contain the event we are trying to add.)
-        event_group = []
-        for event_time in possible_violators:
-            if len(event_group) < (conf.USER_MAX_FOUR_WEEKS + 1):
-                # We don't have enough events yet to do anything.
-                event_group.append(event_time)
-            if len(event_group) < (conf.USER_MAX_FOUR_WEEKS + 1):
-                continue
 
-            # Check that our current event group is valid.
-            if event_group[len(event_group) - 1] - event_group[0] <= \
-                    timedelta(days=28):
-                # Now if we were to create that event, we would have one too many events
-                # in a four week period, meaning that this event violates the rule.
-                raise ValueError("You may only have %d events within a 4-week period." % \
-                                 (conf.USER_MAX_FOUR_WEEKS))
+""" Same as _check_user_can_create_async, but waits for the result. """
 
-            # On to the next group...
-            event_group.pop(0)
-            event_group.append(event_time)
+
+def _check_user_can_create(event_times, ignore_admin=False, editing=None):
+    _check_user_can_create_async(event_times, ignore_admin=ignore_admin,
+                                 editing=editing).get_result()
 
 
 """ Makes sure that a proposed event is valid.
@@ -226,35 +298,7 @@ quick description of the event repetition. """
 
 
 def _validate_event(handler, editing_event_id=0, ignore_admin=False, recurring=False):
-    """ Find the next weekday after a given date.
-    date: The date to look for a weekday after.
-    weekday: The day of the week to look for. (The name of the day, e.g.
-    'monday'.) """
-
-    def find_next_weekday(date, weekday):
-        # Convert the string weekday to a number.
-        day_conversion = {"monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3,
-                          "friday": 4, "saturday": 5, "sunday": 6}
-        weekday = weekday.lower()
-        weekday = day_conversion[weekday]
-
-        # Calculate the next weekday.
-        days_ahead = weekday - date.weekday()
-        if days_ahead <= 0:
-            # Target day already happened this week.
-            days_ahead += 7
-        return date + timedelta(days_ahead)
-
-    start_time = datetime.strptime('%s %s:%s %s' % (
-        handler.request.get('start_date'),
-        handler.request.get('start_time_hour'),
-        handler.request.get('start_time_minute'),
-        handler.request.get('start_time_ampm')), '%m/%d/%Y %I:%M %p')
-    end_time = datetime.strptime('%s %s:%s %s' % (
-        handler.request.get('end_date'),
-        handler.request.get('end_time_hour'),
-        handler.request.get('end_time_minute'),
-        handler.request.get('end_time_ampm')), '%m/%d/%Y %I:%M %p')
+    start_time, end_time = _get_event_times(handler)
     logger.debug(start_time)
     logger.debug(end_time)
     user = users.get_current_user()
@@ -281,16 +325,6 @@ def _validate_event(handler, editing_event_id=0, ignore_admin=False, recurring=F
     if not handler.request.get_all('rooms'):
         raise ValueError('You must select a room to reserve.')
 
-    # Get the number of times it repeats.
-    if recurring:
-        recurrence_data = handler.request.get("recurring-data")
-        recurrence_data = json.loads(recurrence_data)
-
-        repetitions = recurrence_data["repetitions"]
-    else:
-        repetitions = 1
-
-    event_times = [(start_time, end_time)]
     event_length = end_time - start_time
     logging.debug("Length of event: %s" % (event_length))
 
@@ -298,187 +332,199 @@ def _validate_event(handler, editing_event_id=0, ignore_admin=False, recurring=F
     if editing_event_id:
         editing_event = Event.get_by_id(editing_event_id)
 
-    for i in range(0, repetitions):
-        logging.debug("Next event starting at: %s" % (start_time))
-
-        _check_one_event_per_day(start_time, editing=editing_event,
-                                 ignore_admin=ignore_admin)
-
-        # Figure out the start and end time of the next event.
-        if recurring:
-            # After we validate the last event, we're done.
-            if i == (repetitions - 1):
-                break
-
-            frequency = recurrence_data["frequency"]
-            recurring_description = "%d repetitions %s." % (repetitions, frequency)
-            if frequency == "monthly":
-                day_number = recurrence_data["dayNumber"]
-                day_name = recurrence_data["monthDay"]
-
-                # Now we can figure out when the next one is. Start by extracting only
-                # the number.
-                day_number = int(day_number[0])
-                # Get a date for the start of the correct week.
-                # Annoyingly, timedelta doesn't support months so we have to add a month
-                # the hard way.
-                months = start_time.month + 1
-                years = start_time.year
-                if months > 12:
-                    months = months % 12
-                    years += 1
-
-                next_month = start_time.replace(year=years, month=months,
-                                                day=max((day_number - 1) * 7, 1))
-                # Find the specified weekday.
-                start_time = find_next_weekday(next_month, day_name)
-
-            elif frequency == "weekly":
-                # Just add a week to our current time.
-                start_time += timedelta(days=7)
-
-            elif frequency == "daily":
-                # Add a day.
-                start_time += timedelta(days=1)
-
-                if recurrence_data["weekdaysOnly"]:
-                    # Add days until we get past the weekend.
-                    while start_time.weekday() >= 5:
-                        start_time += timedelta(days=1)
-
-            else:
-                # This is almost certainly a programming error.
-                error = "Got unknown frequency for recurring event."
-                logging.critical(error)
-                raise RuntimeError(error)
-
-            end_time = start_time + event_length
-            event_times.append((start_time, end_time))
+    # Work out when every occurrence is.
+    if recurring:
+        recurrence_data = json.loads(handler.request.get("recurring-data"))
+        recurrence = Recurrence.from_form(recurrence_data)
+        event_times = recurrence.expand_times(start_time, end_time)
+        recurring_description = recurrence.describe()
+    else:
+        # No repetitions.
+        event_times = [(start_time, end_time)]
+        recurring_description = "Never."
+
+    # Start every check's lookups at once, and then collect the results in the
+    # order we want errors reported in.
+    user_can_create = _check_user_can_create_async(event_times,
+                                                   ignore_admin=ignore_admin,
+                                                   editing=editing_event)
+    one_event_per_day = _check_one_event_per_day_async(
+        [start for start, _ in event_times], editing=editing_event,
+        ignore_admin=ignore_admin)
+    # This looks at the whole series at once, so it doesn't cost a query per
+    # event.
+    no_conflicts = _check_conflicts_async(handler, event_times, editing_event_id)
+
+    one_event_per_day.get_result()
+    no_conflicts.get_result()
+    user_can_create.get_result()
 
-        else:
-            # No repetitions.
-            recurring_description = "Never."
-
-    # Check that none of the events have conflicts.
-    for start_time, end_time in event_times:
-        conflicts = Event.check_conflict(
-            start_time, end_time,
-            handler.request.get('setup'),
-            handler.request.get('teardown'),
-            handler.request.get_all('rooms'),
-            optional_existing_event_id=editing_event_id
-        )
+    return event_times, recurring_description
 
-        if conflicts:
-            if ("Deck" in handler.request.get_all('rooms') or \
-                    "Savanna" in handler.request.get_all('rooms')):
-                raise ValueError('Room conflict detected <small>(Note: Deck &amp;' \
-                                 ' Savanna share the same area, two events cannot take' \
-                                 ' place at the same time in these rooms.)</small>')
-            else:
-                raise ValueError('Room conflict detected')
 
-    _check_user_can_create(event_times, ignore_admin=ignore_admin,
-                           editing=editing_event)
+""" Checks that none of a set of proposed events conflict with anything in the
+rooms they want. This starts looking up the occupancy bitmaps, but doesn't wait
+for them.
+handler: The handler to read the rooms, setup and teardown from.
+event_times: A list of (start, end) tuples, one for each event.
+editing_event_id: The id of the event we are editing, which can't conflict with
+itself.
+Returns: An _AsyncCheck that raises a ValueError if there is a conflict. """
+
+
+def _check_conflicts_async(handler, event_times, editing_event_id):
+    rooms = handler.request.get_all('rooms')
+    all_conflicts_rpc = Event.check_conflicts_async(
+        event_times,
+        handler.request.get('setup'),
+        handler.request.get('teardown'),
+        rooms,
+        optional_existing_event_id=editing_event_id
+    )
+
+    def check_conflicts():
+        all_conflicts = all_conflicts_rpc()
+        for (start_time, end_time), conflicts in zip(event_times,
+                                                     all_conflicts):
+            if conflicts:
+                logging.debug("Event at %s conflicts with %d other events." % \
+                              (start_time, len(conflicts)))
+                if ("Deck" in rooms or "Savanna" in rooms):
+                    raise ValueError('Room conflict detected <small>(Note: Deck &amp;' \
+                                     ' Savanna share the same area, two events cannot take' \
+                                     ' place at the same time in these rooms.)</small>')
+                else:
+                    raise ValueError('Room conflict detected')
 
-    return event_times, recurring_description
+    return _AsyncCheck(check_conflicts)
 
 
-""" Makes sure that adding this event won't violate a rule against having more
+""" Makes sure that adding these events won't violate a rule against having more
 than one event per day during Dojo hours. There are, of course, exceptions to
-this rule for anyone on the @events team.
-start_time: The proposed start time of the event.
+this rule for anyone on the @events team. This starts looking up the counts of
+events on those days, but doesn't wait for them.
+start_times: The proposed start times of the events.
 ignore_admin: Forces it to always perform the check as if the user were a normal
 user. Defaults to False.
-editing: The event we are editing, if we are editing. """
+editing: The event we are editing, if we are editing.
+Returns: An _AsyncCheck that raises a ValueError if there are too many events
+on one of the days. """
 
 
-def _check_one_event_per_day(start_time, editing=None, ignore_admin=False):
+def _check_one_event_per_day_async(start_times, editing=None,
+                                   ignore_admin=False):
     # If we're an admin, we can do anything we want.
     user_status = UserRights()
     if (not ignore_admin and user_status.is_admin):
         logging.info("User is admin, not performing check.")
-        return
+        return _AsyncCheck(lambda: None)
 
-    # If it is on a weekend, we shouldn't check either.
-    if start_time.weekday() > 4:
-        logging.info("Not performing check because event is on the weekend.")
-        return
+    to_check = []
+    for start_time in start_times:
+        # If it is on a weekend, we shouldn't check either.
+        if start_time.weekday() > 4:
+            logging.info("Not checking %s because it is on the weekend." % \
+                         (start_time))
+            continue
 
-    conf = Config()
-    # The earliest and latest that other events during Dojo hours this day might
-    # start.
-    earliest_start = start_time.replace(hour=conf.EVENT_HOURS[0], minute=0,
-                                        second=0, microsecond=0)
-    latest_start = start_time.replace(hour=conf.EVENT_HOURS[1], minute=0, second=0,
-                                      microsecond=0)
-    logging.debug("earliest start: %s, latest start: %s" % \
-                  (earliest_start, latest_start))
-
-    # Check that we are trying to make this event during coworking hours.
-    if (start_time < earliest_start or start_time > latest_start):
-        logging.debug("Event is not during coworking hours.")
-        return
+        # The earliest and latest that other events during Dojo hours this day
+        # might start.
+        earliest_start, latest_start = Event.coworking_hours(start_time)
+        logging.debug("earliest start: %s, latest start: %s" % \
+                      (earliest_start, latest_start))
 
-    event_query = db.GqlQuery("SELECT * FROM Event WHERE start_time >= :1 AND" \
-                              " start_time < :2 AND status IN :3",
-                              earliest_start, latest_start,
-                              ["pending", "approved"])
-    found_events = event_query.count()
-    logging.debug("Found %d events." % (found_events))
+        # Check that we are trying to make this event during coworking hours.
+        if (start_time < earliest_start or start_time > latest_start):
+            logging.debug("Event at %s is not during coworking hours." % \
+                          (start_time))
+            continue
+
+        to_check.append(start_time)
+
+    if not to_check:
+        return _AsyncCheck(lambda: None)
+
+    counts_rpc = Event.coworking_event_counts_async(
+        [s.date() for s in to_check])
+
+    def check_counts():
+        counts = counts_rpc()
+        for start_time in to_check:
+            found_events = counts[start_time.date()]
+            logging.debug("Found %d events on %s." % (found_events, start_time.date()))
+
+            if editing:
+                earliest_start, latest_start = Event.coworking_hours(start_time)
+                if (editing.start_time >= earliest_start and \
+                        editing.start_time <= latest_start):
+                    # In this case, our old event is going to show up in the count and
+                    # cause it to register one too many events.
+                    logging.debug("Removing old event from event count.")
+                    found_events -= 1
+
+            if found_events >= 1:
+                # We can't have another event that starts today.
+                raise ValueError("Hacker Dojo does not have enough space for all of our" \
+                                 " events+meetings+startups. As a result, we have to" \
+                                 " limit events during coworking hours (Monday through" \
+                                 " Friday, 9AM-5PM). There is already an event booked" \
+                                 " for this date. Please try another date. Sorry about" \
+                                 " any inconvenience.")
+
+    return _AsyncCheck(check_counts)
+
+
+""" Same as _check_one_event_per_day_async, but waits for the result. """
 
-    if editing:
-        if (editing.start_time >= earliest_start and \
-                editing.start_time <= latest_start):
-            # In this case, our old event is going to show up in the query and cause
-            # it to register one too many events.
-            logging.debug("Removing old event from event count.")
-            found_events -= 1
-
-    if found_events >= 1:
-        # We can't have another event that starts today.
-        raise ValueError("Hacker Dojo does not have enough space for all of our" \
-                         " events+meetings+startups. As a result, we have to" \
-                         " limit events during coworking hours (Monday through" \
-                         " Friday, 9AM-5PM). There is already an event booked" \
-                         " for this date. Please try another date. Sorry about" \
-                         " any inconvenience.")
+
+def _check_one_event_per_day(start_times, editing=None, ignore_admin=False):
+    _check_one_event_per_day_async(start_times, editing=editing,
+                                   ignore_admin=ignore_admin).get_result()
 
 
 """ Figure out how many days a user must wait before they can create an event,
 or if they can't create an event at all. It performs this check for the current
-logged-on user.
-Returns: How many more days the user must wait to create an event, or None if
-they are on a plan that does not allow event creation. """
+logged-on user. This starts any request to the signup app, but doesn't wait for
+it.
+Returns: An _AsyncCheck whose result is how many more days the user must wait
+to create an event, or None if they are on a plan that does not allow event
+creation. """
 
 
-def _get_user_wait_time():
+def _get_user_wait_time_async():
     conf = Config()
     if not conf.is_prod:
         # Don't do this check if we're not on the production server.
-        return 0
+        return _AsyncCheck(lambda: 0)
 
     user = users.get_current_user()
     if not user:
         # We'll perform the check when they are logged in.
         # return None to avoid user to access the page
-        return None
+        return _AsyncCheck(lambda: None)
 
     if UserRights().is_admin:
         # If they're an admin, they can do whatever they want.
         logging.debug("Ignoring 30 day requirement for admin.")
-        return 0
+        return _AsyncCheck(lambda: 0)
 
     # Check for cached data, which might allow us to avoid an API call.
     created = memcache.get("created.%s" % user.user_id())
 
-    if not created:
-        # Make an API request to the signup app to get this information about the
-        # user.
-        base_url = conf.SIGNUP_URL + "/api/v1/user"
-        query_str = urllib.urlencode({"email": user.email(),
-                                      "properties[]": ["created", "plan"]}, True)
-        response = urlfetch.fetch("%s?%s" % (base_url, query_str))
+    if created:
+        logging.debug("Cache hit for user %s creation time." % (user.email()))
+        return _AsyncCheck(lambda: _days_to_wait(created))
+
+    # Make an API request to the signup app to get this information about the
+    # user.
+    base_url = conf.SIGNUP_URL + "/api/v1/user"
+    query_str = urllib.urlencode({"email": user.email(),
+                                  "properties[]": ["created", "plan"]}, True)
+    rpc = urlfetch.create_rpc()
+    urlfetch.make_fetch_call(rpc, "%s?%s" % (base_url, query_str))
+
+    def check_signup():
+        response = rpc.get_result()
         logging.debug("Got response from signup app: %s" % response.content)
 
         if response.status_code != 200:
@@ -498,19 +544,36 @@ def _get_user_wait_time():
 
         # Cache it for next time.
         memcache.add("created.%s" % user.user_id(), created)
-    else:
-        logging.debug("Cache hit for user %s creation time." % (user.email()))
+        return _days_to_wait(created)
+
+    return _AsyncCheck(check_signup)
 
+
+""" Works out how many days a user has left to wait to create an event.
+created: When the user's account was created. (datetime)
+Returns: The number of days left to wait. """
+
+
+def _days_to_wait(created):
     logging.debug("User created at %s." % (created))
 
     # Check to see how long we have left.
     since_creation = datetime.now() - created
-    to_wait = max(0, conf.NEW_EVENT_WAIT_PERIOD - since_creation.days)
+    to_wait = max(0, Config().NEW_EVENT_WAIT_PERIOD - since_creation.days)
     logging.debug("Days to wait: %d" % to_wait)
 
     return to_wait
 
 
+""" Same as _get_user_wait_time_async, but waits for the result.
+Returns: How many more days the user must wait to create an event, or None if
+they are on a plan that does not allow event creation. """
+
+
+def _get_user_wait_time():
+    return _get_user_wait_time_async().get_result()
+
+
 """ Performs an action on a single event.
 event: The event object that we are working with.
 action: A string specifying the action to perform.
@@ -625,6 +688,14 @@ class DomainCacheCron(webapp2.RequestHandler):
         noop = dojo('/groups/events', force=True)
 
 
+class ExportSnapshotCron(webapp2.RequestHandler):
+    def get(self):
+        for format in ExportHandler.SNAPSHOT_FORMATS:
+            snapshot = ExportHandler.build_snapshot(format)
+            logging.info("Built %s snapshot in %d chunks." % \
+                         (format, snapshot.chunk_count))
+
+
 class ReminderCron(webapp2.RequestHandler):
     def get(self):
         self.response.out.write("REMINDERS")
@@ -668,141 +739,833 @@ class ExpireReminderCron(webapp2.RequestHandler):
             notify_owner_expiring(event)
 
 
+""" Finds recurring series that can be exported as a single calendar event with
+an RRULE, instead of one event per occurrence. A series only qualifies if every
+occurrence is present, none of them have been moved or changed on their own,
+and the RRULE would produce exactly the same times.
+events: The events to export, in order of start time. This can be a query, and
+it is only iterated once.
+Yields: An (event, recurrence) tuple for every event that should be exported.
+For a series that qualifies, only its first event is included, along with the
+Recurrence to attach to it. Every other event has a recurrence of None. Events
+that aren't in a series come out right away. Events that are get held back
+until we've seen the whole series, so the order isn't quite the same. """
+
+
+def _collapse_series(events):
+    # All of the fields that end up in the exported event, other than the times.
+    def details(event):
+        return (event.name, event.status, event.member, event.type,
+                event.estimated_size, event.url, event.fee, event.contact_name,
+                event.contact_phone, tuple(event.rooms), event.details,
+                event.notes, event.recurrence, event.end_time - event.start_time)
+
+    def collapse(members):
+        first = members[0]
+        try:
+            recurrence = Recurrence.from_rrule(first.recurrence)
+        except ValueError:
+            logging.warning("Bad recurrence rule for series %d." % \
+                            (first.series_id))
+            return None
+
+        if first.key().id() != first.series_id or \
+                not recurrence.matches(first.start_time):
+            return None
+        if [e.start_time for e in members] != recurrence.expand(first.start_time):
+            return None
+        if len(set([details(e) for e in members])) != 1:
+            return None
+        return recurrence
+
+    # The members of each series we've seen so far.
+    series = {}
+    for event in events:
+        if not (event.series_id and event.recurrence and event.end_time):
+            yield event, None
+            continue
+
+        members = series.setdefault(event.series_id, [])
+        members.append(event)
+        try:
+            count = Recurrence.from_rrule(event.recurrence).count
+        except ValueError:
+            count = 0
+        if len(members) < count:
+            continue
+
+        # That's the whole series.
+        del series[event.series_id]
+        recurrence = collapse(members)
+        if recurrence:
+            yield members[0], recurrence
+        else:
+            for member in members:
+                yield member, None
+
+    # Anything left over is missing some occurrences.
+    for members in series.itervalues():
+        for member in members:
+            yield member, None
+
+
+# The site that links in the exported feeds point to, unless a feed uses the
+# host it was requested from.
+EXPORT_URL_BASE = 'https://events.hackerdojo.com'
+EXPORT_TIMEZONE = pytz.timezone('US/Pacific')
+# Matches a line of an export description that didn't get a value, along with
+# any blank lines after it.
+_EMPTY_FIELD_RE = re.compile(r'^__.*?:[ ,]*$\n*', re.M)
+# Matches the marker at the start of each line of an export description.
+_FIELD_MARKER_RE = re.compile(r'^__', re.M)
+
+""" Works out everything about an event that the export feeds need, so that each
+format only has to lay it out.
+event: The event to export.
+url_base: The scheme and host to use for links to the event.
+Returns: A dictionary with the projected fields. """
+
+
+def _export_record(event, url_base=EXPORT_URL_BASE):
+    owner = event.owner()
+    roomlist = event.roomlist()
+    path = '%s-%s' % (event.key().id(), slugify(event.name))
+    url = '%s/event/%s' % (url_base, path)
+
+    # make verbose description with empty fields where information is missing
+    description = '__Status: %s\n__Member: %s\n__Type: %s\n__Estimated size: %s\n__Info URL: %s\n__Fee: %s\n__Contact: %s, %s\n__Rooms: %s\n\n__Details: %s\n\n__Notes: %s' % (
+        event.status,
+        owner,
+        event.type,
+        event.estimated_size,
+        event.url,
+        event.fee,
+        event.contact_name,
+        event.contact_phone,
+        roomlist,
+        event.details,
+        event.notes)
+    # then delete the empty fields
+    description = _EMPTY_FIELD_RE.sub('', description)
+    description = _FIELD_MARKER_RE.sub('', description)
+
+    if event.status == 'approved':
+        title = event.name
+    else:
+        title = event.name + ' (%s)' % event.status.upper()
+
+    return {
+        'id': event.key().id(),
+        'uid': path,
+        'name': event.name,
+        'title': title,
+        'status': event.status,
+        'organizer': owner,
+        'type': event.type,
+        'estimated_size': event.estimated_size,
+        'rooms': event.rooms,
+        'roomlist': roomlist,
+        'url': url,
+        'external_url': event.url,
+        'fee': event.fee,
+        'contact_name': event.contact_name,
+        'contact_phone': event.contact_phone,
+        'details': event.details,
+        'notes': event.notes,
+        'description': description + '\n--\n' + url,
+        'start_time': event.start_time,
+        'end_time': event.end_time,
+        'updated': event.updated,
+    }
+
+
+""" Lays out an export record as a VEVENT.
+record: The record from _export_record().
+summary: The summary line for the event.
+recurrence: The Recurrence to attach to it, if it stands for a whole series.
+Returns: The VEVENT, as a string. """
+
+
+def _record_to_vevent(record, summary, recurrence=None):
+    iev = CalendarEvent()
+    iev.add('summary', summary)
+    iev.add('description', record['description'])
+    iev.add('url', record['url'])
+    iev.add('uid', record['uid'])
+    iev.add('organizer', record['organizer'])
+    if record['start_time']:
+        iev.add('dtstart', record['start_time'].replace(tzinfo=EXPORT_TIMEZONE))
+    if record['end_time']:
+        iev.add('dtend', record['end_time'].replace(tzinfo=EXPORT_TIMEZONE))
+    if recurrence:
+        iev.add('rrule', recurrence.rrule())
+    return iev.as_string()
+
+
+# The columns in the CSV export.
+CSV_FIELDS = ['uid', 'event_name', 'start', 'end', 'status', 'description', 'category', 'organizer', 'url',
+              'rooms', 'cost', 'featured_image', 'event_size', 'contact_name', 'contact_phone', 'notes',
+              'external_url']
+
+""" Lays out an export record as a row of the CSV export.
+record: The record from _export_record().
+Returns: A dictionary mapping some of CSV_FIELDS to their values. """
+
+
+def _record_to_csv(record):
+    csv_data = dict()
+    csv_data['uid'] = record['uid']
+    csv_data['event_name'] = record['title'].encode('utf-8')
+    if record['start_time']:
+        csv_data['start'] = record['start_time'].strftime("%Y-%m-%d %H:%M")
+    if record['end_time']:
+        csv_data['end'] = record['end_time'].strftime("%Y-%m-%d %H:%M")
+    csv_data['status'] = record['status']
+    csv_data['organizer'] = record['organizer'].encode('utf-8')
+    csv_data['category'] = record['type']
+    csv_data['url'] = record['url']
+    csv_data['rooms'] = record['roomlist']
+    if record['fee'] and record['fee'] > 0:
+        csv_data['cost'] = record['fee']
+    else:
+        csv_data['cost'] = "Free"
+
+    if record['estimated_size']:
+        csv_data['event_size'] = record['estimated_size']
+    if record['contact_name']:
+        csv_data['contact_name'] = record['contact_name']
+    if record['contact_phone']:
+        csv_data['contact_phone'] = record['contact_phone']
+    if record['notes']:
+        csv_data['notes'] = record['notes'].encode('utf-8')
+    if record['details']:
+        csv_data['description'] = record['details'].encode('utf-8')
+    if record['external_url']:
+        csv_data['external_url'] = record['external_url']
+    return csv_data
+
+
+""" Writes rows of the CSV export.
+rows: Dictionaries from _record_to_csv().
+header: Whether to start with the row of column names.
+Returns: The rows, as CSV text. """
+
+
+def _csv_text(rows, header=False):
+    csv_file = StringIO.StringIO()
+    writer = csv.DictWriter(csv_file, fieldnames=CSV_FIELDS)
+    if header:
+        writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+    return csv_file.getvalue()
+
+
+""" Lays out an export record as an item in the RSS feed.
+record: The record from _export_record().
+Returns: The RSSItem. """
+
+
+def _record_to_rss(record):
+    return PyRSS2Gen.RSSItem(
+        title="%s @ %s: %s" % (
+            record['start_time'].strftime("%A, %B %d"),
+            record['start_time'].strftime("%I:%M%p").lstrip("0"),
+            record['name']),
+        link=record['url'],
+        description=record['details'],
+        guid=record['url'],
+        pubDate=record['updated'],
+    )
+
+
+# Rendered VEVENTs for the events we've exported recently. This sits in front of
+# memcache, which has the fragments rendered by every instance.
+_vevent_cache = LRUCache(2000)
+# How long to keep rendered VEVENTs in memcache, in seconds. They're keyed on
+# when the event was last updated, so this only matters for freeing up memcache.
+VEVENT_CACHE_LIFETIME = 7 * 24 * 60 * 60
+
+# The parts of an ICS feed that go around the events.
+ICS_HEADER = 'BEGIN:VCALENDAR\r\n'
+ICS_FOOTER = 'END:VCALENDAR\r\n'
+
+""" Renders the VEVENT for each event in an ICS feed, reusing the ones that
+haven't changed since they were last rendered.
+kind: Identifies which feed this is, since each renders events differently.
+entries: An iterable of (event, extra, variant) tuples. The extra value is
+passed along to render. variant is a string that changes whenever extra or
+anything else about the feed that render depends on does, besides the event
+itself.
+render: A function that takes an event and its extra value, and returns the
+VEVENT for the event as a string.
+batch_size: How many events to look up in memcache at once.
+Yields: An (event, VEVENT) tuple for each entry, in the same order. """
+
+
+def _vevent_fragments(kind, entries, render, batch_size=100):
+    entries = iter(entries)
+    while True:
+        batch = list(itertools.islice(entries, batch_size))
+        if not batch:
+            break
+
+        keys = ['vevent.%s.%d.%s.%s' % (kind, event.key().id(),
+                                        event.updated.isoformat(),
+                                        hashlib.md5(variant).hexdigest())
+                for event, _, variant in batch]
+
+        fragments = dict((key, _vevent_cache.get(key)) for key in keys)
+        missing = [key for key in keys if fragments[key] is None]
+        if missing:
+            from_memcache = memcache.get_multi(missing)
+            for key, fragment in from_memcache.iteritems():
+                fragments[key] = fragment
+                _vevent_cache.put(key, fragment)
+
+        rendered = {}
+        for key, (event, extra, _) in zip(keys, batch):
+            if fragments[key] is None:
+                fragments[key] = render(event, extra)
+                rendered[key] = fragments[key]
+                _vevent_cache.put(key, fragments[key])
+        if rendered:
+            memcache.set_multi(rendered, time=VEVENT_CACHE_LIFETIME)
+
+        for key, (event, _, _) in zip(keys, batch):
+            yield event, fragments[key]
+
+
+""" Builds an ICS feed out of a VEVENT for each event. The result is exactly the
+same as adding each VEVENT to a Calendar and calling as_string() on it.
+The arguments are the same as for _vevent_fragments().
+Yields: The feed, in pieces. """
+
+
+def _assemble_ics(kind, entries, render, batch_size=100):
+    yield ICS_HEADER
+    for _, fragment in _vevent_fragments(kind, entries, render, batch_size):
+        yield fragment
+    yield ICS_FOOTER
+
+
+""" Renders an event for the main ICS feed.
+event: The event.
+recurrence: The Recurrence to attach to it, if it stands for a whole series.
+Returns: The VEVENT, as a string. """
+
+
+def _render_ics_event(event, recurrence):
+    record = _export_record(event)
+    return _record_to_vevent(record, record['title'], recurrence)
+
+
+""" Works out the entries for the main ICS feed, collapsing recurring series
+where we can.
+events: The events in the feed, in order of start time.
+Yields: Entries for _vevent_fragments(). """
+
+
+def _ics_entries(events):
+    for event, recurrence in _collapse_series(events):
+        yield event, recurrence, recurrence.rrule().ical() if recurrence else ''
+
+
 class ExportHandler(webapp2.RequestHandler):
+    # How long to keep rendered feeds around, in seconds. They are keyed on the
+    # calendar generation, so this only matters for freeing up memcache.
+    CACHE_LIFETIME = 24 * 60 * 60
+    # Memcache keys for counting how well the cache is doing.
+    CACHE_HITS_KEY = 'export_cache.hits'
+    CACHE_MISSES_KEY = 'export_cache.misses'
+    # How many events to fetch from the datastore at a time.
+    BATCH_SIZE = 100
+    # The most events in a feed, unless it asks for everything since some date.
+    FEED_LIMIT = 200
+    # The properties that the JSON export can be filtered on.
+    JSON_FILTERS = ('member', 'type', 'status', 'rooms')
+    # The statuses of events that get exported.
+    JSON_STATUSES = ('approved', 'canceled')
+    # The fields that the JSON export can include for each event.
+    JSON_FIELDS = ('id', 'member', 'name', 'type', 'estimated_size', 'rooms',
+                   'status', 'start_time', 'end_time')
+    JSON_DEFAULT_LIMIT = 100
+    JSON_MAX_LIMIT = 200
+    # The feeds that ExportSnapshotCron renders ahead of time.
+    SNAPSHOT_FORMATS = ('ics', 'csv', 'json', 'rss')
+    # The snapshots that can be patched with events that changed after they were
+    # built, along with their content types. The others have to match the
+    # current calendar generation to be used.
+    PATCHABLE_SNAPSHOTS = {'ics': 'text/calendar', 'csv': 'text/csv'}
+    # The most changed events we'll patch into a snapshot. Past that, it's
+    # better to render the feed from scratch.
+    SNAPSHOT_MAX_DELTA = 50
+    # How far back before a snapshot was started to look for changed events,
+    # in case clocks disagree.
+    SNAPSHOT_DELTA_MARGIN = timedelta(minutes=1)
+
     def get(self, format):
-        content_type, body = getattr(self, 'export_%s' % format)()
+        exporter = getattr(self, 'export_%s' % format)
+        # Exporters can put any headers besides the content type that go with
+        # the feed in here.
+        self.extra_headers = {}
+        self.response.headers['Vary'] = 'Accept-Encoding'
+
+        # Calendar clients poll these constantly, so keep the rendered feed
+        # until some event changes. We have to get the generation before we
+        # look at any events, so that a change while we're rendering leaves
+        # us with an old generation rather than a new one.
+        generation = calendar_generation()
+        cache_key = None
+        etag = None
+        cached = None
+        encoding = None
+        if generation is not None:
+            # Feeds that we keep around get compressed once, when they're
+            # cached, for clients that can take that. Full history exports get
+            # rendered a piece at a time, so those don't.
+            if not self.request.get('since'):
+                accepted = self.request.accept_encoding
+                encoding = accepted.best_match(COMPRESSED_ENCODINGS)
+                # With no Accept-Encoding header, webob offers us the first
+                # one anyway, but with a quality of 0.
+                if encoding and not accepted.quality(encoding):
+                    encoding = None
+
+            # The feed only changes when its version does, so if the client
+            # already has this version, we don't even need to look it up.
+            version = self._feed_version(generation)
+            cache_key = 'export_feed.%s.%s' % (format, version)
+            etag = self._encoded_etag(version, encoding)
+            if etag in self.request.if_none_match:
+                self._not_modified(etag, None)
+                return
+
+            cached = memcache.get(cache_key)
+
+        chunks = None
+        compressed = None
+        if cached:
+            memcache.incr(self.CACHE_HITS_KEY, initial_value=0)
+            content_type, body, compressed, last_modified, self.extra_headers = \
+                cached
+        else:
+            memcache.incr(self.CACHE_MISSES_KEY, initial_value=0)
+            snapshot = None
+            if format in self.SNAPSHOT_FORMATS and not self.request.query_string:
+                snapshot = self._from_snapshot(format, generation)
+            try:
+                content_type, chunks = snapshot or exporter()
+            except ValueError, e:
+                self.response.set_status(400)
+                self.response.out.write(str(e))
+                return
+            if isinstance(chunks, basestring):
+                chunks = [chunks]
+            # HTTP dates only go down to the second.
+            last_modified = datetime.utcnow().replace(microsecond=0)
+
+            body = None
+            if not self.request.get('since'):
+                # The regular feeds are small enough to build in one go and
+                # keep around. Full history exports aren't, so those get
+                # rendered a piece at a time. The response still holds all of
+                # it until we return, but not the events it came from.
+                body = ''.join(chunks)
+                if cache_key:
+                    compressed = precompress(body)
+                    try:
+                        memcache.set(cache_key, (content_type, body, compressed,
+                                                 last_modified,
+                                                 self.extra_headers),
+                                     time=self.CACHE_LIFETIME)
+                    except ValueError:
+                        logging.warning("%s feed is too big to cache." % (format))
+
+        if not etag and body is not None:
+            etag = hashlib.md5(body).hexdigest()
+
+        if self._is_fresh(etag, last_modified):
+            self._not_modified(etag, last_modified)
+            return
+
         self.response.headers['content-type'] = content_type
-        self.response.out.write(body)
+        for name, value in self.extra_headers.iteritems():
+            self.response.headers[name] = value
+        if encoding:
+            self.response.headers['Content-Encoding'] = encoding
+            body = encode_precompressed(compressed, encoding)
+        if etag:
+            self.response.etag = etag
+        self.response.last_modified = last_modified
+        if body is not None:
+            self.response.out.write(body)
+        else:
+            for chunk in chunks:
+                self.response.out.write(chunk)
+
+    """ Works out the ETag for a version of a feed. Each content encoding gets a
+    different one, since they aren't the same bytes.
+    version: The version from _feed_version().
+    encoding: The content encoding the feed will be sent with, if any.
+    Returns: The ETag. """
+
+    @staticmethod
+    def _encoded_etag(version, encoding):
+        if not encoding:
+            return version
+        return '%s-%s' % (version, encoding)
+
+    """ Checks whether the client's copy of a feed is still good, based on the
+    conditional headers in the request.
+    etag: The ETag of the current feed, if we know it.
+    last_modified: When the current feed was rendered. (UTC datetime)
+    Returns: True if they already have the current feed. """
+
+    def _is_fresh(self, etag, last_modified):
+        # If-None-Match wins if they sent both.
+        if self.request.headers.get('If-None-Match'):
+            return etag is not None and etag in self.request.if_none_match
+
+        since = self.request.if_modified_since
+        if since is None:
+            return False
+        return last_modified <= since.replace(tzinfo=None)
+
+    """ Responds with a 304, telling the client to use its copy of the feed.
+    etag: The ETag of the current feed.
+    last_modified: When the current feed was rendered, if we know. """
+
+    def _not_modified(self, etag, last_modified):
+        self.response.set_status(304)
+        # There's no body, so there's nothing for this to describe.
+        self.response.headers.pop('Content-Type', None)
+        self.response.etag = etag
+        if last_modified:
+            self.response.last_modified = last_modified
+
+    """ Works out which version of a feed this request should get. It's used
+    both as the ETag and as part of the cache key.
+    generation: The current calendar generation.
+    Returns: A string that changes whenever the feed might. """
+
+    def _feed_version(self, generation):
+        # Feeds also depend on the request, and on what day it is, since they
+        # only show events from today onwards.
+        variant = '%s\n%s\n%s' % (self.request.headers.get('host', ''),
+                                  self.request.query_string,
+                                  local_today().date().isoformat())
+        return '%s-%s' % (generation, hashlib.md5(variant).hexdigest())
+
+    """ Gets a feed from its snapshot, if the snapshot is still good or can be
+    patched to be.
+    format: The format of the feed.
+    generation: The current calendar generation.
+    Returns: The content type and the feed, in pieces, or None if the feed will
+    have to be rendered from scratch. """
+
+    def _from_snapshot(self, format, generation):
+        snapshot = ExportSnapshot.get_by_key_name(format)
+        # Feeds only go back to the start of the day they were built, and some
+        # have links to the host they were built for.
+        if snapshot is None or snapshot.day != local_today():
+            return None
+        if snapshot.host and snapshot.host != self.request.headers.get('host'):
+            return None
+
+        current = generation is not None and snapshot.generation == generation
+        if not current and format not in self.PATCHABLE_SNAPSHOTS:
+            return None
+        data = snapshot.load()
+        if data is None:
+            return None
+        header, entries, footer = data
+
+        if not current:
+            entries = self._patch_entries(format, snapshot, entries)
+            if entries is None:
+                return None
+
+        # JSON gives us unicode, but headers have to be strings.
+        self.extra_headers = dict([(str(name), str(value)) for name, value in
+                                   json.loads(snapshot.headers).iteritems()])
+        return snapshot.content_type, \
+            [header] + [text for _, _, text in entries] + [footer]
+
+    """ Updates the entries from a snapshot with the events that changed after it
+    was built.
+    format: The format of the feed.
+    snapshot: The ExportSnapshot.
+    entries: The entries that were saved with it.
+    Returns: The new list of entries, or None if there were too many changes, or
+    ones that we can't patch in. """
+
+    def _patch_entries(self, format, snapshot, entries):
+        # If the feed was cut off, we don't know what comes after the end of it
+        # to take the place of events that change and move out.
+        if snapshot.truncated:
+            return None
+
+        changed = Event.all() \
+            .filter('updated >=', snapshot.started - self.SNAPSHOT_DELTA_MARGIN) \
+            .fetch(self.SNAPSHOT_MAX_DELTA + 1)
+        if len(changed) > self.SNAPSHOT_MAX_DELTA:
+            return None
+        # Changing one event in a recurring series can change whether the whole
+        # series collapses into one VEVENT.
+        if format == 'ics' and [e for e in changed if e.series_id]:
+            return None
+
+        changed_ids = set([event.key().id() for event in changed])
+        entries = [entry for entry in entries if entry[1] not in changed_ids]
+        today = local_today()
+        exported = [event for event in changed
+                    if event.status in self.JSON_STATUSES and
+                    event.start_time > today]
+        exported.sort(key=lambda event: (event.start_time, event.key().id()))
+
+        # Put each one in where the query would have.
+        positions = [(start_time, event_id) for start_time, event_id, _ in entries]
+        for entry in self._snapshot_entries(format, exported):
+            position = bisect.bisect(positions, entry[:2])
+            positions.insert(position, entry[:2])
+            entries.insert(position, entry)
+        return entries
+
+    """ Renders events for a patchable snapshot.
+    format: The format of the feed.
+    events: The events, in order of start time.
+    Returns: A list of (start_time, event id, text) tuples. """
+
+    def _snapshot_entries(self, format, events):
+        if format == 'ics':
+            fragments = _vevent_fragments('ics', _ics_entries(events),
+                                          _render_ics_event, self.BATCH_SIZE)
+        else:
+            fragments = ((event, _csv_text([_record_to_csv(_export_record(event))]))
+                         for event in events)
+        return [(event.start_time, event.key().id(), text)
+                for event, text in fragments]
+
+    """ Renders a feed the way it is normally requested, and stores it as its
+    snapshot.
+    format: One of SNAPSHOT_FORMATS.
+    Returns: The new ExportSnapshot. """
+
+    @classmethod
+    def build_snapshot(cls, format):
+        request = webapp2.Request.blank('/events.%s' % format,
+                                        base_url=EXPORT_URL_BASE)
+        handler = cls(request, webapp2.Response())
+        handler.extra_headers = {}
+
+        # Like with the render cache, we have to get these before looking at any
+        # events, so that any change while we're rendering gets patched in.
+        generation = calendar_generation()
+        started = datetime.utcnow()
+        day = local_today()
+
+        host = None
+        truncated = False
+        if format in cls.PATCHABLE_SNAPSHOTS:
+            content_type = cls.PATCHABLE_SNAPSHOTS[format]
+            events = list(handler._feed_events())
+            truncated = len(events) >= cls.FEED_LIMIT
+            entries = handler._snapshot_entries(format, events)
+            if format == 'ics':
+                header, footer = ICS_HEADER, ICS_FOOTER
+            else:
+                header, footer = _csv_text([], header=True), ''
+        else:
+            content_type, chunks = getattr(handler, 'export_%s' % format)()
+            if not isinstance(chunks, basestring):
+                chunks = ''.join(chunks)
+            header, entries, footer = chunks, [], ''
+            # These have links that use the host they were requested from.
+            host = request.headers.get('host')
+
+        return ExportSnapshot.save(format, header, entries, footer,
+                                   generation=generation, started=started,
+                                   day=day, host=host, truncated=truncated,
+                                   content_type=content_type,
+                                   headers=json.dumps(handler.extra_headers))
+
+    """ Returns: A dictionary with the number of cache hits and misses. """
+
+    @classmethod
+    def cache_stats(cls):
+        counts = memcache.get_multi([cls.CACHE_HITS_KEY, cls.CACHE_MISSES_KEY])
+        return {'hits': counts.get(cls.CACHE_HITS_KEY, 0),
+                'misses': counts.get(cls.CACHE_MISSES_KEY, 0)}
+
+    """ Gets the events to export. Normally that's everything from today onwards,
+    but the since parameter can ask for events from an earlier date (in
+    yyyy-mm-dd format) too.
+    statuses: If given, only export events with one of these statuses.
+    summary: Whether we only need summaries of the events. See
+    Event.get_ongoing_and_future_query().
+    Raises a ValueError if since isn't a valid date.
+    Returns: A query for the events, in order of start time. """
+
+    def _events(self, statuses=None, summary=False):
+        since = self.request.get('since')
+        if since:
+            try:
+                since = datetime.strptime(since, '%Y-%m-%d')
+            except ValueError:
+                raise ValueError("'since' must be a date like 2015-01-01.")
+        return Event.get_ongoing_and_future_query(since=since or None,
+                                                  statuses=statuses,
+                                                  summary=summary)
+
+    """ Gets the events for one of the feeds. The regular feeds only have the
+    first FEED_LIMIT of them, but asking for everything since some date gets
+    all of them.
+    Raises a ValueError if since isn't a valid date.
+    Returns: An iterable of the events, in order of start time. """
+
+    def _feed_events(self):
+        events = self._events()
+        if self.request.get('since'):
+            return events.run(batch_size=self.BATCH_SIZE)
+        return events.run(batch_size=self.BATCH_SIZE, limit=self.FEED_LIMIT)
+
+    """ Exports a page of events as a JSON list, in order of start time.
+    Request parameters:
+    member, type, status, rooms: Only include events with this value for the
+    property. member is an email address.
+    since: Include events from this date onwards instead of today.
+    limit: The most events to include. Defaults to JSON_DEFAULT_LIMIT.
+    fields: A comma-separated list of the fields from JSON_FIELDS to include.
+    Defaults to all of them.
+    cursor: Where to start from, taken from the link to the next page.
+    If there are more events, the response has a Link header pointing to the
+    next page. """
 
     def export_json(self):
-        events = Event.get_recent_ongoing_and_future()
-        for k in self.request.GET:
-            if self.request.GET[k] and k in ['member']:
-                value = users.User(urllib.unquote(self.request.GET[k]))
+        try:
+            limit = int(self.request.get('limit') or self.JSON_DEFAULT_LIMIT)
+        except ValueError:
+            raise ValueError("'limit' must be a number.")
+        if not 0 < limit <= self.JSON_MAX_LIMIT:
+            raise ValueError("'limit' must be between 1 and %d." % \
+                             (self.JSON_MAX_LIMIT))
+
+        fields = self.JSON_FIELDS
+        if self.request.get('fields'):
+            fields = self.request.get('fields').split(',')
+            unknown = set(fields) - set(self.JSON_FIELDS)
+            if unknown:
+                raise ValueError("Unknown fields: %s" % \
+                                 (', '.join(sorted(unknown))))
+
+        statuses = None
+        status = self.request.get('status')
+        if status:
+            if status not in self.JSON_STATUSES:
+                raise ValueError("Only %s events are exported." % \
+                                 (' and '.join(self.JSON_STATUSES)))
+            statuses = [status]
+
+        # We only need the summaries, which are usually cached, so don't load
+        # the whole events.
+        events = self._events(statuses=statuses, summary=True)
+        for k in self.JSON_FILTERS:
+            value = self.request.get(k)
+            if not value:
+                continue
+            if k == 'member':
+                value = users.User(urllib.unquote(value))
             else:
-                value = urllib.unquote(self.request.GET[k])
+                value = urllib.unquote(value)
             events = events.filter('%s =' % k, value)
-        events = map(lambda x: x.to_dict(summarize=True), events)
+
+        # The cursor is just the last event we sent. Events are sorted by start
+        # time and then id, so the next page is everything after it in that
+        # order. This works even with the IN filter on status, which datastore
+        # cursors don't.
+        after = None
+        if self.request.get('cursor'):
+            after = self._decode_cursor(self.request.get('cursor'))
+            events = events.filter('start_time >=', after[0])
+
+        page = []
+        for event in events.run(batch_size=limit + 1):
+            if after and (event.start_time, event.key().id()) <= after:
+                continue
+            page.append(event)
+            if len(page) > limit:
+                break
+
+        if len(page) > limit:
+            page = page[:limit]
+            last = page[-1]
+            params = dict([(k, v.encode('utf-8'))
+                           for k, v in self.request.GET.items()])
+            params['cursor'] = self._encode_cursor(last.start_time,
+                                                   last.key().id())
+            self.extra_headers['Link'] = '<%s?%s>; rel="next"' % \
+                (self.request.path_url, urllib.urlencode(params))
+
+        events = []
+        for summary in Event.get_summaries([event.key() for event in page]):
+            events.append(dict([(k, summary[k]) for k in fields if k in summary]))
         return 'application/json', json.dumps(events)
 
+    """ Makes a cursor for the JSON export that points after an event.
+    start_time: The start time of the event.
+    event_id: The id of the event.
+    Returns: The cursor, as a URL-safe string. """
+
+    @staticmethod
+    def _encode_cursor(start_time, event_id):
+        return base64.urlsafe_b64encode('%s|%d' % (start_time.isoformat(),
+                                                   event_id))
+
+    """ Reads a cursor made by _encode_cursor.
+    cursor: The cursor.
+    Raises a ValueError if it isn't a valid cursor.
+    Returns: A tuple of the start time and id of the event it points after. """
+
+    @staticmethod
+    def _decode_cursor(cursor):
+        try:
+            start_time, event_id = base64.urlsafe_b64decode(str(cursor)).split('|')
+            try:
+                start_time = datetime.strptime(start_time, '%Y-%m-%dT%H:%M:%S.%f')
+            except ValueError:
+                start_time = datetime.strptime(start_time, '%Y-%m-%dT%H:%M:%S')
+            return start_time, int(event_id)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid cursor.")
+
     def export_csv(self):
-        import csv
-        import StringIO
-
-        csv_file = StringIO.StringIO()
-        events = Event.get_recent_ongoing_and_future()
-        fieldnames = ['uid', 'event_name', 'start', 'end', 'status', 'description', 'category', 'organizer', 'url',
-                      'rooms', 'cost', 'featured_image', 'event_size', 'contact_name', 'contact_phone', 'notes', 'external_url']
-        writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
-        writer.writeheader()
+        events = self._feed_events()
 
-        for event in events:
-            csv_data = dict()
-            csv_data['uid'] = event_uid(event)
-            event_name = event.name if event.status == 'approved' else event.name + ' (%s)' % event.status.upper()
-            csv_data['event_name'] = event_name.encode('utf-8')
-            if event.start_time:
-                csv_data['start'] = event.start_time.strftime("%Y-%m-%d %H:%M")
-            if event.end_time:
-                csv_data['end'] = event.end_time.strftime("%Y-%m-%d %H:%M")
-            csv_data['status'] = event.status
-            csv_data['organizer'] = event.owner().encode('utf-8')
-            csv_data['category'] = event.type
-            csv_data['url'] = "https://events.hackerdojo.com%s" % event_path(event)
-            csv_data['rooms'] = event.roomlist()
-            if event.fee and event.fee > 0:
-                csv_data['cost'] = event.fee
-            else:
-                csv_data['cost'] = "Free"
-
-            if event.estimated_size:
-                csv_data['event_size'] = event.estimated_size
-            if event.contact_name:
-                csv_data['contact_name'] = event.contact_name
-            if event.contact_phone:
-                csv_data['contact_phone'] = event.contact_phone
-            if event.notes:
-                csv_data['notes'] = event.notes.encode('utf-8')
-            if event.details:
-                csv_data['description'] = event.details.encode('utf-8')
-            if event.url:
-                csv_data['external_url'] = event.url
-
-            writer.writerow(csv_data)
-
-        contents = csv_file.getvalue()
-        csv_file.close()
-        return 'text/csv', contents
+        def rows():
+            # Only ever hold one row at a time.
+            yield _csv_text([], header=True)
+            for event in events:
+                yield _csv_text([_record_to_csv(_export_record(event))])
+
+        return 'text/csv', rows()
 
     def export_ics(self):
-        events = Event.get_recent_ongoing_and_future()
-        cal = Calendar()
-        for event in events:
-            iev = CalendarEvent()
-            iev.add('summary',
-                    event.name if event.status == 'approved' else event.name + ' (%s)' % event.status.upper())
-            # make verbose description with empty fields where information is missing
-            ev_desc = '__Status: %s\n__Member: %s\n__Type: %s\n__Estimated size: %s\n__Info URL: %s\n__Fee: %s\n__Contact: %s, %s\n__Rooms: %s\n\n__Details: %s\n\n__Notes: %s' % (
-                event.status,
-                event.owner(),
-                event.type,
-                event.estimated_size,
-                event.url,
-                event.fee,
-                event.contact_name,
-                event.contact_phone,
-                event.roomlist(),
-                event.details,
-                event.notes)
-            # then delete the empty fields with a regex
-            ev_desc = re.sub(re.compile(r'^__.*?:[ ,]*$\n*', re.M), '', ev_desc)
-            ev_desc = re.sub(re.compile(r'^__', re.M), '', ev_desc)
-            ev_url = "https://events.hackerdojo.com%s" % event_path(event)
-            iev.add('description', ev_desc + '\n--\n' + ev_url)
-            iev.add('url', ev_url)
-            iev.add('uid', event_uid(event))
-            iev.add('organizer', event.owner())
-            if event.start_time:
-                iev.add('dtstart', event.start_time.replace(tzinfo=pytz.timezone('US/Pacific')))
-            if event.end_time:
-                iev.add('dtend', event.end_time.replace(tzinfo=pytz.timezone('US/Pacific')))
-            cal.add_component(iev)
-        return 'text/calendar', cal.as_string()
+        entries = _ics_entries(self._feed_events())
+        return 'text/calendar', _assemble_ics('ics', entries, _render_ics_event,
+                                              batch_size=self.BATCH_SIZE)
 
     def export_large_ics(self):
-        events = Event.get_recent_ongoing_and_future()
+        events = self._feed_events()
         url_base = 'https://' + self.request.headers.get('host', 'events.hackerdojo.com')
-        cal = Calendar()
-        for event in events:
-            iev = CalendarEvent()
-            iev.add('summary', event.name + ' (%s)' % event.estimated_size)
-            # make verbose description with empty fields where information is missing
-            ev_desc = '__Status: %s\n__Member: %s\n__Type: %s\n__Estimated size: %s\n__Info URL: %s\n__Fee: %s\n__Contact: %s, %s\n__Rooms: %s\n\n__Details: %s\n\n__Notes: %s' % (
-                event.status,
-                event.owner(),
-                event.type,
-                event.estimated_size,
-                event.url,
-                event.fee,
-                event.contact_name,
-                event.contact_phone,
-                event.roomlist(),
-                event.details,
-                event.notes)
-            # then delete the empty fields with a regex
-            ev_desc = re.sub(re.compile(r'^__.*?:[ ,]*$\n*', re.M), '', ev_desc)
-            ev_desc = re.sub(re.compile(r'^__', re.M), '', ev_desc)
-            ev_url = url_base + event_path(event)
-            iev.add('description', ev_desc + '\n--\n' + ev_url)
-            iev.add('url', ev_url)
-            iev.add('uid', event_uid(event))
-            iev.add('organizer', event.owner())
-            if event.start_time:
-                iev.add('dtstart', event.start_time.replace(tzinfo=pytz.timezone('US/Pacific')))
-            if event.end_time:
-                iev.add('dtend', event.end_time.replace(tzinfo=pytz.timezone('US/Pacific')))
-            cal.add_component(iev)
-        return 'text/calendar', cal.as_string()
+
+        def render(event, _):
+            record = _export_record(event, url_base)
+            return _record_to_vevent(record, record['name'] + ' (%s)' % record['estimated_size'])
+
+        entries = ((event, None, url_base) for event in events)
+        return 'text/calendar', _assemble_ics('large_ics', entries, render,
+                                              batch_size=self.BATCH_SIZE)
 
     def export_rss(self):
         url_base = 'https://' + self.request.headers.get('host', 'events.hackerdojo.com')
@@ -812,20 +1575,351 @@ class ExportHandler(webapp2.RequestHandler):
             link=url_base,
             description="Upcoming events at the Hacker Dojo in Santa Clara View, CA",
             lastBuildDate=datetime.now(),
-            items=[PyRSS2Gen.RSSItem(
-                title="%s @ %s: %s" % (
-                    event.start_time.strftime("%A, %B %d"),
-                    event.start_time.strftime("%I:%M%p").lstrip("0"),
-                    event.name),
-                link=url_base + event_path(event),
-                description=event.details,
-                guid=url_base + event_path(event),
-                pubDate=event.updated,
-            ) for event in events]
+            items=[_record_to_rss(_export_record(event, url_base))
+                   for event in events]
         )
         return 'application/xml', rss.to_xml()
 
 
+# The name of the keymaster secret that feed tokens are signed with.
+FEED_TOKEN_KEY_NAME = 'feedtokenkey'
+# The secret itself, once we've looked it up.
+_feed_token_key = None
+
+""" Gets the secret that feed tokens are signed with, making one up the first
+time it's needed.
+Returns: The secret. """
+
+
+def _get_feed_token_key():
+    global _feed_token_key
+    if _feed_token_key is None:
+        try:
+            _feed_token_key = keymaster.get(FEED_TOKEN_KEY_NAME)
+        except keymaster.KeymasterError:
+            # If someone else makes one at the same time, we both end up with
+            # whichever got stored first.
+            keymaster.Keymaster.encrypt_once(FEED_TOKEN_KEY_NAME,
+                                             os.urandom(32).encode('hex'))
+            _feed_token_key = keymaster.get(FEED_TOKEN_KEY_NAME)
+    return _feed_token_key
+
+
+""" Signs an email address for a feed token.
+email: The email address.
+Returns: The signature. """
+
+
+def _feed_token_signature(email):
+    return hmac.new(_get_feed_token_key(), 'feed:' + email,
+                    hashlib.sha256).hexdigest()[:32]
+
+
+""" Makes a token that lets a member subscribe to their own events, since
+calendar programs can't log in.
+user: The member.
+Returns: The token. """
+
+
+def feed_token(user):
+    email = user.email()
+    return '%s.%s' % (base64.urlsafe_b64encode(email).rstrip('='),
+                      _feed_token_signature(email))
+
+
+""" Checks a token from feed_token().
+token: The token.
+Returns: The member it's for, or None if it isn't valid. """
+
+
+def _check_feed_token(token):
+    try:
+        encoded, signature = str(token).split('.')
+        email = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+    except (TypeError, ValueError, UnicodeError):
+        return None
+    if not email or \
+            not constant_time_equal(signature, _feed_token_signature(email)):
+        return None
+    return users.User(email)
+
+
+_SEQUENCE_EPOCH = datetime(1970, 1, 1)
+
+""" Turns when an event was last updated into a sync sequence number.
+updated: The time. (UTC datetime)
+Returns: The sequence number, which is microseconds since the epoch. """
+
+
+def _sequence(updated):
+    delta = updated - _SEQUENCE_EPOCH
+    return (delta.days * 24 * 60 * 60 + delta.seconds) * 1000000 + \
+        delta.microseconds
+
+
+""" An ICS feed of just one member's events, for subscribing to in a calendar
+program. The token parameter, from feed_token(), says whose events they are.
+Request parameters:
+token: The feed token.
+start, end: The dates (yyyy-mm-dd) to include events from and until. Defaults
+to DEFAULT_PAST_DAYS ago until DEFAULT_FUTURE_DAYS from now, and can't be more
+than MAX_WINDOW_DAYS apart.
+sequence: If given, the feed only has events that changed after this sequence
+number, no matter when they are, and including deleted ones.
+Every response has an X-Sequence header, which can be passed back as sequence to
+get the next set of changes. If a set of changes has MAX_EVENTS events, there
+might be more, so keep asking until there aren't. Events that changed in the
+last SYNC_MARGIN can come again in the next set. """
+
+
+class MyEventsFeedHandler(webapp2.RequestHandler):
+    DEFAULT_PAST_DAYS = 30
+    DEFAULT_FUTURE_DAYS = 365
+    MAX_WINDOW_DAYS = 2 * 366
+    # The most events to include in one response.
+    MAX_EVENTS = 500
+    # How many events to fetch from the datastore at a time.
+    BATCH_SIZE = 100
+    # An event's updated time is set before it is written, so a write that
+    # was still going on during a sync can show up later with an updated time
+    # before that sync's sequence number. The sequence numbers we hand out stay
+    # this far behind the present, so the next sync catches those.
+    SYNC_MARGIN = timedelta(minutes=1)
+
+    def get(self):
+        user = _check_feed_token(self.request.get('token'))
+        if not user:
+            self.response.set_status(403)
+            self.response.out.write("Invalid feed token.")
+            return
+
+        try:
+            if self.request.get('sequence'):
+                events, sequence = self._changed_events(user)
+            else:
+                events, sequence = self._window_events(user)
+        except ValueError, e:
+            self.response.set_status(400)
+            self.response.out.write(str(e))
+            return
+        if events is None:
+            return
+
+        self.response.headers['content-type'] = 'text/calendar'
+        self.response.headers['X-Sequence'] = str(sequence)
+        entries = ((event, None, '') for event in events)
+        for chunk in _assemble_ics('ics', entries, _render_ics_event,
+                                   batch_size=self.BATCH_SIZE):
+            self.response.out.write(chunk)
+
+    """ Gets the member's events within the requested window. Clients poll this,
+    so if they already have the current version, it responds with a 304.
+    user: The member.
+    Raises a ValueError if the window isn't valid.
+    Returns: A list of the events in order of start time, or None if it already
+    responded, and the current sequence number. """
+
+    def _window_events(self, user):
+        today = local_today()
+        try:
+            start = self._date('start', today - timedelta(days=self.DEFAULT_PAST_DAYS))
+            end = self._date('end', today + timedelta(days=self.DEFAULT_FUTURE_DAYS))
+        except ValueError:
+            raise ValueError("'start' and 'end' must be dates like 2015-01-01.")
+        if not start < end <= start + timedelta(days=self.MAX_WINDOW_DAYS):
+            raise ValueError("'end' must be after 'start', and at most %d days "
+                             "after it." % (self.MAX_WINDOW_DAYS))
+
+        # The feed only changes when one of their events does, and the index
+        # can tell us that without loading any of them.
+        latest = db.Query(Event, projection=('updated',)) \
+            .filter('member =', user) \
+            .order('-updated').get()
+        version = _sequence(latest.updated) if latest else 0
+        etag = hashlib.md5('%s\n%s\n%s\n%d' % (user.email(), start.date(),
+                                                 end.date(), version)).hexdigest()
+        sequence = self._held_back(version)
+        self.response.etag = etag
+        if etag in self.request.if_none_match:
+            self.response.set_status(304)
+            self.response.headers.pop('Content-Type', None)
+            return None, sequence
+
+        events = Event.all() \
+            .filter('member =', user) \
+            .filter('start_time >=', start) \
+            .filter('start_time <', end) \
+            .order('start_time') \
+            .fetch(self.MAX_EVENTS)
+        return [event for event in events if event.status != 'deleted'], sequence
+
+    """ Gets the member's events that changed after the requested sequence
+    number. Events that changed within SYNC_MARGIN of the last sync get sent
+    again, which is harmless, since they have the same UID and SEQUENCE as
+    before.
+    user: The member.
+    Raises a ValueError if the sequence number isn't valid.
+    Returns: A list of the events in the order they changed, and the sequence
+    number to ask for next. """
+
+    def _changed_events(self, user):
+        try:
+            sequence = int(self.request.get('sequence'))
+        except ValueError:
+            raise ValueError("'sequence' must be a number.")
+        if sequence < 0:
+            raise ValueError("'sequence' can't be negative.")
+
+        events = Event.all() \
+            .filter('member =', user) \
+            .filter('updated >', _SEQUENCE_EPOCH + timedelta(microseconds=sequence)) \
+            .order('updated') \
+            .fetch(self.MAX_EVENTS + 1)
+        if len(events) > self.MAX_EVENTS:
+            events = events[:self.MAX_EVENTS]
+            # Leave any that changed at the same moment as the last one for the
+            # next set, so that we don't skip the rest of them.
+            earlier = [event for event in events
+                       if event.updated < events[-1].updated]
+            if earlier:
+                events = earlier
+            # There are more, so they'll ask again right away, and the last
+            # set of changes gets held back instead.
+            return events, _sequence(events[-1].updated)
+
+        if events:
+            sequence = _sequence(events[-1].updated)
+        return events, self._held_back(sequence)
+
+    """ Holds back the sequence number for a client that has caught up, so that
+    it's at least SYNC_MARGIN behind the present.
+    sequence: The sequence number of the last change they have.
+    Returns: The sequence number to give them. """
+
+    def _held_back(self, sequence):
+        return min(sequence, _sequence(datetime.utcnow() - self.SYNC_MARGIN))
+
+    """ Reads a date parameter.
+    name: The name of the parameter.
+    default: What to use if it isn't given.
+    Raises a ValueError if it isn't a valid date.
+    Returns: The date, as a datetime. """
+
+    def _date(self, name, default):
+        value = self.request.get(name)
+        if not value:
+            return default
+        return datetime.strptime(value, '%Y-%m-%d')
+
+
+""" Finds open slots where an event could be booked, so that people don't have to
+keep submitting the new event form until they stop getting conflicts.
+Request parameters:
+rooms: The rooms that the event needs. Can be given more than once.
+start_date: The first day to search, in mm/dd/yyyy format.
+end_date: The last day to search, in mm/dd/yyyy format.
+duration: How long the event lasts, in minutes.
+setup: How much setup time the event needs, in minutes. Defaults to 0.
+teardown: How much teardown time the event needs, in minutes. Defaults to 0.
+Response: A JSON dictionary with a list of slots. An event of the requested
+duration can be booked anywhere between the start and end of any slot. If
+start_excluded or end_excluded is set, the event can get as close as it likes to
+that end of the slot, but not right up against it. """
+
+
+class AvailabilityHandler(webapp2.RequestHandler):
+    # The most days we'll search in one request.
+    MAX_DAYS = 31
+
+    def get(self):
+        try:
+            slots = self._find_slots()
+        except ValueError, e:
+            self.response.set_status(400)
+            self.response.headers['content-type'] = 'application/json'
+            self.response.out.write(json.dumps({"error": str(e)}))
+            return
+
+        time_format = '%Y-%m-%dT%H:%M:%S'
+        self.response.headers['content-type'] = 'application/json'
+        self.response.out.write(json.dumps({
+            "rooms": self.request.get_all("rooms"),
+            "duration": int(self.request.get("duration")),
+            "slots": [{"start": start.strftime(time_format),
+                       "end": end.strftime(time_format),
+                       "start_excluded": start_excluded,
+                       "end_excluded": end_excluded}
+                      for start, end, start_excluded, end_excluded \
+                      in slots]}))
+
+    """ Works out the open slots from the request parameters.
+    Raises a ValueError if the parameters are bad.
+    Returns: A list of (start, end, start_excluded, end_excluded) tuples. """
+
+    def _find_slots(self):
+        rooms = [room for room in self.request.get_all("rooms") if room]
+        if not rooms:
+            raise ValueError("You must select a room.")
+        try:
+            range_start = datetime.strptime(self.request.get("start_date"),
+                                            "%m/%d/%Y")
+            range_end = datetime.strptime(self.request.get("end_date"),
+                                          "%m/%d/%Y") + timedelta(days=1)
+            duration = timedelta(minutes=int(self.request.get("duration")))
+            start_padding, end_padding = Event.padding(
+                self.request.get("setup") or 0,
+                self.request.get("teardown") or 0)
+        except ValueError:
+            raise ValueError("Dates must be mm/dd/yyyy, and times must be" \
+                             " a number of minutes.")
+        if duration <= timedelta(0):
+            raise ValueError("Duration must be greater than zero.")
+        if range_end <= range_start:
+            raise ValueError("End date must be after start date.")
+        if (range_end - range_start).days > self.MAX_DAYS:
+            raise ValueError("You can only search %d days at a time." % \
+                             (self.MAX_DAYS))
+
+        # These are the earliest and latest times the event could start.
+        is_admin = UserRights().is_admin
+        earliest = range_start
+        if not is_admin:
+            # Same as the 48 hour rule in _validate_event.
+            earliest = max(earliest, local_today() + timedelta(days=2))
+        latest = range_end - duration
+        if earliest > latest:
+            return []
+
+        # Starting anywhere in one of these intervals would conflict with
+        # something, once setup, teardown, and spacing are counted.
+        blocked = []
+        for event in Event.get_blocking_list(earliest - start_padding,
+                                             latest + duration + end_padding,
+                                             rooms):
+            blocked.append((event.start_time - end_padding - duration,
+                            event.end_time + start_padding))
+
+        # Days that already have an event during coworking hours can't have
+        # another one start then, including right at the start or end of them.
+        # (See _check_one_event_per_day.)
+        coworking = []
+        if not is_admin:
+            weekdays = []
+            day = earliest.date()
+            while day <= latest.date():
+                if day.weekday() <= 4:
+                    weekdays.append(day)
+                day += timedelta(days=1)
+
+            for day, count in Event.coworking_event_counts(weekdays).items():
+                if count >= 1:
+                    coworking.append(Event.coworking_hours(day))
+
+        return [(start, end + duration, start_excluded, end_excluded)
+                for start, end, start_excluded, end_excluded \
+                in free_windows(earliest, latest, blocked, coworking)]
+
+
 class EditHandler(webapp2.RequestHandler):
     def get(self, id):
         event = Event.get_by_id(int(id))
@@ -1038,6 +2132,8 @@ class MyEventsHandler(BaseHandler):
         tomorrow = today + timedelta(days=1)
 
         wait_days = _get_user_wait_time()
+        feed_url = '%s/events/mine.ics?%s' % (
+            self.request.host_url, urllib.urlencode({'token': feed_token(user)}))
 
         hide_checkboxes = True
         self.response.out.write(template.render('templates/myevents.html', locals()))
@@ -1171,7 +2267,9 @@ class NewHandler(webapp2.RequestHandler):
     def post(self):
         # Make sure that we are still logged in.
         user = users.get_current_user()
-        wait_days = _get_user_wait_time()
+        # This can involve a trip to the signup app, so start it now and let it
+        # run while we validate the event.
+        wait_days_rpc = _get_user_wait_time_async()
 
         if not user:
             # Redirect to the login page.
@@ -1188,6 +2286,7 @@ class NewHandler(webapp2.RequestHandler):
             # We need event details.
             error = "Event details are required."
         if error:
+            wait_days = wait_days_rpc.get_result()
             self.response.set_status(400)
             self.response.out.write(template.render("templates/error.html",
                                                     locals()))
@@ -1204,27 +2303,45 @@ class NewHandler(webapp2.RequestHandler):
             logging.debug("Submitting recurring event.")
 
         try:
+            # Since the other member check is just based on the duration, it
+            # doesn't really matter which occurrence we use, so we can start it
+            # before we've worked out the whole series. If the times are bad,
+            # _validate_event will complain about them, so that can wait.
+            try:
+                first_start, first_end = _get_event_times(self)
+                other_member_rpc = _get_other_member_async(self, first_start,
+                                                           first_end)
+            except ValueError:
+                other_member_rpc = None
+
             event_times, description = _validate_event(self, ignore_admin=ignore_admin,
                                                        recurring=recurring)
 
-            # Since this check is just based on the duration, it doesn't really
-            # matter which start and end times we use.
-            first_start = event_times[0][0]
-            first_end = event_times[0][1]
-
-            other_member = _get_other_member(self, first_start, first_end)
+            other_member = other_member_rpc.get_result()
         except ValueError, e:
             error = str(e)
             logging.warning(error)
+            wait_days = wait_days_rpc.get_result()
             self.response.set_status(400)
             self.response.out.write(template.render('templates/error.html', locals()))
             return
 
         # If we are ignoring our admin status, we are testing, so don't save it.
         if not ignore_admin:
-            first_event = None
-            for start_time, end_time in event_times:
+            # Get ids for the whole series up front, so we can write all the
+            # events and their logs together.
+            keys = Event.allocate_keys(len(event_times))
+            series_id = None
+            rrule = None
+            if recurring:
+                series_id = keys[0].id()
+                recurrence_data = json.loads(self.request.get("recurring-data"))
+                rrule = Recurrence.from_form(recurrence_data).rrule().ical()
+
+            events = []
+            for key, (start_time, end_time) in zip(keys, event_times):
                 event = Event(
+                    key=key,
                     name=cgi.escape(name),
                     start_time=start_time,
                     end_time=end_time,
@@ -1242,15 +2359,14 @@ class NewHandler(webapp2.RequestHandler):
                     teardown=int(self.request.get('teardown') or 0),
                     other_member=other_member,
                     admin_notes=self.request.get('admin_notes'),
-                    wifi_password=generate_wifi_password()
+                    wifi_password=generate_wifi_password(),
+                    series_id=series_id,
+                    recurrence=rrule
                 )
+                events.append(event)
 
-                if not first_event:
-                    first_event = event
-
-                event.put()
-                log = HDLog(event=event, description="Created new event")
-                log.put()
+            Event.put_series(events, "Created new event")
+            first_event = events[0]
 
             # For obvious reasons, we only notify people about the first event in a
             # recurring series.
@@ -1259,7 +2375,7 @@ class NewHandler(webapp2.RequestHandler):
 
         set_cookie(self.response.headers, 'formvalues', None)
 
-        wait_days = _get_user_wait_time()
+        wait_days = wait_days_rpc.get_result()
         self.response.out.write(template.render('templates/confirmation.html', locals()))
 
 
@@ -1604,8 +2720,11 @@ app = webapp2.WSGIApplication([
     ('/event/(\d+).*', EventHandler),
     ('/event/(\d+)\.json', EventHandler),
     # various export methods -- events.{json,rss,ics}
+    ('/events/mine\.ics', MyEventsFeedHandler),
     ('/events\.(.+)', ExportHandler),
+    ('/availability', AvailabilityHandler),
     ('/domaincache', DomainCacheCron),
+    ('/export_snapshots', ExportSnapshotCron),
     ('/logs', LogsHandler),
     ('/feedback/new/(\d+).*', FeedbackHandler),
     ('/expire_suspended', ExpireSuspendedCronHandler),
@@ -3,13 +3,19 @@ from google.appengine.api import urlfetch, memcache, users, mail
 from datetime import datetime, timedelta, time
 from copy import copy
 
+import cPickle as pickle
+import hashlib
 import utils
 from utils import human_username, local_today, to_sentence_list
 import logging
+import math
 import pytz
 import re
+import threading
+import time as _time
 
 from config import Config
+from occupancy import RoomIndex, days_spanned, slot_mask
 
 ROOM_OPTIONS = (
     ('Maker Space', 10),
@@ -24,6 +30,123 @@ EVENT_STATUS = set(
     ['suspended', 'pending', 'understaffed', 'approved', 'not_approved', 'canceled', 'onhold', 'expired', 'deleted'])
 
 
+# Statuses of events that hold on to their rooms, and so can conflict with new
+# bookings.
+BLOCKING_STATUSES = ['approved', 'pending', 'onhold']
+
+# Memcache key for a counter that gets bumped every time an event is written.
+CALENDAR_GENERATION_KEY = 'calendar_generation'
+
+# Memcache key for the length of the longest event that blocks rooms, in
+# minutes.
+LONGEST_EVENT_KEY = 'longest_event'
+
+# When an event changes, the cached data that depends on it, such as
+# occupancy bitmaps and summaries, is replaced with this marker for a little
+# while. That way nobody can cache something they built from the datastore
+# before the change, since caches are only filled in with add.
+CACHE_STALE = 'stale'
+CACHE_STALE_LIFETIME = 30
+
+# Queries that aren't limited to one entity group can take a few seconds to
+# see new writes. For this many seconds after an event is written, a room
+# index filled in from a query might be missing it.
+QUERY_CONSISTENCY_DELAY = 10
+
+# How long to keep the list of changes behind each calendar generation, in
+# seconds, and the most of them that an out-of-date room index will replay
+# before it gives up and starts over.
+CHANGE_LOG_LIFETIME = 60 * 60
+MAX_CHANGES_TO_REPLAY = 100
+
+# How long to keep occupancy bitmaps, in seconds.
+OCCUPANCY_LIFETIME = 24 * 60 * 60
+
+# How long to keep cached event summaries, in seconds. They are thrown out
+# whenever the event changes, so this is only a backstop.
+SUMMARY_LIFETIME = 7 * 24 * 60 * 60
+
+# How long to keep cached counts of coworking-hours events, in seconds. They
+# are marked stale whenever an event on that day changes, so this is only a
+# backstop.
+COWORKING_COUNT_LIFETIME = 24 * 60 * 60
+# The most days to count coworking-hours events for with a single query. A
+# month covers any availability search, and keeps a long series from loading
+# a year of events at once.
+COWORKING_COUNT_SPAN_DAYS = 31
+
+# The most bytes of export snapshot data to keep in each entity, so that they
+# stay under the datastore's limit of 1MB per entity.
+SNAPSHOT_CHUNK_SIZE = 900 * 1024
+
+# The room occupancy index for this instance, and a lock for replacing it.
+_room_index = None
+_room_index_lock = threading.Lock()
+
+
+def _generation_seed():
+    # If the counter gets evicted, restart it somewhere that no index built
+    # before the eviction could possibly be at.
+    return int(_time.time() * 1000000)
+
+
+def calendar_generation():
+    """Return the current calendar generation, or None if memcache is
+    unavailable."""
+    generation = memcache.get(CALENDAR_GENERATION_KEY)
+    if generation is None:
+        memcache.add(CALENDAR_GENERATION_KEY, _generation_seed())
+        generation = memcache.get(CALENDAR_GENERATION_KEY)
+    return generation
+
+
+def _coworking_count_key(day):
+    if isinstance(day, datetime):
+        day = day.date()
+    return 'coworking_events.%s' % day.isoformat()
+
+
+def longest_event_length():
+    """Return the length of the longest event that has ever held on to rooms,
+    as a timedelta."""
+    minutes = memcache.get(LONGEST_EVENT_KEY)
+    if minutes is None:
+        minutes = CalendarStats.get_stats().longest_event
+        memcache.add(LONGEST_EVENT_KEY, minutes)
+    return timedelta(minutes=minutes)
+
+
+def _recent_write_key(second):
+    return 'event_writes.%d' % second
+
+
+def written_recently():
+    """Return True if any event might have been written too recently for
+    queries to see it yet."""
+    now = int(_time.time())
+    keys = [_recent_write_key(second)
+            for second in range(now - QUERY_CONSISTENCY_DELAY, now + 1)]
+    return bool(memcache.get_multi(keys))
+
+
+def _change_log_key(generation):
+    return 'calendar_changes.%d' % generation
+
+
+def _occupancy_key(room, day):
+    return 'occupancy.%s.%s' % (day.isoformat(), room)
+
+
+def _summary_key(event_id):
+    return 'event_summary.%d' % event_id
+
+
+def bump_calendar_generation():
+    """Mark the calendar as changed, and return the new generation."""
+    return memcache.incr(CALENDAR_GENERATION_KEY,
+                         initial_value=_generation_seed())
+
+
 # GUESTS_PER_STAFF = 25
 PENDING_LIFETIME = 30  # days
 # Minimum number of hours before event start during which we can RSVP.
@@ -70,35 +193,464 @@ class Event(db.Model):
 
     wifi_password = db.StringProperty(default="")
 
+    # For events created as part of a recurring series, the id of the first
+    # event in the series, and the RRULE that the series was created from.
+    series_id = db.IntegerProperty()
+    recurrence = db.StringProperty()
+
     @classmethod
     def check_conflict(cls,
                        proposed_start_time, proposed_end_time,
                        setup, teardown,
                        proposed_rooms,
                        optional_existing_event_id = 0):
+      return cls.check_conflicts([(proposed_start_time, proposed_end_time)],
+                                 setup, teardown, proposed_rooms,
+                                 optional_existing_event_id)[0]
+
+    @classmethod
+    def check_conflicts(cls, event_times, setup, teardown, proposed_rooms,
+                        optional_existing_event_id=0):
+      """Check a whole series of proposed bookings for conflicts at once.
+
+      event_times is a list of (start, end) tuples. Returns a list with one
+      entry per tuple, each being the list of events it conflicts with."""
+      return cls.check_conflicts_async(event_times, setup, teardown,
+                                       proposed_rooms,
+                                       optional_existing_event_id)()
+
+    @classmethod
+    def check_conflicts_async(cls, event_times, setup, teardown,
+                              proposed_rooms, optional_existing_event_id=0):
+      """Same as check_conflicts(), but only starts looking up the occupancy
+      bitmaps. Returns a function that finishes the check and returns the
+      conflicts."""
+      windows = [cls._padded_window(start, end, setup, teardown)
+                 for start, end in event_times]
+
+      # Most proposed events don't conflict with anything, and the occupancy
+      # bitmaps can usually tell us that without going to the datastore.
+      maybe_occupied_rpc = cls.maybe_occupied_async(windows, proposed_rooms)
+
+      def finish():
+        maybe_occupied = maybe_occupied_rpc()
+        exact = iter(cls._find_conflicts(
+            [w for w, maybe in zip(windows, maybe_occupied) if maybe],
+            proposed_rooms, optional_existing_event_id))
+        return [exact.next() if maybe else [] for maybe in maybe_occupied]
+
+      return finish
+
+    @classmethod
+    def _find_conflicts(cls, windows, proposed_rooms,
+                        optional_existing_event_id=0):
+      """Find exactly which events conflict with each of a list of padded
+      (start, end) windows."""
+      if not windows:
+        return []
+      span_start = min([start for start, _ in windows])
+      span_end = max([end for _, end in windows])
+
+      days = set()
+      for start, end in windows:
+        days.update(days_spanned(start, end))
+
+      found = {}
+      index = cls.room_index()
+      # The index is only kept up to date from here on, so if it got filled in
+      # from a query that didn't see a recent write yet, it would stay that
+      # way. Until recent writes have had time to show up, don't fill it.
+      if index is None or not index.covers(span_start) or \
+          (index.missing(proposed_rooms, days) and written_recently()):
+        index = None
+      if index is None or \
+          not cls._fill_room_index(index, proposed_rooms, days, found):
+        # Make a throwaway index out of a single fetch covering the series.
+        index = RoomIndex(span_start)
+        cls._fill_room_index(index, proposed_rooms, days, found)
+
+      conflict_ids = []
+      for start, end in windows:
+        ids = index.overlapping(start, end, proposed_rooms)
+        ids.discard(optional_existing_event_id)
+        conflict_ids.append(ids)
+
+      missing = list(set().union(*conflict_ids) - set(found))
+      if missing:
+        for e in cls.get_by_id(missing):
+          if e:
+            found[e.key().id()] = e
+
+      all_conflicts = []
+      for ids in conflict_ids:
+        conflicts = [found[i] for i in ids if i in found]
+        conflicts.sort(key=lambda e: (e.start_time, e.key().id()))
+        all_conflicts.append(conflicts)
+      return all_conflicts
+
+    @classmethod
+    def _fill_room_index(cls, index, rooms, days, found):
+      """Fill in a room index for whichever of these rooms and days it doesn't
+      have yet, with a single fetch bounded by them. The events fetched are put
+      in found, by id. Returns False if the index changed while we were
+      fetching, so they couldn't be added."""
+      missing = index.missing(rooms, days)
+      if not missing:
+        return True
+
+      generation = index.generation
+      rooms = set([room for room, _ in missing])
+      days = set([day for _, day in missing])
+      day_start = datetime.combine(min(days), time())
+      day_end = datetime.combine(max(days), time()) + timedelta(days=1)
+      intervals = []
+      for e in cls.get_blocking_list(day_start, day_end, rooms):
+        intervals.append((e.key().id(), e.start_time, e.end_time, e.rooms))
+        found[e.key().id()] = e
+      return index.fill(generation, rooms, days, intervals)
 
-      # Figure out how long we need to pad the start and end times of the event.
-      # This is more complicated that it seems, because setup and teardown can
-      # overlap, but there still must be a minimum amount of time between
-      # consecutive events.
+    @classmethod
+    def maybe_occupied(cls, windows, rooms):
+      """Quickly check a list of (start, end) windows against the occupancy
+      bitmaps. Returns a list of booleans, one per window, which are False if
+      nothing can possibly be using any of the rooms during that window. Any
+      bitmaps that aren't in memcache are rebuilt from the datastore."""
+      return cls.maybe_occupied_async(windows, rooms)()
+
+    @classmethod
+    def maybe_occupied_async(cls, windows, rooms):
+      """Same as maybe_occupied(), but only starts looking up the bitmaps.
+      Returns a function that waits for them, rebuilds any that are missing,
+      and returns the list of booleans."""
+      masks = {}
+      for start, end in windows:
+        for day in days_spanned(start, end):
+          for room in set(rooms):
+            masks.setdefault((room, day), 0)
+
+      keys = dict((_occupancy_key(room, day), (room, day))
+                  for room, day in masks)
+      rpc = memcache.Client().get_multi_async(keys.keys())
+
+      def finish():
+        cached = rpc.get_result()
+        missing = []
+        for key, room_day in keys.items():
+          if key in cached and cached[key] != CACHE_STALE:
+            masks[room_day] = cached[key]
+          else:
+            missing.append(room_day)
+
+        if missing:
+          logging.debug("Rebuilding %d occupancy bitmaps." % (len(missing)))
+          days = [day for _, day in missing]
+          day_start = datetime.combine(min(days), time())
+          day_end = datetime.combine(max(days), time()) + timedelta(days=1)
+          rebuilt = dict((room_day, 0) for room_day in missing)
+          for e in cls.get_blocking_list(day_start, day_end,
+                                         [room for room, _ in missing]):
+            for day in days_spanned(e.start_time, e.end_time):
+              for room in e.rooms:
+                if (room, day) in rebuilt:
+                  rebuilt[(room, day)] |= slot_mask(day, e.start_time,
+                                                    e.end_time)
+          masks.update(rebuilt)
+
+          # Anything that was marked stale has to stay that way until the mark
+          # runs out, in case we read the datastore before the change that
+          # marked it.
+          memcache.add_multi(dict((_occupancy_key(room, day), mask)
+                                  for (room, day), mask in rebuilt.items()),
+                             time=OCCUPANCY_LIFETIME)
+
+        maybe_occupied = []
+        for start, end in windows:
+          occupied = False
+          for day in days_spanned(start, end):
+            window = slot_mask(day, start, end)
+            for room in set(rooms):
+              if masks[(room, day)] & window:
+                occupied = True
+          maybe_occupied.append(occupied)
+        return maybe_occupied
+
+      return finish
+
+    @classmethod
+    def padding(cls, setup, teardown):
+      """Figure out how long we need to pad the start and end times of an
+      event. This is more complicated that it seems, because setup and teardown
+      can overlap, but there still must be a minimum amount of time between
+      consecutive events. Returns a (start, end) tuple of timedeltas."""
       conf = Config()
       start_padding = max(int(setup), conf.MIN_EVENT_SPACING)
       end_padding = max(int(teardown), conf.MIN_EVENT_SPACING)
+      return timedelta(minutes=start_padding), timedelta(minutes=end_padding)
 
-      proposed_start_time -= timedelta(minutes=start_padding)
-      proposed_end_time   += timedelta(minutes=end_padding)
+    @classmethod
+    def _padded_window(cls, start_time, end_time, setup, teardown):
+      """Figure out the time that a proposed event actually needs its rooms
+      for."""
+      start_padding, end_padding = cls.padding(setup, teardown)
+      return start_time - start_padding, end_time + end_padding
+
+    @classmethod
+    def get_blocking_list(cls, start_time, end_time, rooms):
+      """Fetch every event that holds on to any of these rooms at some point
+      between start_time and end_time. Nothing that overlaps can end any later
+      than the longest event could run past end_time, so the query is bounded
+      on both sides, and doesn't get any slower as the calendar fills up."""
+      rooms = list(set(rooms))
+      if not rooms:
+        return []
+
+      latest_end = end_time + longest_event_length()
       possible_conflicts = cls.all() \
-            .filter('end_time >', proposed_start_time) \
-            .filter('status IN', ['approved', 'pending', 'onhold'])
-      conflicts = []
+            .filter('rooms IN', rooms) \
+            .filter('status IN', BLOCKING_STATUSES) \
+            .filter('end_time >', start_time) \
+            .filter('end_time <', latest_end)
+
+      # Events in more than one room come back more than once.
+      found = {}
       for e in possible_conflicts:
-        if e.key().id() != optional_existing_event_id:
-          if e.start_time < proposed_end_time:
-            for r in e.rooms:
-              if r in proposed_rooms:
-                if e not in conflicts:
-                  conflicts.append(e)
-      return conflicts
+        if e.start_time < end_time:
+          found[e.key().id()] = e
+      return found.values()
+
+    @classmethod
+    def room_index(cls):
+      """Return this instance's room occupancy index. If other instances have
+      changed the calendar since it was last brought up to date, the changes
+      they logged are applied to it. If some of them are missing, it starts
+      over with an empty index, which _find_conflicts() fills in as it needs
+      to. Returns None if we can't tell whether it is up to date."""
+      global _room_index
+
+      generation = calendar_generation()
+      if generation is None:
+        return None
+
+      # Leave a day of slack so that events running right now are covered.
+      since = local_today() - timedelta(days=1)
+      index = _room_index
+      if index is not None and index.since >= since - timedelta(days=1):
+        cls._catch_up(index, generation)
+        if index.generation == generation:
+          return index
+
+      index = RoomIndex(since, generation)
+      with _room_index_lock:
+        _room_index = index
+      return index
+
+    @classmethod
+    def _catch_up(cls, index, generation):
+      """Apply the changes that other instances logged to a room index, until
+      it gets to this generation. If any of them have been thrown out, the
+      index is left out of date."""
+      behind = index.generation
+      if behind is None or not 0 < generation - behind <= MAX_CHANGES_TO_REPLAY:
+        return
+
+      keys = [_change_log_key(g) for g in range(behind + 1, generation + 1)]
+      logged = memcache.get_multi(keys)
+      for g, key in zip(range(behind + 1, generation + 1), keys):
+        if key not in logged:
+          return
+        # A write on this instance might have applied it already.
+        if index.generation < g:
+          index.advance(g, logged[key])
+
+    @classmethod
+    def allocate_keys(cls, count):
+      """Reserve keys for new events all at once, so that we can refer to
+      them before they are saved."""
+      first, last = db.allocate_ids(db.Key.from_path(cls.kind(), 1), count)
+      return [db.Key.from_path(cls.kind(), i) for i in xrange(first, last + 1)]
+
+    @classmethod
+    def put_series(cls, events, description):
+      """Save a set of new events along with an HDLog entry for each. The
+      events must have complete keys, such as ones from allocate_keys(), so
+      the logs can be created as their children before anything is written.
+      That keeps each event and its log in one entity group, and the datastore
+      library splits a put into parallel RPCs of up to 10 entity groups each
+      (DEFAULT_MAX_ENTITY_GROUPS_PER_RPC in datastore_rpc.py), so this takes
+      one RPC for every 10 events, all running at once."""
+      entities = []
+      for e in events:
+        entities.append(e)
+        entities.append(HDLog(parent=e, event=e, description=description))
+      db.put(entities)
+
+      cls.note_changes(events)
+
+    @classmethod
+    def note_changes(cls, events):
+      """Tell everyone that these events were just written. This has to be
+      called after any write that doesn't go through Event.put(), such as
+      db.put() on a list of events."""
+      # Cached data that we have to keep anyone from rebuilding for a little
+      # while, since they might be rebuilding it from before this change.
+      stale_entries = {}
+      for e in events:
+        stale_entries[_summary_key(e.key().id())] = CACHE_STALE
+        for start_time, end_time, rooms in (e._stored_span, e._span()):
+          if not start_time:
+            continue
+          # The coworking-hours counts for every day it was or is on.
+          stale_entries[_coworking_count_key(start_time)] = CACHE_STALE
+          # The occupancy bitmaps for every room and day it touched, too.
+          for day in days_spanned(start_time, end_time or start_time):
+            for room in rooms:
+              stale_entries[_occupancy_key(room, day)] = CACHE_STALE
+        e._stored_span = e._span()
+      # Let everyone know not to trust queries for a little while.
+      stale_entries[_recent_write_key(int(_time.time()))] = CACHE_STALE
+      memcache.set_multi(stale_entries, time=CACHE_STALE_LIFETIME)
+
+      # Conflict queries need to know how long the longest event is.
+      lengths = [e.end_time - e.start_time for e in events
+                 if e.blocks_rooms() and e.end_time]
+      if lengths and max(lengths) > longest_event_length():
+        CalendarStats.raise_longest_event(max(lengths))
+
+      generation = bump_calendar_generation()
+      if generation is None:
+        return
+
+      changes = []
+      for e in events:
+        rooms = e.rooms if e.blocks_rooms() else None
+        changes.append((e.key().id(), e.start_time, e.end_time, rooms))
+      # Other instances replay these to keep their room indexes up to date.
+      memcache.set(_change_log_key(generation), changes,
+                   time=CHANGE_LOG_LIFETIME)
+      index = _room_index
+      if index is not None:
+        index.advance(generation, changes)
+
+    @classmethod
+    def get_summaries(cls, keys):
+      """Get the to_dict(summarize=True) version of a list of events, without
+      loading the whole entity for any that we've summarized before. This is
+      meant to go with a projection query that only gets the keys and sort
+      order, so that listing events doesn't have to read all the big text
+      properties."""
+      cache_keys = [_summary_key(key.id()) for key in keys]
+      cached = memcache.get_multi(cache_keys)
+
+      missing = [key for key, cache_key in zip(keys, cache_keys)
+                 if cached.get(cache_key) in (None, CACHE_STALE)]
+      if missing:
+        rebuilt = {}
+        for event in db.get(missing):
+          if event is None:
+            continue
+          summary = event.to_dict(summarize=True)
+          cached[_summary_key(event.key().id())] = summary
+          rebuilt[_summary_key(event.key().id())] = summary
+        # Use add, so that we don't clobber the marker for an event that
+        # changed after we loaded it.
+        memcache.add_multi(rebuilt, time=SUMMARY_LIFETIME)
+
+      return [cached[cache_key] for cache_key in cache_keys
+              if cached.get(cache_key) not in (None, CACHE_STALE)]
+
+    @classmethod
+    def coworking_hours(cls, day):
+      """Return the earliest and latest times that an event can start on this
+      day and still count as being during coworking hours."""
+      conf = Config()
+      day = day.date() if isinstance(day, datetime) else day
+      return (datetime.combine(day, time(conf.EVENT_HOURS[0])),
+              datetime.combine(day, time(conf.EVENT_HOURS[1])))
+
+    @classmethod
+    def coworking_event_counts(cls, days):
+      """Count the pending and approved events that start during coworking
+      hours on each of a list of days. The counts are kept in memcache, so for
+      a whole series this is usually a single batch lookup, and any that
+      aren't get counted with one query for up to COWORKING_COUNT_SPAN_DAYS
+      at a time. Returns a dict mapping each date to its count."""
+      return cls.coworking_event_counts_async(days)()
+
+    @classmethod
+    def coworking_event_counts_async(cls, days):
+      """Same as coworking_event_counts(), but only starts looking up the
+      cached counts. Returns a function that waits for them, counts any that
+      are missing, and returns the dict of counts."""
+      keys = {}
+      for day in days:
+        day = day.date() if isinstance(day, datetime) else day
+        keys[_coworking_count_key(day)] = day
+
+      rpc = memcache.Client().get_multi_async(keys.keys())
+
+      def finish():
+        counts = {}
+        cached = rpc.get_result()
+        to_cache = {}
+        for key, day in keys.items():
+          if key in cached and cached[key] != CACHE_STALE:
+            counts[day] = cached[key]
+
+        missing = sorted([day for day in keys.values() if day not in counts])
+        while missing:
+          # Get the start time of every event in a stretch of days at once, and
+          # count them up here.
+          span_end = missing[0] + timedelta(days=COWORKING_COUNT_SPAN_DAYS)
+          span = [day for day in missing if day < span_end]
+          missing = missing[len(span):]
+          hours = dict((day, cls.coworking_hours(day)) for day in span)
+          for day in span:
+            counts[day] = 0
+
+          starts = db.Query(cls, projection=('start_time',)) \
+              .filter('start_time >=', hours[span[0]][0]) \
+              .filter('start_time <', hours[span[-1]][1]) \
+              .filter('status IN', ['pending', 'approved'])
+          for event in starts.run(batch_size=1000):
+            day = event.start_time.date()
+            if day in hours and \
+                hours[day][0] <= event.start_time < hours[day][1]:
+              counts[day] += 1
+
+          for day in span:
+            to_cache[_coworking_count_key(day)] = counts[day]
+
+        if to_cache:
+          logging.debug("Counted coworking events for %d days." % \
+                        (len(to_cache)))
+          # Days that were marked stale stay that way until the mark runs out,
+          # in case we counted from before the change.
+          memcache.add_multi(to_cache, time=COWORKING_COUNT_LIFETIME)
+        return counts
+
+      return finish
+
+    def __init__(self, *args, **kwargs):
+        super(Event, self).__init__(*args, **kwargs)
+        # Remember where this event was as of the last time it was stored, so
+        # we know which cached data to throw out if it moves.
+        self._stored_span = (None, None, [])
+        # Projections don't have the properties we need, and can't be put
+        # anyway.
+        if kwargs.get('_from_entity') and not db.model_is_projection(self):
+          self._stored_span = self._span()
+
+    def _span(self):
+        return self.start_time, self.end_time, list(self.rooms)
+
+    def put(self, **kwargs):
+        key = super(Event, self).put(**kwargs)
+        Event.note_changes([self])
+        return key
+
+    def blocks_rooms(self):
+        """Can this event conflict with other bookings?"""
+        return self.status in BLOCKING_STATUSES
 
     @classmethod
     def get_future_events_by_member(cls, member):
@@ -169,11 +721,25 @@ class Event(db.Model):
         return events
 
     @classmethod
-    def get_recent_ongoing_and_future(cls):
-        return cls.all() \
-            .filter('start_time >', local_today()) \
-            .filter('status IN', ['approved', 'canceled']) \
-            .order('start_time').fetch(200)
+    def get_ongoing_and_future_query(cls, since=None, statuses=None,
+                                     summary=False):
+        """Query for approved and canceled events that start after since, or
+        after today if it isn't given. Events that start at the same time are
+        sorted by id, so the order is always the same. If summary is True, the
+        results only have their key and start time, for use with
+        get_summaries()."""
+        query = db.Query(cls, projection=('start_time',)) if summary \
+            else cls.all()
+        query \
+            .filter('start_time >', since or local_today()) \
+            .filter('status IN', statuses or ['approved', 'canceled']) \
+            .order('start_time')
+        # Projections can't be sorted by key. They don't need to be, since
+        # index rows with the same start time are already in key order, and
+        # so is the merge of the queries for each status.
+        if not summary:
+          query.order('__key__')
+        return query
 
     @classmethod
     def get_recent_past_and_future_approved(cls):
@@ -402,6 +968,125 @@ class Event(db.Model):
             return self.url
         return "https://"+self.url
 
+class CalendarStats(db.Model):
+    """Facts about the calendar as a whole that queries rely on. There is only
+    ever one of these."""
+    # The length of the longest event that has ever held on to rooms, in
+    # minutes. Conflict queries use it to put an upper bound on end_time.
+    longest_event = db.IntegerProperty(default=0)
+
+    KEY_NAME = 'calendar'
+
+    @classmethod
+    def get_stats(cls):
+        stats = cls.get_by_key_name(cls.KEY_NAME)
+        if stats is None:
+            # Work it out the slow way, once.
+            logging.info("Calculating the longest event from scratch.")
+            longest = timedelta(0)
+            for e in Event.all().filter('status IN', BLOCKING_STATUSES):
+                if e.end_time and e.end_time - e.start_time > longest:
+                    longest = e.end_time - e.start_time
+            stats = cls.raise_longest_event(longest)
+        return stats
+
+    @classmethod
+    def raise_longest_event(cls, length):
+        """Record that there is an event this long, if it is longer than any
+        we knew about."""
+        minutes = int(math.ceil(length.total_seconds() / 60))
+
+        def txn():
+            stats = cls.get_by_key_name(cls.KEY_NAME)
+            if stats is None:
+                stats = cls(key_name=cls.KEY_NAME)
+            if minutes > stats.longest_event or not stats.is_saved():
+                stats.longest_event = max(minutes, stats.longest_event)
+                stats.put()
+            return stats
+
+        stats = db.run_in_transaction(txn)
+        memcache.set(LONGEST_EVENT_KEY, stats.longest_event)
+        return stats
+
+
+class ExportSnapshot(db.Model):
+    """A copy of one of the export feeds, rendered ahead of time so that feed
+    requests don't have to query for events. The key name is the format of the
+    feed. The feed itself is split into a header, an entry for each event, and a
+    footer, so that it can be patched with events that changed after it was
+    built. Feeds that can't be patched keep everything in the header. The data
+    is stored in ExportSnapshotChunks, since it can be bigger than an entity."""
+    # The calendar generation when we started building it, if we knew it.
+    generation = db.IntegerProperty()
+    # When we started building it, in UTC. Events updated after this might not
+    # be in it.
+    started = db.DateTimeProperty()
+    # The day it was built for. The feeds only start from the current day.
+    day = db.DateTimeProperty()
+    # The host it was built for, if its links depend on the host.
+    host = db.StringProperty()
+    # Whether there were more events than fit in the feed.
+    truncated = db.BooleanProperty(default=False)
+    content_type = db.StringProperty()
+    # Any other response headers that go with it, as JSON.
+    headers = db.TextProperty()
+    # Identifies the chunks that go with this version of the snapshot.
+    version = db.StringProperty()
+    chunk_count = db.IntegerProperty()
+
+    def _chunk_keys(self):
+      return [db.Key.from_path(ExportSnapshotChunk.kind(),
+                               '%s.%s.%d' % (self.key().name(), self.version, i))
+              for i in range(self.chunk_count)]
+
+    @classmethod
+    def save(cls, format, header, entries, footer,
+             chunk_size=SNAPSHOT_CHUNK_SIZE, **kwargs):
+      """Store a new snapshot of a feed, replacing the old one. The chunks get
+      written before the snapshot that points to them, so readers never see a
+      snapshot without its data.
+      header: The start of the feed.
+      entries: A list of (start_time, event id, text) tuples, in the order they
+      appear in the feed.
+      footer: The end of the feed.
+      chunk_size: The most bytes of data to keep in each chunk.
+      Any other arguments are properties of the snapshot.
+      Returns: The new snapshot."""
+      data = pickle.dumps((header, entries, footer), pickle.HIGHEST_PROTOCOL)
+      snapshot = cls(key_name=format, version=hashlib.md5(data).hexdigest(),
+                     **kwargs)
+
+      pieces = [data[i:i + chunk_size]
+                for i in range(0, len(data), chunk_size)]
+      snapshot.chunk_count = len(pieces)
+      # Each chunk is close to the limit on the size of a put, so they go one at
+      # a time.
+      rpcs = [db.put_async(ExportSnapshotChunk(key=key, data=db.Blob(piece)))
+              for key, piece in zip(snapshot._chunk_keys(), pieces)]
+      for rpc in rpcs:
+        rpc.get_result()
+
+      old = cls.get_by_key_name(format)
+      snapshot.put()
+      if old and old.version != snapshot.version:
+        db.delete(old._chunk_keys())
+      return snapshot
+
+    def load(self):
+      """Returns: A tuple of the header, entries and footer that the snapshot
+      was saved with, or None if it has already been replaced."""
+      chunks = db.get(self._chunk_keys())
+      if None in chunks:
+        return None
+      return pickle.loads(''.join([chunk.data for chunk in chunks]))
+
+
+class ExportSnapshotChunk(db.Model):
+    """A piece of the data for an ExportSnapshot."""
+    data = db.BlobProperty()
+
+
 class Feedback(db.Model):
     user = db.UserProperty(auto_current_user_add=True)
     event = db.ReferenceProperty(Event)
@@ -0,0 +1,359 @@
+""" In-memory structures for answering room occupancy questions without
+scanning the whole calendar. Nothing in here talks to the datastore; models.py
+is responsible for filling them in and keeping them up to date. """
+
+
+import random
+import threading
+
+from datetime import datetime, time, timedelta
+
+
+# How long each slot in an occupancy bitmap is, in minutes.
+SLOT_MINUTES = 15
+
+
+""" A single interval stored in an IntervalTree. """
+class _Node(object):
+  __slots__ = ("start", "end", "key", "priority", "max_end", "left", "right")
+
+  def __init__(self, start, end, key):
+    self.start = start
+    self.end = end
+    self.key = key
+    self.priority = random.random()
+    # The latest end time of any interval in this subtree.
+    self.max_end = end
+    self.left = None
+    self.right = None
+
+
+""" Recomputes the cached max_end of a node from its children. """
+def _update(node):
+  node.max_end = node.end
+  if node.left is not None and node.left.max_end > node.max_end:
+    node.max_end = node.left.max_end
+  if node.right is not None and node.right.max_end > node.max_end:
+    node.max_end = node.right.max_end
+
+
+def _rotate_right(node):
+  child = node.left
+  node.left = child.right
+  child.right = node
+  _update(node)
+  _update(child)
+  return child
+
+
+def _rotate_left(node):
+  child = node.right
+  node.right = child.left
+  child.left = node
+  _update(node)
+  _update(child)
+  return child
+
+
+def _insert(node, new):
+  if node is None:
+    return new
+
+  if (new.start, new.key) < (node.start, node.key):
+    node.left = _insert(node.left, new)
+    if node.left.priority > node.priority:
+      return _rotate_right(node)
+  else:
+    node.right = _insert(node.right, new)
+    if node.right.priority > node.priority:
+      return _rotate_left(node)
+
+  _update(node)
+  return node
+
+
+def _merge(left, right):
+  if left is None:
+    return right
+  if right is None:
+    return left
+
+  if left.priority > right.priority:
+    left.right = _merge(left.right, right)
+    _update(left)
+    return left
+  right.left = _merge(left, right.left)
+  _update(right)
+  return right
+
+
+def _remove(node, start, key):
+  if node is None:
+    return None
+
+  if (start, key) == (node.start, node.key):
+    return _merge(node.left, node.right)
+  if (start, key) < (node.start, node.key):
+    node.left = _remove(node.left, start, key)
+  else:
+    node.right = _remove(node.right, start, key)
+
+  _update(node)
+  return node
+
+
+""" A set of half-open [start, end) intervals, each tagged with a key, that can
+report every interval overlapping a given range in O(log n + k) time. It is a
+treap ordered by start time, with every node remembering the latest end time in
+its subtree so that whole branches can be skipped during a search. """
+class IntervalTree(object):
+  def __init__(self):
+    self._root = None
+    self._size = 0
+
+  def __len__(self):
+    return self._size
+
+  """ Adds an interval to the tree.
+  start: The start of the interval.
+  end: The end of the interval.
+  key: Something that identifies the interval. The pair (start, key) must be
+  unique within the tree. """
+  def insert(self, start, end, key):
+    self._root = _insert(self._root, _Node(start, end, key))
+    self._size += 1
+
+  """ Removes an interval that was previously inserted.
+  start: The start of the interval.
+  key: The key that the interval was inserted with. """
+  def remove(self, start, key):
+    self._root = _remove(self._root, start, key)
+    self._size -= 1
+
+  """ Finds every interval that overlaps a range.
+  start: The start of the range.
+  end: The end of the range.
+  Returns: A list of the keys of all the intervals that start before the end of
+  the range and end after the start of it. """
+  def overlapping(self, start, end):
+    found = []
+    to_visit = [self._root]
+    while to_visit:
+      node = to_visit.pop()
+      # Nothing in this subtree ends late enough to overlap.
+      if node is None or node.max_end <= start:
+        continue
+
+      to_visit.append(node.left)
+      # Everything to the right starts at least as late as this node, so if
+      # this one starts too late, they all do.
+      if node.start < end:
+        if node.end > start:
+          found.append(node.key)
+        to_visit.append(node.right)
+
+    return found
+
+
+""" Keeps an IntervalTree for every room, so that we can quickly find which
+events are using any of a set of rooms during a particular time. Only events
+that end after a cutoff time are tracked, so it can only answer questions about
+time ranges that start at or after that cutoff. It starts out empty, and gets
+filled in a room and day at a time. """
+class RoomIndex(object):
+  """ since: The cutoff time. Intervals that end before this are not tracked.
+  generation: An opaque marker for the version of the calendar this index was
+  built from. """
+  def __init__(self, since, generation=None):
+    self.since = since
+    self.generation = generation
+
+    self._trees = {}
+    # Maps keys to the (start, end, rooms) they were added with.
+    self._spans = {}
+    # The (room, date) pairs that everything has been added for.
+    self._filled = set()
+    self._lock = threading.RLock()
+
+  def __len__(self):
+    return len(self._spans)
+
+  def __contains__(self, key):
+    return key in self._spans
+
+  """ Checks whether this index can answer a question about a time range.
+  start: The start of the time range.
+  Returns: True if every interval that could overlap the range is tracked. """
+  def covers(self, start):
+    return start >= self.since
+
+  """ Finds which rooms and days still need filling in before the index can
+  answer questions about them.
+  rooms: The rooms we are interested in.
+  days: The dates we are interested in.
+  Returns: A list of (room, date) tuples. """
+  def missing(self, rooms, days):
+    with self._lock:
+      return [(room, day) for room in set(rooms) for day in days
+              if (room, day) not in self._filled]
+
+  """ Adds every interval for some rooms and days, and remembers that they're
+  complete. If the index changed to another generation since the intervals
+  were looked up, nothing is added, since they could undo the changes.
+  generation: The generation the index was at when the intervals were looked
+  up.
+  rooms: The rooms the intervals were looked up for.
+  days: The dates the intervals were looked up for.
+  intervals: A list of (key, start, end, rooms) tuples for every interval
+  that overlaps any of the days in any of the rooms.
+  Returns: True if they were added. """
+  def fill(self, generation, rooms, days, intervals):
+    with self._lock:
+      if generation != self.generation:
+        return False
+
+      for key, start, end, interval_rooms in intervals:
+        self.add(key, start, end, interval_rooms)
+      self._filled.update([(room, day) for room in rooms for day in days])
+      return True
+
+  """ Adds an interval to the index, replacing anything already stored under
+  the same key.
+  key: Something that identifies the interval, such as an event id.
+  start: The start of the interval.
+  end: The end of the interval.
+  rooms: The rooms that are occupied during the interval. """
+  def add(self, key, start, end, rooms):
+    with self._lock:
+      self.discard(key)
+      if end is None or end <= self.since or not rooms:
+        # There's no way this can conflict with anything we'd be asked about.
+        return
+
+      rooms = tuple(set(rooms))
+      for room in rooms:
+        self._trees.setdefault(room, IntervalTree()).insert(start, end, key)
+      self._spans[key] = (start, end, rooms)
+
+  """ Removes an interval from the index, if it is there.
+  key: The key the interval was added with. """
+  def discard(self, key):
+    with self._lock:
+      span = self._spans.pop(key, None)
+      if not span:
+        return
+
+      start, _, rooms = span
+      for room in rooms:
+        self._trees[room].remove(start, key)
+
+  """ Applies a set of changes that moved the calendar forward by one
+  generation. If this index is not at the generation right before the new
+  one, it has missed some other change, and it is marked as stale instead.
+  generation: The generation the calendar is at after these changes.
+  changes: A list of (key, start, end, rooms) tuples. A rooms value of None
+  means that the interval should be removed. """
+  def advance(self, generation, changes):
+    with self._lock:
+      if self.generation is None or self.generation + 1 != generation:
+        self.generation = None
+        return
+
+      for key, start, end, rooms in changes:
+        if rooms is None:
+          self.discard(key)
+        else:
+          self.add(key, start, end, rooms)
+      self.generation = generation
+
+  """ Finds everything occupying any of a set of rooms during a time range.
+  start: The start of the time range.
+  end: The end of the time range.
+  rooms: The rooms we are interested in.
+  Returns: A set of the keys of all the overlapping intervals. """
+  def overlapping(self, start, end, rooms):
+    keys = set()
+    with self._lock:
+      for room in set(rooms):
+        tree = self._trees.get(room)
+        if tree:
+          keys.update(tree.overlapping(start, end))
+
+    return keys
+
+
+""" Finds the gaps between a set of blocked intervals.
+start: The earliest time we are interested in.
+end: The latest time we are interested in.
+blocked: A list of (start, end) tuples for open intervals that are off limits.
+They can overlap, and don't need to be sorted.
+closed: A list of (start, end) tuples for closed intervals that are off limits,
+ends and all.
+Returns: A sorted list of (start, end, start_excluded, end_excluded) tuples for
+the intervals within [start, end] that don't overlap any of the blocked ones.
+An end is only excluded if it is also the end of a closed interval. """
+def free_windows(start, end, blocked, closed=()):
+  blocks = [(block_start, block_end, False)
+            for block_start, block_end in blocked]
+  blocks.extend([(block_start, block_end, True)
+                 for block_start, block_end in closed])
+
+  windows = []
+  cursor = start
+  cursor_excluded = False
+  for block_start, block_end, block_closed in sorted(blocks):
+    if cursor > end:
+      break
+    if block_end < cursor or (block_end == cursor and \
+                              (cursor_excluded or not block_closed)):
+      # This is entirely behind us.
+      continue
+
+    if block_start > cursor or (block_start == cursor and \
+                                not (cursor_excluded or block_closed)):
+      if block_start <= end:
+        windows.append((cursor, block_start, cursor_excluded, block_closed))
+      else:
+        windows.append((cursor, end, cursor_excluded, False))
+    if block_end > cursor:
+      cursor = block_end
+      cursor_excluded = block_closed
+    else:
+      cursor_excluded = cursor_excluded or block_closed
+
+  if cursor < end or (cursor == end and not cursor_excluded):
+    windows.append((cursor, end, cursor_excluded, False))
+  return windows
+
+
+""" Lists the days that a time range touches.
+start: The start of the range.
+end: The end of the range.
+Returns: A list of dates, in order. """
+def days_spanned(start, end):
+  days = [start.date()]
+  last_day = (end - timedelta(microseconds=1)).date() if end > start else days[0]
+  while days[-1] < last_day:
+    days.append(days[-1] + timedelta(days=1))
+  return days
+
+
+""" Makes an occupancy bitmap for part of a day. Bit n is set if the range
+overlaps the nth SLOT_MINUTES long slot of the day.
+day: The date of the day.
+start: The start of the range.
+end: The end of the range.
+Returns: The bitmap, as an integer. It is zero if the range doesn't overlap the
+day at all. """
+def slot_mask(day, start, end):
+  day_start = datetime.combine(day, time())
+  start = max(start, day_start)
+  end = min(end, day_start + timedelta(days=1))
+  if start >= end:
+    return 0
+
+  slot_seconds = SLOT_MINUTES * 60
+  first = int((start - day_start).total_seconds()) // slot_seconds
+  # Round up, so a range ending partway through a slot still counts for it.
+  last = -(-int((end - day_start).total_seconds()) // slot_seconds)
+  return ((1 << last) - 1) ^ ((1 << first) - 1)
@@ -0,0 +1,212 @@
+""" Expands the rules for recurring events into the times of each occurrence, and
+converts them to and from RFC 5545 RRULE values. """
+
+
+from datetime import date, timedelta
+
+from icalendar.prop import vRecur
+
+
+FREQUENCIES = ("daily", "weekly", "monthly")
+
+# RRULE weekday abbreviations, in the same order as datetime.weekday().
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+DAY_NAMES = ("monday", "tuesday", "wednesday", "thursday", "friday",
+             "saturday", "sunday")
+
+
+""" Finds the date a certain number of weekdays after another one.
+day: The date (or datetime) to start from. It can be on a weekend.
+count: How many weekdays to move forward.
+Returns: The new date, which will always be a weekday if count is positive. """
+def _add_weekdays(day, count):
+  if count <= 0:
+    return day
+
+  # Move to the Friday before day, or day itself if it is a weekday, so that
+  # we're counting from a weekday.
+  back = max(0, day.weekday() - 4)
+  day -= timedelta(days=back)
+  weeks, extra = divmod(count, 5)
+  # If we run off the end of the week, skip over the weekend.
+  if day.weekday() + extra > 4:
+    extra += 2
+  return day + timedelta(days=weeks * 7 + extra)
+
+
+""" Finds a particular weekday within a month, such as the 2nd Tuesday.
+year: The year.
+month: The month.
+week_number: Which occurrence of the weekday we want, from 1 to 4.
+weekday: The day of the week. (As a number, Monday is 0.)
+Returns: The day of the month that it falls on. """
+def _nth_weekday(year, month, week_number, weekday):
+  first = date(year, month, 1).weekday()
+  return 1 + (weekday - first) % 7 + (week_number - 1) * 7
+
+
+""" A rule for repeating an event a certain number of times. """
+class Recurrence(object):
+  """ frequency: One of FREQUENCIES.
+  count: The total number of occurrences, including the first one.
+  weekdays_only: For daily events, whether to skip weekends.
+  week_number: For monthly events, which week of the month they fall in, from
+  1 to 4.
+  weekday: For monthly events, the day of the week they fall on. (As a number,
+  Monday is 0.) """
+  def __init__(self, frequency, count, weekdays_only=False, week_number=None,
+               weekday=None):
+    if frequency not in FREQUENCIES:
+      raise ValueError("Got unknown frequency for recurring event.")
+    if count < 1:
+      raise ValueError("A recurring event must happen at least once.")
+    if frequency == "monthly":
+      if week_number not in (1, 2, 3, 4) or weekday not in range(7):
+        raise ValueError("Monthly events need a week and a day of the week.")
+
+    self.frequency = frequency
+    self.count = count
+    self.weekdays_only = frequency == "daily" and bool(weekdays_only)
+    self.week_number = week_number
+    self.weekday = weekday
+
+  def __eq__(self, other):
+    return isinstance(other, Recurrence) and self._fields() == other._fields()
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __repr__(self):
+    return "Recurrence(%r)" % (self.rrule().ical(),)
+
+  def _fields(self):
+    return (self.frequency, self.count, self.weekdays_only, self.week_number,
+            self.weekday)
+
+  """ Makes a rule from the data that the recurring event form submits.
+  data: The decoded "recurring-data" JSON.
+  Returns: The new Recurrence. """
+  @classmethod
+  def from_form(cls, data):
+    frequency = data["frequency"]
+    week_number = weekday = None
+    if frequency == "monthly":
+      # This is something like "2nd", so we just want the number.
+      week_number = int(data["dayNumber"][0])
+      weekday = DAY_NAMES.index(data["monthDay"].lower())
+
+    return cls(frequency, int(data["repetitions"]),
+               weekdays_only=data.get("weekdaysOnly"),
+               week_number=week_number, weekday=weekday)
+
+  """ Makes a rule from an RRULE value. Only the kinds of rules that we can
+  create ourselves are supported.
+  rrule: Either the text of the RRULE, or a dictionary such as a vRecur.
+  Raises a ValueError if the rule is malformed or not supported.
+  Returns: The new Recurrence. """
+  @classmethod
+  def from_rrule(cls, rrule):
+    if isinstance(rrule, basestring):
+      rrule = vRecur.from_ical(rrule)
+    rrule = vRecur(rrule)
+
+    def single(key, default=None):
+      value = rrule.get(key, default)
+      if isinstance(value, list):
+        if len(value) != 1:
+          raise ValueError("Expected one value for %s in recurrence rule." % key)
+        value = value[0]
+      return value
+
+    unsupported = set(rrule.keys()) - set(["FREQ", "COUNT", "INTERVAL", "BYDAY"])
+    if unsupported:
+      raise ValueError("Unsupported recurrence rule parts: %s" % \
+                       ", ".join(sorted(unsupported)))
+    if single("INTERVAL", 1) != 1:
+      raise ValueError("Recurrence rules with an interval are not supported.")
+    count = single("COUNT")
+    if count is None:
+      raise ValueError("Recurrence rules must have a COUNT.")
+
+    frequency = str(single("FREQ", "")).lower()
+    byday = rrule.get("BYDAY", [])
+    if not isinstance(byday, list):
+      byday = [byday]
+    byday = [str(day).upper() for day in byday]
+
+    if frequency == "daily":
+      if byday and sorted(byday) != sorted(WEEKDAYS[:5]):
+        raise ValueError("Daily rules can only be limited to weekdays.")
+      return cls(frequency, count, weekdays_only=bool(byday))
+
+    if frequency == "weekly":
+      if byday:
+        raise ValueError("Weekly rules can't pick days of the week.")
+      return cls(frequency, count)
+
+    if frequency == "monthly":
+      if len(byday) != 1 or len(byday[0]) != 3 or not byday[0][0].isdigit() or \
+          byday[0][1:] not in WEEKDAYS:
+        raise ValueError("Monthly rules need one day, such as BYDAY=2TU.")
+      return cls(frequency, count, week_number=int(byday[0][0]),
+                 weekday=WEEKDAYS.index(byday[0][1:]))
+
+    raise ValueError("Got unknown frequency for recurring event.")
+
+  """ Returns: The rule as a vRecur, suitable for adding to a VEVENT. """
+  def rrule(self):
+    rrule = vRecur(FREQ=self.frequency.upper(), COUNT=self.count)
+    if self.weekdays_only:
+      rrule["BYDAY"] = list(WEEKDAYS[:5])
+    elif self.frequency == "monthly":
+      rrule["BYDAY"] = "%d%s" % (self.week_number, WEEKDAYS[self.weekday])
+    return rrule
+
+  """ Returns: A short description of how the event repeats. """
+  def describe(self):
+    return "%d repetitions %s." % (self.count, self.frequency)
+
+  """ Checks whether an occurrence on a particular date is one that this rule
+  would produce. Calendar programs count the first occurrence of an RRULE from
+  the event's start, so an RRULE only means the same thing as this rule if the
+  start itself matches.
+  start: The start of the first occurrence.
+  Returns: True if it matches. """
+  def matches(self, start):
+    if self.weekdays_only:
+      return start.weekday() < 5
+    if self.frequency == "monthly":
+      return start.day == _nth_weekday(start.year, start.month,
+                                       self.week_number, self.weekday)
+    return True
+
+  """ Works out when every occurrence is.
+  start: The start of the first occurrence, which is always included as is.
+  Returns: A list of datetimes, one for each occurrence. Each has the same time
+  of day as start. """
+  def expand(self, start):
+    if self.frequency == "weekly":
+      return [start + timedelta(days=7 * i) for i in range(self.count)]
+
+    if self.frequency == "daily":
+      if not self.weekdays_only:
+        return [start + timedelta(days=i) for i in range(self.count)]
+      return [_add_weekdays(start, i) for i in range(self.count)]
+
+    # Each later occurrence is in one of the following months.
+    occurrences = [start]
+    for i in range(1, self.count):
+      year, month = divmod(start.month - 1 + i, 12)
+      year += start.year
+      month += 1
+      day = _nth_weekday(year, month, self.week_number, self.weekday)
+      occurrences.append(start.replace(year=year, month=month, day=day))
+    return occurrences
+
+  """ Works out the start and end of every occurrence.
+  start: The start of the first occurrence.
+  end: The end of the first occurrence.
+  Returns: A list of (start, end) tuples. """
+  def expand_times(self, start, end):
+    length = end - start
+    return [(s, s + length) for s in self.expand(start)]
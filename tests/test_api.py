@@ -25,6 +25,7 @@ class BaseTest(unittest.TestCase):
     self.testbed.activate()
 
     self.testbed.init_datastore_v3_stub()
+    self.testbed.init_memcache_stub()
 
     # Set up testing for application.
     self.test_app = webtest.TestApp(api.app)
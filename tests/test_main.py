@@ -4,16 +4,21 @@
 # dependencies.
 
 import datetime
+import hashlib
 import json
 import os
 import unittest
+import zlib
 
+import webob
 import webtest
 from datetime import timedelta
+from google.appengine.api import memcache
 from google.appengine.api import users
 from google.appengine.ext import db
 from google.appengine.ext import testbed
 
+import keymaster
 import utils
 
 # This has to go before we import the main module so that the correct settings
@@ -24,6 +29,7 @@ os.environ["DJANGO_SETTINGS_MODULE"] = "settings"
 
 from config import Config
 from models import Event
+from recurrence import Recurrence
 import main
 import models
 
@@ -569,6 +575,41 @@ class NewHandlerTest(BaseTest):
 
             last_event = event
 
+    """ Test that a recurring series gets exported as a single calendar event with
+    an RRULE, as long as none of the occurrences have been changed. """
+
+    def test_recurring_ics_export(self):
+        recurring_data = self.recurring_data.copy()
+        params = self.params.copy()
+        recurring_data["frequency"] = "weekly"
+        params["recurring-data"] = json.dumps(recurring_data)
+        params["recurring"] = True
+
+        response = self.test_app.post("/new", params)
+        self.assertEqual(200, response.status_int)
+
+        events = list(Event.all().order("start_time"))
+        self.assertEqual(5, len(events))
+        for event in events:
+            self.assertEqual(events[0].key().id(), event.series_id)
+            self.assertEqual(Recurrence("weekly", 5),
+                             Recurrence.from_rrule(event.recurrence))
+            event.status = "approved"
+            event.put()
+
+        response = self.test_app.get("/events.ics")
+        self.assertEqual(1, response.body.count("BEGIN:VEVENT"))
+        self.assertEqual(1, response.body.count("RRULE:"))
+
+        # If one of them moves, we have to list them all separately.
+        events[2].start_time += datetime.timedelta(hours=1)
+        events[2].end_time += datetime.timedelta(hours=1)
+        events[2].put()
+
+        response = self.test_app.get("/events.ics")
+        self.assertEqual(5, response.body.count("BEGIN:VEVENT"))
+        self.assertNotIn("RRULE:", response.body)
+
     """ Test that it properly detects trying to add too many events at once. """
 
     def test_recurring_event_limit(self):
@@ -652,6 +693,536 @@ class NewHandlerTest(BaseTest):
         self.assertIn("Main Space", response.body)
 
 
+""" Tests that the availability handler finds the right open slots. """
+class AvailabilityHandlerTest(BaseTest):
+    def setUp(self):
+        super(AvailabilityHandlerTest, self).setUp()
+
+        self.day = local_today() + datetime.timedelta(days=5)
+        start = self.day.replace(hour=12)
+        self.event = models.Event(name="Test Event", start_time=start,
+                                  end_time=start + datetime.timedelta(hours=1),
+                                  type="Meetup", estimated_size="10", setup=15,
+                                  teardown=15, details="This is a test event.",
+                                  rooms=[models.ROOM_OPTIONS[0][0]])
+        self.event.put()
+
+        date = "%d/%d/%d" % (self.day.month, self.day.day, self.day.year)
+        self.params = {"rooms": models.ROOM_OPTIONS[0][0], "start_date": date,
+                       "end_date": date, "duration": "60", "setup": "15",
+                       "teardown": "15"}
+
+    def _get_slots(self, params):
+        response = self.test_app.get("/availability", params)
+        self.assertEqual(200, response.status_int)
+        return [(slot["start"], slot["end"], slot["start_excluded"],
+                 slot["end_excluded"])
+                for slot in json.loads(response.body)["slots"]]
+
+    def _time(self, hour, minute=0):
+        return self.day.replace(hour=hour, minute=minute).strftime(
+            "%Y-%m-%dT%H:%M:%S")
+
+    """ Tests that it leaves room around existing events. """
+    def test_get(self):
+        slots = self._get_slots(self.params)
+
+        end_of_day = (self.day + datetime.timedelta(days=1)).strftime(
+            "%Y-%m-%dT%H:%M:%S")
+        if self.day.weekday() <= 4:
+            # Nothing else can start during coworking hours that day, including
+            # right at 9:00 or 17:00.
+            self.assertEqual([(self._time(0), self._time(10), False, True),
+                              (self._time(17), end_of_day, True, False)], slots)
+        else:
+            # An hour long event has to end 30 minutes before ours starts, and
+            # start 30 minutes after it ends.
+            self.assertEqual([(self._time(0), self._time(11, 30), False, False),
+                              (self._time(13, 30), end_of_day, False, False)],
+                             slots)
+
+        # Other rooms should be completely open on the weekend.
+        params = self.params.copy()
+        params["rooms"] = models.ROOM_OPTIONS[1][0]
+        if self.day.weekday() > 4:
+            self.assertEqual([(self._time(0), end_of_day, False, False)],
+                             self._get_slots(params))
+
+    """ Tests that it gives an error for bad parameters. """
+    def test_bad_params(self):
+        for name, value in (("rooms", ""), ("duration", "0"),
+                            ("duration", "an hour"), ("start_date", "soon")):
+            params = self.params.copy()
+            params[name] = value
+
+            response = self.test_app.get("/availability", params,
+                                         expect_errors=True)
+            self.assertEqual(400, response.status_int)
+            self.assertIn("error", json.loads(response.body))
+
+
+""" Tests that the export handler serves the right feeds. """
+class ExportHandlerTest(BaseTest):
+    def setUp(self):
+        super(ExportHandlerTest, self).setUp()
+
+        self.event = self._make_events(1)[0]
+        self.event.status = "approved"
+        self.event.put()
+
+        # Don't use anything rendered by other tests.
+        main._vevent_cache = utils.LRUCache(100)
+
+    """ Tests that feeds get cached until an event changes. """
+    def test_cache(self):
+        response = self.test_app.get("/events.ics")
+        self.assertEqual(200, response.status_int)
+        self.assertIn("Test Event", response.body)
+        self.assertEqual({"hits": 0, "misses": 1},
+                         main.ExportHandler.cache_stats())
+
+        # The second time should come from the cache.
+        cached = self.test_app.get("/events.ics")
+        self.assertEqual(response.body, cached.body)
+        self.assertEqual(response.headers["content-type"],
+                         cached.headers["content-type"])
+        self.assertEqual({"hits": 1, "misses": 1},
+                         main.ExportHandler.cache_stats())
+
+        # Different formats and parameters are cached separately.
+        self.test_app.get("/events.csv")
+        self.test_app.get("/events.json", {"status": "approved"})
+        self.assertEqual({"hits": 1, "misses": 3},
+                         main.ExportHandler.cache_stats())
+
+        # Changing an event should make it render the feed again.
+        self.event.name = "Renamed Event"
+        self.event.put()
+        response = self.test_app.get("/events.ics")
+        self.assertIn("Renamed Event", response.body)
+        self.assertEqual({"hits": 1, "misses": 4},
+                         main.ExportHandler.cache_stats())
+
+
+    """ Tests that clients with an up to date copy of a feed get a 304. """
+    def test_conditional_get(self):
+        response = self.test_app.get("/events.ics")
+        etag = response.headers["ETag"]
+        last_modified = response.headers["Last-Modified"]
+
+        response = self.test_app.get("/events.ics",
+                                     headers={"If-None-Match": etag})
+        self.assertEqual(304, response.status_int)
+        self.assertEqual("", response.body)
+        # That shouldn't have needed to touch the cache at all.
+        self.assertEqual({"hits": 0, "misses": 1},
+                         main.ExportHandler.cache_stats())
+
+        response = self.test_app.get("/events.ics",
+            headers={"If-Modified-Since": last_modified})
+        self.assertEqual(304, response.status_int)
+
+        # Once something changes, they should get the new version.
+        self.event.name = "Renamed Event"
+        self.event.put()
+        response = self.test_app.get("/events.ics",
+                                     headers={"If-None-Match": etag})
+        self.assertEqual(200, response.status_int)
+        self.assertNotEqual(etag, response.headers["ETag"])
+        self.assertIn("Renamed Event", response.body)
+
+
+    """ Tests that feeds get served from the snapshots that the cron job
+    builds. """
+    def test_snapshots(self):
+        self.test_app.get("/export_snapshots")
+        for format in main.ExportHandler.SNAPSHOT_FORMATS:
+            self.assertTrue(models.ExportSnapshot.get_by_key_name(format))
+
+        # If nothing has changed since, they get used as is.
+        models.ExportSnapshot.save("json", '["snapshot"]', [], "",
+                                   generation=models.calendar_generation(),
+                                   started=datetime.datetime.utcnow(),
+                                   day=local_today(),
+                                   content_type="application/json",
+                                   headers="{}")
+        response = self.test_app.get("/events.json")
+        self.assertEqual('["snapshot"]', response.body)
+
+        # Events that changed since get patched in.
+        self.event.name = "Renamed Event"
+        self.event.put()
+        other_event = self._make_events(1, offset=3)[0]
+        other_event.name = "Other Event"
+        other_event.status = "approved"
+        other_event.put()
+
+        response = self.test_app.get("/events.ics")
+        self.assertEqual(2, response.body.count("BEGIN:VEVENT"))
+        self.assertNotIn("Test Event", response.body)
+        self.assertLess(response.body.index("Renamed Event"),
+                        response.body.index("Other Event"))
+
+        response = self.test_app.get("/events.csv")
+        self.assertNotIn("Test Event", response.body)
+        self.assertLess(response.body.index("Renamed Event"),
+                        response.body.index("Other Event"))
+
+
+    """ Tests that feeds get compressed for clients that can take it. """
+    def test_compression(self):
+        plain = self._raw_get("/events.ics")
+        self.assertNotIn("Content-Encoding", plain.headers)
+        self.assertEqual("Accept-Encoding", plain.headers["Vary"])
+        self.assertTrue(plain.body.startswith("BEGIN:VCALENDAR"))
+
+        # Clients that don't accept an encoding shouldn't get it.
+        for header in ("", "identity", "gzip;q=0", "deflate;q=0, identity"):
+            response = self._raw_get("/events.ics",
+                                     {"Accept-Encoding": header})
+            self.assertNotIn("Content-Encoding", response.headers)
+            self.assertEqual(plain.body, response.body)
+            self.assertEqual(plain.headers["ETag"], response.headers["ETag"])
+
+        decoders = {"gzip": lambda body: zlib.decompress(body, 16 + zlib.MAX_WBITS),
+                    "deflate": zlib.decompress}
+        for encoding, decode in decoders.iteritems():
+            response = self._raw_get("/events.ics",
+                {"Accept-Encoding": "%s, identity" % encoding})
+            self.assertEqual(encoding, response.headers["Content-Encoding"])
+            self.assertEqual(plain.body, decode(response.body))
+            self.assertNotEqual(plain.headers["ETag"], response.headers["ETag"])
+
+            response = self._raw_get("/events.ics",
+                {"Accept-Encoding": encoding,
+                 "If-None-Match": response.headers["ETag"]})
+            self.assertEqual(304, response.status_int)
+
+        # The compressed versions should have come from the cache.
+        self.assertEqual({"hits": 6, "misses": 1},
+                         main.ExportHandler.cache_stats())
+
+        # Full history exports aren't cached, so they don't get compressed.
+        response = self._raw_get("/events.csv?since=2015-01-01",
+                                 {"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", response.headers)
+
+    """ Makes a request without going through WebTest, which would decompress
+    the response.
+    url: The URL to get.
+    headers: Any request headers.
+    Returns: The response. """
+    def _raw_get(self, url, headers={}):
+        return webob.Request.blank(url, headers=headers).get_response(main.app)
+
+
+    """ Tests that only events that changed get rendered again. """
+    def test_vevent_cache(self):
+        other_event = self._make_events(1, offset=3)[0]
+        other_event.status = "approved"
+        other_event.put()
+
+        response = self.test_app.get("/events.ics")
+        self.assertEqual(2, response.body.count("BEGIN:VEVENT"))
+        self.assertEqual(2, len(main._vevent_cache))
+
+        # If only one event changes, it should reuse the other one.
+        self.event.name = "Renamed Event"
+        self.event.put()
+        response = self.test_app.get("/events.ics")
+        self.assertEqual(2, response.body.count("BEGIN:VEVENT"))
+        self.assertIn("Renamed Event", response.body)
+        self.assertEqual(3, len(main._vevent_cache))
+
+        # Another instance should be able to use them from memcache.
+        main._vevent_cache = utils.LRUCache(100)
+        self.event.name = "Test Event"
+        self.event.put()
+        self.test_app.get("/events.ics")
+        self.assertEqual(2, len(main._vevent_cache))
+        # The updated time that got stored isn't the one on our copy.
+        other_event = Event.get(other_event.key())
+        self.assertTrue(memcache.get("vevent.ics.%d.%s.%s" % (
+            other_event.key().id(), other_event.updated.isoformat(),
+            hashlib.md5("").hexdigest())))
+
+
+    """ Tests that older events can be exported with the since parameter. """
+    def test_since(self):
+        start = local_today() - datetime.timedelta(days=10, hours=-12)
+        old_event = models.Event(name="Old Event", start_time=start,
+                                 end_time=start + datetime.timedelta(hours=1),
+                                 type="Meetup", estimated_size="10",
+                                 details="This is a test event.",
+                                 rooms=[models.ROOM_OPTIONS[0][0]],
+                                 status="approved")
+        old_event.put()
+
+        for format in ("csv", "ics", "large_ics"):
+            response = self.test_app.get("/events.%s" % format)
+            self.assertIn("Test Event", response.body)
+            self.assertNotIn("Old Event", response.body)
+
+            since = (local_today() - datetime.timedelta(days=30)).strftime(
+                "%Y-%m-%d")
+            response = self.test_app.get("/events.%s" % format,
+                                         {"since": since})
+            self.assertIn("Test Event", response.body)
+            self.assertIn("Old Event", response.body)
+
+        response = self.test_app.get("/events.csv", {"since": "last year"},
+                                     expect_errors=True)
+        self.assertEqual(400, response.status_int)
+
+
+    """ Tests that the regular feeds are cut off after FEED_LIMIT events, but
+    exports with the since parameter aren't. """
+    def test_feed_limit(self):
+        for event in self._make_events(2, offset=1, time=15):
+            event.status = "approved"
+            event.put()
+
+        old_limit = main.ExportHandler.FEED_LIMIT
+        main.ExportHandler.FEED_LIMIT = 2
+        try:
+            response = self.test_app.get("/events.csv")
+            self.assertEqual(2, response.body.count("Test Event"))
+
+            since = local_today().strftime("%Y-%m-%d")
+            response = self.test_app.get("/events.csv", {"since": since})
+            self.assertEqual(3, response.body.count("Test Event"))
+
+            # A snapshot of a feed that was cut off can't be patched.
+            self.test_app.get("/export_snapshots")
+            self.assertTrue(models.ExportSnapshot.get_by_key_name("csv").truncated)
+            self.event.name = "Renamed Event"
+            self.event.put()
+            response = self.test_app.get("/events.csv")
+            self.assertIn("Renamed Event", response.body)
+            self.assertEqual(1, response.body.count("Test Event"))
+        finally:
+            main.ExportHandler.FEED_LIMIT = old_limit
+
+
+    """ Tests that the JSON export can be paged through. """
+    def test_json_pages(self):
+        for event in self._make_events(4, offset=1, time=15):
+            event.status = "approved"
+            event.put()
+
+        ids = []
+        url = "/events.json?limit=2&fields=id,name"
+        pages = 0
+        while url:
+            response = self.test_app.get(url)
+            page = json.loads(response.body)
+            self.assertLessEqual(len(page), 2)
+            for event in page:
+                self.assertEqual(set(["id", "name"]), set(event.keys()))
+                ids.append(event["id"])
+            pages += 1
+
+            url = None
+            link = response.headers.get("Link")
+            if link:
+                # Pull the path out of '<http://host/path>; rel="next"'.
+                url = link[link.index("/events.json"):link.index(">")]
+
+        self.assertEqual(3, pages)
+        expected = [e.key().id() for e in
+                    Event.all().order("start_time").order("__key__")]
+        self.assertEqual(expected, ids)
+
+    """ Tests that the JSON export rejects bad parameters. """
+    def test_json_bad_params(self):
+        for params in ({"limit": "0"}, {"limit": "lots"}, {"fields": "wifi_password"},
+                       {"status": "pending"}, {"cursor": "nonsense"}):
+            response = self.test_app.get("/events.json", params,
+                                         expect_errors=True)
+            self.assertEqual(400, response.status_int)
+
+        # Filters that aren't on the list are ignored.
+        response = self.test_app.get("/events.json", {"name": "Nope"})
+        self.assertEqual(1, len(json.loads(response.body)))
+
+
+""" Tests for the feeds of members' own events. """
+class MyEventsFeedTest(BaseTest):
+    def setUp(self):
+        super(MyEventsFeedTest, self).setUp()
+
+        self.event = self._make_events(1)[0]
+        # Don't use the secret from another test's datastore.
+        main._feed_token_key = None
+        self.token = main.feed_token(users.User("testy.testerson@gmail.com"))
+
+    """ Tests that only valid tokens get a feed. """
+    def test_tokens(self):
+        response = self.test_app.get("/events/mine.ics", {"token": self.token})
+        self.assertEqual(200, response.status_int)
+        self.assertIn("Test Event", response.body)
+
+        other_token = main.feed_token(users.User("someone.else@gmail.com"))
+        for token in ("", "garbage", self.token[:-1], other_token.split(".")[0] +
+                      "." + self.token.split(".")[1]):
+            response = self.test_app.get("/events/mine.ics", {"token": token},
+                                         expect_errors=True)
+            self.assertEqual(403, response.status_int)
+
+        # Someone else's token shouldn't get our events.
+        response = self.test_app.get("/events/mine.ics", {"token": other_token})
+        self.assertNotIn("Test Event", response.body)
+
+    """ Tests that the secret tokens are signed with never changes once it's
+    made, even if another instance tries to make its own at the same time. """
+    def test_token_key(self):
+        key = main._get_feed_token_key()
+        main._feed_token_key = None
+        keymaster.Keymaster.encrypt_once(main.FEED_TOKEN_KEY_NAME, "other")
+        self.assertEqual(key, main._get_feed_token_key())
+        self.assertEqual(self.token, main.feed_token(
+            users.User("testy.testerson@gmail.com")))
+
+    """ Tests that the feed only covers the window that was asked for, and that
+    clients with the current version get a 304. """
+    def test_window(self):
+        later_event = self._make_events(1, offset=60)[0]
+        later_event.name = "Later Event"
+        later_event.put()
+
+        response = self.test_app.get("/events/mine.ics", {"token": self.token})
+        self.assertIn("Later Event", response.body)
+        end = (local_today() + datetime.timedelta(days=30)).strftime("%Y-%m-%d")
+        response = self.test_app.get("/events/mine.ics",
+                                     {"token": self.token, "end": end})
+        self.assertIn("Test Event", response.body)
+        self.assertNotIn("Later Event", response.body)
+
+        etag = response.headers["ETag"]
+        response = self.test_app.get("/events/mine.ics",
+                                     {"token": self.token, "end": end},
+                                     headers={"If-None-Match": etag})
+        self.assertEqual(304, response.status_int)
+
+        # Changing any of their events should change the feed.
+        later_event.name = "Renamed Event"
+        later_event.put()
+        response = self.test_app.get("/events/mine.ics",
+                                     {"token": self.token, "end": end},
+                                     headers={"If-None-Match": etag})
+        self.assertEqual(200, response.status_int)
+
+        for params in ({"start": "last week"}, {"end": "2015-01-01"},
+                       {"start": "2015-01-01", "end": "2020-01-01"}):
+            params["token"] = self.token
+            response = self.test_app.get("/events/mine.ics", params,
+                                         expect_errors=True)
+            self.assertEqual(400, response.status_int)
+
+    """ Tests that clients can get just the events that changed. """
+    def test_sync(self):
+        # Don't hold back the sequence numbers, so that we can see exactly what
+        # changed.
+        self.addCleanup(setattr, main.MyEventsFeedHandler, "SYNC_MARGIN",
+                        main.MyEventsFeedHandler.SYNC_MARGIN)
+        main.MyEventsFeedHandler.SYNC_MARGIN = datetime.timedelta(0)
+
+        response = self.test_app.get("/events/mine.ics", {"token": self.token})
+        sequence = response.headers["X-Sequence"]
+
+        response = self.test_app.get("/events/mine.ics",
+                                     {"token": self.token, "sequence": sequence})
+        self.assertEqual(0, response.body.count("BEGIN:VEVENT"))
+        self.assertEqual(sequence, response.headers["X-Sequence"])
+
+        other_event = self._make_events(1, offset=3)[0]
+        self.event.status = "deleted"
+        self.event.put()
+        response = self.test_app.get("/events/mine.ics",
+                                     {"token": self.token, "sequence": sequence})
+        self.assertEqual(2, response.body.count("BEGIN:VEVENT"))
+        self.assertIn("(DELETED)", response.body)
+        self.assertLess(response.body.index("(PENDING)"),
+                        response.body.index("(DELETED)"))
+        self.assertGreater(int(response.headers["X-Sequence"]), int(sequence))
+
+        # They get paged through if there are too many.
+        main.MyEventsFeedHandler.MAX_EVENTS = 1
+        try:
+            response = self.test_app.get("/events/mine.ics",
+                {"token": self.token, "sequence": sequence})
+            self.assertIn("(PENDING)", response.body)
+            response = self.test_app.get("/events/mine.ics",
+                {"token": self.token, "sequence": response.headers["X-Sequence"]})
+            self.assertIn("(DELETED)", response.body)
+            self.assertNotIn("(PENDING)", response.body)
+        finally:
+            main.MyEventsFeedHandler.MAX_EVENTS = 500
+
+    """ Tests that syncing doesn't skip an event that was still being written
+    during the last sync, even though it was updated before that sync's
+    sequence number. """
+    def test_sync_margin(self):
+        response = self.test_app.get("/events/mine.ics", {"token": self.token})
+        sequence = int(response.headers["X-Sequence"])
+        # Our event was only just written, so the sequence number shouldn't
+        # claim to cover it yet.
+        updated = Event.get(self.event.key()).updated
+        self.assertLess(sequence, main._sequence(updated))
+
+        response = self.test_app.get("/events/mine.ics",
+                                     {"token": self.token, "sequence": sequence})
+        self.assertEqual(1, response.body.count("BEGIN:VEVENT"))
+        self.assertLessEqual(int(response.headers["X-Sequence"]),
+                             main._sequence(updated))
+
+        # Once it's been long enough, the sequence number moves past it.
+        self.addCleanup(setattr, main.MyEventsFeedHandler, "SYNC_MARGIN",
+                        main.MyEventsFeedHandler.SYNC_MARGIN)
+        main.MyEventsFeedHandler.SYNC_MARGIN = datetime.timedelta(0)
+        response = self.test_app.get("/events/mine.ics",
+                                     {"token": self.token, "sequence": sequence})
+        sequence = response.headers["X-Sequence"]
+        self.assertEqual(main._sequence(updated), int(sequence))
+        response = self.test_app.get("/events/mine.ics",
+                                     {"token": self.token, "sequence": sequence})
+        self.assertEqual(0, response.body.count("BEGIN:VEVENT"))
+
+
+""" Tests for the sliding window behind the four-week event limit. """
+class FourWeekLimitTest(unittest.TestCase):
+    def setUp(self):
+        self.base = datetime.datetime(month=1, day=1, year=2015, hour=12)
+
+    def _days(self, *days):
+        return [self.base + datetime.timedelta(days=day) for day in days]
+
+    """ Tests that it allows exactly the limit, but not one more. """
+    def test_limit(self):
+        self.assertFalse(main._violates_four_week_limit(
+            self._days(0, 1, 2, 3, 4), self._days(5), 6))
+        self.assertTrue(main._violates_four_week_limit(
+            self._days(0, 1, 2, 3, 4, 5), self._days(6), 6))
+        # Four weeks apart still counts as the same period.
+        self.assertTrue(main._violates_four_week_limit(
+            self._days(0, 1, 2, 3, 4, 5), self._days(28), 6))
+        self.assertFalse(main._violates_four_week_limit(
+            self._days(0, 1, 2, 3, 4, 5), self._days(34), 6))
+
+    """ Tests that every event in a series gets checked, not just the first
+    one. """
+    def test_later_occurrence(self):
+        self.assertTrue(main._violates_four_week_limit(
+            self._days(60, 61, 62, 63, 64, 65), self._days(0, 7, 66), 6))
+
+    """ Tests that a series can violate the limit all by itself. """
+    def test_series_only(self):
+        self.assertTrue(main._violates_four_week_limit(
+            [], self._days(0, 1, 2, 3, 4, 5, 6), 6))
+        self.assertFalse(main._violates_four_week_limit(
+            [], self._days(0, 7, 14, 21, 28, 35, 42), 6))
+
+
 """ Tests that the edit event handler works properly. """
 class EditHandlerTest(BaseTest):
     def setUp(self):
@@ -5,10 +5,15 @@
 import appengine_config
 
 import datetime
+import random
+import time
 import unittest
 
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.api import memcache
 from google.appengine.ext import testbed
 
+from utils import local_today
 import models
 
 
@@ -20,6 +25,10 @@ class EventTest(unittest.TestCase):
 
     self.testbed.init_datastore_v3_stub()
     self.testbed.init_user_stub()
+    self.testbed.init_memcache_stub()
+
+  def tearDown(self):
+    self.testbed.deactivate()
 
   """ Tests that we can detect conflicts successfully. """
   def test_conflict_detection(self):
@@ -86,3 +95,468 @@ class EventTest(unittest.TestCase):
     conflicts = models.Event.check_conflict(new_start_time, new_end_time, 15,
                                             15, ["Classroom"])
     self.assertEqual(event.key().id(), conflicts[0].key().id())
+
+  """ Makes a random set of events, starting a few days from now. Returns a list
+  of the events created. """
+  def _make_random_calendar(self, num_events, rng):
+    rooms = [room for room, _ in models.ROOM_OPTIONS]
+    base = local_today() + datetime.timedelta(days=3)
+    statuses = list(models.EVENT_STATUS)
+
+    events = []
+    for i in range(0, num_events):
+      start_time = base + datetime.timedelta(minutes=15 * rng.randint(0, 800))
+      end_time = start_time + datetime.timedelta(minutes=15 * rng.randint(1, 24))
+      event = models.Event(name="Event %d" % (i), start_time=start_time,
+                           end_time=end_time, type="Meetup",
+                           estimated_size="10", setup=15, teardown=15,
+                           details="This is a test event.",
+                           status=rng.choice(statuses),
+                           rooms=rng.sample(rooms, rng.randint(1, 2)))
+      event.put()
+      events.append(event)
+
+    return events
+
+  """ Finds conflicts the slow way, by going through every event that ends after
+  the start of the window. Returns a list of the conflicting events, in the same
+  order check_conflict() uses. """
+  def _scan_conflicts(self, padded_start_time, padded_end_time, proposed_rooms,
+                      optional_existing_event_id=0):
+    possible_conflicts = models.Event.all() \
+          .filter("end_time >", padded_start_time) \
+          .filter("status IN", models.BLOCKING_STATUSES)
+    conflicts = []
+    for e in possible_conflicts:
+      if e.key().id() != optional_existing_event_id:
+        if e.start_time < padded_end_time:
+          for r in e.rooms:
+            if r in proposed_rooms:
+              if e not in conflicts:
+                conflicts.append(e)
+    conflicts.sort(key=lambda e: (e.start_time, e.key().id()))
+    return conflicts
+
+  """ Checks that the room index finds exactly the same conflicts as scanning
+  the datastore does for a bunch of random proposed events. """
+  def _check_index_parity(self, events, rng):
+    rooms = [room for room, _ in models.ROOM_OPTIONS]
+    base = local_today() + datetime.timedelta(days=3)
+
+    for _ in range(0, 50):
+      start_time = base + datetime.timedelta(minutes=15 * rng.randint(0, 800))
+      end_time = start_time + datetime.timedelta(minutes=15 * rng.randint(1, 24))
+      setup = rng.choice([0, 15, 45])
+      teardown = rng.choice([0, 15, 45])
+      proposed_rooms = rng.sample(rooms, rng.randint(1, 3))
+      existing_id = rng.choice(events).key().id()
+
+      conflicts = models.Event.check_conflict(start_time, end_time, setup,
+                                              teardown, proposed_rooms,
+                                              existing_id)
+
+      padded_start = start_time - datetime.timedelta(minutes=max(setup, 30))
+      padded_end = end_time + datetime.timedelta(minutes=max(teardown, 30))
+      expected = self._scan_conflicts(padded_start, padded_end, proposed_rooms,
+                                      existing_id)
+
+      self.assertEqual([e.key().id() for e in expected],
+                       [e.key().id() for e in conflicts])
+
+  """ Pretends that enough time has gone by for queries to see every event that
+  has been written. """
+  def _let_writes_settle(self):
+    now = int(time.time())
+    memcache.delete_multi([models._recent_write_key(second) for second in
+                           range(now - models.QUERY_CONSISTENCY_DELAY, now + 1)])
+
+  """ Tests that the room index gives the same answers as the datastore on
+  randomized calendars, including after events change status. """
+  def test_room_index_parity(self):
+    rng = random.Random(42)
+    events = self._make_random_calendar(60, rng)
+
+    # Right after the writes, it shouldn't fill in the index at all.
+    self._check_index_parity(events, rng)
+    self.assertEqual(0, len(models.Event.room_index()))
+
+    # But after that, it should fill it in from the datastore.
+    self._let_writes_settle()
+    self._check_index_parity(events, rng)
+    self.assertNotEqual(0, len(models.Event.room_index()))
+
+    # Change some events around, and make sure the index keeps up.
+    for event in rng.sample(events, 20):
+      event.status = rng.choice(list(models.EVENT_STATUS))
+      event.start_time += datetime.timedelta(hours=rng.randint(-5, 5))
+      event.end_time = event.start_time + datetime.timedelta(hours=1)
+      event.put()
+    self._check_index_parity(events, rng)
+
+    # If someone else changes the calendar, it should apply their changes.
+    index = models.Event.room_index()
+    models._room_index = None
+    for event in rng.sample(events, 10):
+      event.status = rng.choice(list(models.EVENT_STATUS))
+      event.start_time += datetime.timedelta(hours=rng.randint(-5, 5))
+      event.end_time = event.start_time + datetime.timedelta(hours=1)
+      event.put()
+    models._room_index = index
+    self.assertIs(index, models.Event.room_index())
+    self._check_index_parity(events, rng)
+
+    # But if it can't tell what they changed, it should rebuild.
+    self._let_writes_settle()
+    models.bump_calendar_generation()
+    self.assertIsNot(index, models.Event.room_index())
+    self._check_index_parity(events, rng)
+
+  """ Tests that the index doesn't get filled in just after another instance
+  wrote an event, since the query it was filled from might have missed it. """
+  def test_room_index_recent_writes(self):
+    start_time = local_today() + datetime.timedelta(days=3, hours=10)
+    end_time = start_time + datetime.timedelta(hours=2)
+    event = models.Event(name="Test Event", start_time=start_time,
+                         end_time=end_time, type="Meetup",
+                         estimated_size="10", setup=15, teardown=15,
+                         details="This is a test event.", rooms=["Classroom"])
+    event.put()
+
+    # Pretend this instance has never built an index.
+    models._room_index = None
+    conflicts = models.Event.check_conflict(start_time, end_time, 0, 0,
+                                            ["Classroom"])
+    self.assertEqual([event.key()], [e.key() for e in conflicts])
+    self.assertEqual([("Classroom", start_time.date())],
+                     models.Event.room_index().missing(["Classroom"],
+                                                       [start_time.date()]))
+
+    self._let_writes_settle()
+    conflicts = models.Event.check_conflict(start_time, end_time, 0, 0,
+                                            ["Classroom"])
+    self.assertEqual([event.key()], [e.key() for e in conflicts])
+    self.assertEqual([], models.Event.room_index().missing(
+        ["Classroom"], [start_time.date()]))
+
+  """ Tests that the index only gets filled in for the rooms and days that are
+  being checked, so it doesn't load the whole future calendar. """
+  def test_room_index_bounded_fill(self):
+    start_time = local_today() + datetime.timedelta(days=3, hours=10)
+    end_time = start_time + datetime.timedelta(hours=2)
+    for offset, room in ((0, "Classroom"), (0, "Edison Room"),
+                         (200, "Classroom")):
+      models.Event(name="Test Event",
+                   start_time=start_time + datetime.timedelta(days=offset),
+                   end_time=end_time + datetime.timedelta(days=offset),
+                   type="Meetup", estimated_size="10", setup=15, teardown=15,
+                   details="This is a test event.", rooms=[room]).put()
+    models._room_index = None
+    self._let_writes_settle()
+
+    conflicts = models.Event.check_conflict(start_time, end_time, 0, 0,
+                                            ["Classroom"])
+    self.assertEqual(1, len(conflicts))
+    index = models.Event.room_index()
+    self.assertEqual(1, len(index))
+    self.assertEqual([("Edison Room", start_time.date())],
+                     index.missing(["Classroom", "Edison Room"],
+                                   [start_time.date()]))
+
+  """ Tests that checking a whole series for conflicts at once gives the same
+  answer for each event as checking them one at a time. """
+  def test_batch_conflict_detection(self):
+    # Do it once far in the past, and once in the future where the room index
+    # is used.
+    for base in (datetime.datetime(month=1, day=5, year=2015, hour=10),
+                 local_today() + datetime.timedelta(days=5, hours=10)):
+      event = models.Event(name="Test Event", start_time=base,
+                           end_time=base + datetime.timedelta(hours=2),
+                           type="Meetup", estimated_size="10", setup=15,
+                           teardown=15, details="This is a test event.",
+                           rooms=["Classroom"])
+      event.put()
+
+      # A daily series where only the middle event overlaps.
+      event_times = []
+      for day in (-1, 0, 1):
+        start_time = base + datetime.timedelta(days=day, minutes=30)
+        event_times.append((start_time,
+                            start_time + datetime.timedelta(hours=1)))
+
+      all_conflicts = models.Event.check_conflicts(event_times, 15, 15,
+                                                   ["Classroom"])
+      self.assertEqual(3, len(all_conflicts))
+      self.assertEqual([], all_conflicts[0])
+      self.assertEqual([event.key().id()],
+                       [e.key().id() for e in all_conflicts[1]])
+      self.assertEqual([], all_conflicts[2])
+
+      for (start_time, end_time), conflicts in zip(event_times, all_conflicts):
+        single = models.Event.check_conflict(start_time, end_time, 15, 15,
+                                             ["Classroom"])
+        self.assertEqual([e.key().id() for e in single],
+                         [e.key().id() for e in conflicts])
+
+      # Ignoring the event we're editing should get rid of the conflict.
+      all_conflicts = models.Event.check_conflicts(event_times, 15, 15,
+          ["Classroom"], optional_existing_event_id=event.key().id())
+      self.assertEqual([[], [], []], all_conflicts)
+
+  """ Tests that the cached counts of coworking-hours events stay correct as
+  events change. """
+  def test_coworking_event_counts(self):
+    day = local_today() + datetime.timedelta(days=3)
+    other_day = day + datetime.timedelta(days=1)
+    event = models.Event(name="Test Event",
+                         start_time=day + datetime.timedelta(hours=10),
+                         end_time=day + datetime.timedelta(hours=11),
+                         type="Meetup", estimated_size="10", setup=15,
+                         teardown=15, details="This is a test event.",
+                         rooms=["Classroom"])
+    event.put()
+
+    days = [day.date(), other_day.date()]
+    self.assertEqual({day.date(): 1, other_day.date(): 0},
+                     models.Event.coworking_event_counts(days))
+    # The second time it should come out of memcache.
+    self.assertEqual({day.date(): 1, other_day.date(): 0},
+                     models.Event.coworking_event_counts(days))
+
+    # It should notice when the event stops counting.
+    event.status = "not_approved"
+    event.put()
+    self.assertEqual({day.date(): 0, other_day.date(): 0},
+                     models.Event.coworking_event_counts(days))
+    # Nobody should be able to cache a count from before the change for a
+    # while, in case they counted before it.
+    self.assertEqual(models.CACHE_STALE,
+                     memcache.get("coworking_events.%s" % day.date().isoformat()))
+
+    # It should also notice when an event moves to another day.
+    event = models.Event.get_by_id(event.key().id())
+    event.status = "approved"
+    event.put()
+    self.assertEqual({day.date(): 1, other_day.date(): 0},
+                     models.Event.coworking_event_counts(days))
+
+    event = models.Event.get_by_id(event.key().id())
+    event.start_time += datetime.timedelta(days=1)
+    event.end_time += datetime.timedelta(days=1)
+    event.put()
+    self.assertEqual({day.date(): 0, other_day.date(): 1},
+                     models.Event.coworking_event_counts(days))
+
+  """ Tests that counting a lot of days at once gets the same counts with just a
+  query for each month or so. """
+  def test_coworking_event_counts_range(self):
+    day = local_today() + datetime.timedelta(days=3)
+    starts = [(0, 10, "approved"), (0, 15, "pending"), (1, 20, "approved"),
+              (2, 11, "not_approved"), (35, 9, "approved")]
+    for offset, hour, status in starts:
+      start_time = day + datetime.timedelta(days=offset, hours=hour)
+      models.Event(name="Test Event", start_time=start_time,
+                   end_time=start_time + datetime.timedelta(hours=1),
+                   type="Meetup", estimated_size="10", status=status,
+                   details="This is a test event.",
+                   rooms=["Classroom"]).put()
+
+    days = [(day + datetime.timedelta(days=i)).date() for i in range(40)]
+    expected = dict((d, 0) for d in days)
+    expected[days[0]] = 2
+    expected[days[35]] = 1
+
+    calls = []
+    def count_calls(service, call, request, response):
+      calls.append(call)
+    apiproxy_stub_map.apiproxy.GetPostCallHooks().Append("count_calls",
+        count_calls, "datastore_v3")
+    try:
+      self.assertEqual(expected, models.Event.coworking_event_counts(days))
+    finally:
+      apiproxy_stub_map.apiproxy.GetPostCallHooks().Clear()
+
+    # Two stretches of days, with a query for each status.
+    self.assertEqual(4, calls.count("RunQuery"))
+    self.assertEqual(expected, models.Event.coworking_event_counts(days))
+
+  """ Tests that bounding the conflict query by the longest event doesn't make
+  it miss long events that started well before the proposed one. """
+  def test_long_event_conflict(self):
+    start_time = datetime.datetime(month=3, day=1, year=2015, hour=10)
+    event = models.Event(name="Test Event", start_time=start_time,
+                         end_time=start_time + datetime.timedelta(days=3),
+                         type="Meetup", estimated_size="10", setup=15,
+                         teardown=15, details="This is a test event.",
+                         rooms=["Classroom", "Maker Space"])
+    event.put()
+    self.assertEqual(datetime.timedelta(days=3),
+                     models.longest_event_length())
+
+    new_start_time = start_time + datetime.timedelta(days=2)
+    new_end_time = new_start_time + datetime.timedelta(hours=1)
+    conflicts = models.Event.check_conflict(new_start_time, new_end_time, 15,
+                                            15, ["Maker Space", "Edison Room"])
+    self.assertEqual([event.key().id()], [e.key().id() for e in conflicts])
+
+    # Shorter events shouldn't lower the bound.
+    short = models.Event(name="Test Event", start_time=start_time,
+                         end_time=start_time + datetime.timedelta(hours=1),
+                         type="Meetup", estimated_size="10", setup=15,
+                         teardown=15, details="This is a test event.",
+                         rooms=["Classroom"])
+    short.put()
+    self.assertEqual(datetime.timedelta(days=3),
+                     models.longest_event_length())
+
+    # Different rooms shouldn't conflict.
+    self.assertEqual([], models.Event.check_conflict(new_start_time,
+        new_end_time, 15, 15, ["Edison Room"]))
+
+  """ Tests that the occupancy bitmaps only say a room is free when it really
+  is, and that they keep up with changes. """
+  def test_occupancy_bitmaps(self):
+    day = local_today() + datetime.timedelta(days=3)
+    start_time = day + datetime.timedelta(hours=10)
+    event = models.Event(name="Test Event", start_time=start_time,
+                         end_time=start_time + datetime.timedelta(hours=1),
+                         type="Meetup", estimated_size="10", setup=15,
+                         teardown=15, details="This is a test event.",
+                         rooms=["Classroom"])
+    event.put()
+
+    hour = datetime.timedelta(hours=1)
+    windows = [(start_time - hour, start_time),
+               (start_time + datetime.timedelta(minutes=50), start_time + hour),
+               (start_time, start_time + hour)]
+    self.assertEqual([False, True, True],
+                     models.Event.maybe_occupied(windows, ["Classroom"]))
+    self.assertEqual([False, False, False],
+                     models.Event.maybe_occupied(windows, ["Edison Room"]))
+
+    # Once the bitmaps are cached, they should give the same answers.
+    memcache.flush_all()
+    models.Event.maybe_occupied(windows, ["Classroom"])
+    self.assertEqual([False, True, True],
+                     models.Event.maybe_occupied(windows, ["Classroom"]))
+
+    # It should notice when the event goes away, or moves to another room.
+    event.status = "canceled"
+    event.put()
+    self.assertEqual([False, False, False],
+                     models.Event.maybe_occupied(windows, ["Classroom"]))
+
+    event.status = "pending"
+    event.rooms = ["Edison Room"]
+    event.put()
+    self.assertEqual([False, False, False],
+                     models.Event.maybe_occupied(windows, ["Classroom"]))
+    self.assertEqual([False, True, True],
+                     models.Event.maybe_occupied(windows, ["Edison Room"]))
+
+  """ Tests that a whole recurring series gets saved with a handful of parallel
+  datastore calls, instead of a couple in a row for every event. """
+  def test_put_series(self):
+    start_time = datetime.datetime.combine(local_today(), datetime.time(10)) + \
+                 datetime.timedelta(days=3)
+    length = datetime.timedelta(hours=1)
+    # Make sure we don't count the update to the longest event length.
+    models.CalendarStats.raise_longest_event(length)
+
+    keys = models.Event.allocate_keys(50)
+    events = []
+    for i, key in enumerate(keys):
+      event_start = start_time + datetime.timedelta(days=7 * i)
+      events.append(models.Event(key=key, name="Test Event",
+                                 start_time=event_start,
+                                 end_time=event_start + length,
+                                 type="Meetup", estimated_size="10",
+                                 details="This is a test event.",
+                                 rooms=["Classroom"]))
+
+    calls = []
+    def count_calls(service, call, request, response):
+      calls.append(call)
+    apiproxy_stub_map.apiproxy.GetPostCallHooks().Append("count_calls",
+        count_calls, "datastore_v3")
+    try:
+      models.Event.put_series(events, "Created new event")
+    finally:
+      apiproxy_stub_map.apiproxy.GetPostCallHooks().Clear()
+
+    # Each event and its log are one entity group, and an RPC can write 10.
+    self.assertEqual(["Put"] * 5, calls)
+
+    self.assertEqual(50, models.Event.all().count())
+    logs = models.HDLog.all().fetch(100)
+    self.assertEqual(50, len(logs))
+    self.assertEqual(set(keys),
+                     set([models.HDLog.event.get_value_for_datastore(log)
+                          for log in logs]))
+    for log in logs:
+      self.assertEqual(log.parent_key(),
+                       models.HDLog.event.get_value_for_datastore(log))
+
+  """ Tests that event summaries match to_dict() and keep up with changes. """
+  def test_get_summaries(self):
+    # Summaries include the member who made the event.
+    self.testbed.setup_env(user_email="testy.testerson@gmail.com",
+                           overwrite=True)
+    start_time = datetime.datetime.combine(local_today(), datetime.time(10)) + \
+                 datetime.timedelta(days=3)
+    events = []
+    for i in range(3):
+      event = models.Event(name="Test Event %d" % i,
+                           start_time=start_time + datetime.timedelta(days=i),
+                           end_time=start_time + datetime.timedelta(days=i, hours=1),
+                           type="Meetup", estimated_size="10", status="approved",
+                           details="This is a test event." * 100,
+                           rooms=["Classroom"])
+      event.put()
+      events.append(event)
+
+    # The summary query should come back in order without the big properties.
+    query = models.Event.get_ongoing_and_future_query(summary=True)
+    keys = [event.key() for event in query]
+    self.assertEqual([event.key() for event in events], keys)
+
+    expected = [event.to_dict(summarize=True) for event in events]
+    self.assertEqual(expected, models.Event.get_summaries(keys))
+    # Just after an event is written, its summary can't be cached, in case
+    # someone else loaded it before the write.
+    self.assertEqual(models.CACHE_STALE,
+                     memcache.get("event_summary.%d" % keys[0].id()))
+
+    # Once that wears off, it should be.
+    memcache.delete_multi(["event_summary.%d" % key.id() for key in keys])
+    self.assertEqual(expected, models.Event.get_summaries(keys))
+    self.assertEqual(expected[0], memcache.get("event_summary.%d" % keys[0].id()))
+    self.assertEqual(expected, models.Event.get_summaries(keys))
+
+    # Changing an event should keep the old summary from being used.
+    events[1].name = "Renamed Event"
+    events[1].put()
+    self.assertEqual("Renamed Event",
+                     models.Event.get_summaries(keys)[1]["name"])
+
+  """ Tests that export snapshots come back the way they were saved, even when
+  they're split into several chunks. """
+  def test_export_snapshot(self):
+    start_time = datetime.datetime.combine(local_today(), datetime.time(10))
+    entries = [(start_time + datetime.timedelta(days=i), i, "Event %d\n" % i * 20)
+               for i in range(10)]
+    snapshot = models.ExportSnapshot.save("csv", "header\n", entries, "",
+                                          chunk_size=500, generation=1,
+                                          content_type="text/csv")
+    self.assertGreater(snapshot.chunk_count, 1)
+
+    snapshot = models.ExportSnapshot.get_by_key_name("csv")
+    self.assertEqual(1, snapshot.generation)
+    self.assertEqual(("header\n", entries, ""), snapshot.load())
+
+    # Replacing it should get rid of the old chunks.
+    old = snapshot
+    models.ExportSnapshot.save("csv", "header\n", entries[:1], "",
+                               chunk_size=500, generation=2,
+                               content_type="text/csv")
+    self.assertEqual(None, old.load())
+    self.assertEqual(1, models.ExportSnapshotChunk.all().count())
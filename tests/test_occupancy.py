@@ -0,0 +1,40 @@
+""" Tests for the contents of occupancy.py. """
+
+# This needs to be at the top so that we have all our externals.
+import appengine_config
+
+import datetime
+import unittest
+
+from occupancy import free_windows
+
+
+""" Tests that the gaps between blocked intervals have the right ends. """
+class TestFreeWindows(unittest.TestCase):
+  def _time(self, hour):
+    return datetime.datetime(2015, 1, 7, hour, 0)
+
+  """ Tests that the ends of open intervals are free. """
+  def test_open(self):
+    windows = free_windows(self._time(0), self._time(23),
+                           [(self._time(12), self._time(14)),
+                            (self._time(14), self._time(15))])
+    self.assertEqual([(self._time(0), self._time(12), False, False),
+                      (self._time(14), self._time(14), False, False),
+                      (self._time(15), self._time(23), False, False)], windows)
+
+  """ Tests that the ends of closed intervals are excluded, even where they
+  touch the end of an open one. """
+  def test_closed(self):
+    windows = free_windows(self._time(0), self._time(23),
+                           [(self._time(8), self._time(9)),
+                            (self._time(17), self._time(18))],
+                           [(self._time(9), self._time(17))])
+    self.assertEqual([(self._time(0), self._time(8), False, False),
+                      (self._time(18), self._time(23), False, False)], windows)
+
+    windows = free_windows(self._time(0), self._time(23), [],
+                           [(self._time(9), self._time(17)),
+                            (self._time(23), self._time(23))])
+    self.assertEqual([(self._time(0), self._time(9), False, True),
+                      (self._time(17), self._time(23), True, True)], windows)
@@ -0,0 +1,86 @@
+""" Tests for the contents of recurrence.py. """
+
+# This needs to be at the top so that we have all our externals.
+import appengine_config
+
+import datetime
+import unittest
+
+from recurrence import Recurrence
+
+
+""" Tests that recurrence rules expand into the right occurrences. """
+class TestExpansion(unittest.TestCase):
+  def setUp(self):
+    # This is a Wednesday.
+    self.start = datetime.datetime(2015, 1, 7, 18, 0)
+
+  """ Tests that daily events can skip weekends. """
+  def test_weekdays_only(self):
+    occurrences = Recurrence("daily", 6, weekdays_only=True).expand(self.start)
+    self.assertEqual([7, 8, 9, 12, 13, 14], [o.day for o in occurrences])
+    for occurrence in occurrences:
+      self.assertEqual(18, occurrence.hour)
+
+    # Starting on a weekend should skip straight to Monday.
+    saturday = datetime.datetime(2015, 1, 10, 18, 0)
+    occurrences = Recurrence("daily", 3, weekdays_only=True).expand(saturday)
+    self.assertEqual([10, 12, 13], [o.day for o in occurrences])
+
+  """ Tests that monthly events land on the right weekday of every month. """
+  def test_monthly(self):
+    recurrence = Recurrence("monthly", 4, week_number=1, weekday=0)
+    occurrences = recurrence.expand(self.start)
+    # After the first one, they should be the first Monday of each month.
+    self.assertEqual([datetime.datetime(2015, 1, 7, 18, 0),
+                      datetime.datetime(2015, 2, 2, 18, 0),
+                      datetime.datetime(2015, 3, 2, 18, 0),
+                      datetime.datetime(2015, 4, 6, 18, 0)], occurrences)
+
+    # It should work across the end of a year too.
+    december = datetime.datetime(2014, 12, 10, 9, 0)
+    recurrence = Recurrence("monthly", 3, week_number=2, weekday=2)
+    self.assertEqual([datetime.datetime(2014, 12, 10, 9, 0),
+                      datetime.datetime(2015, 1, 14, 9, 0),
+                      datetime.datetime(2015, 2, 11, 9, 0)],
+                     recurrence.expand(december))
+    self.assertTrue(recurrence.matches(december))
+    self.assertFalse(recurrence.matches(self.start))
+
+  """ Tests that start and end times both get expanded. """
+  def test_expand_times(self):
+    end = self.start + datetime.timedelta(hours=2)
+    times = Recurrence("weekly", 3).expand_times(self.start, end)
+    self.assertEqual(3, len(times))
+    for start, end in times:
+      self.assertEqual(datetime.timedelta(hours=2), end - start)
+    self.assertEqual(datetime.timedelta(days=14), times[2][0] - times[0][0])
+
+
+""" Tests for converting rules to and from RRULEs. """
+class TestRRule(unittest.TestCase):
+  """ Tests that every kind of rule survives a round trip. """
+  def test_round_trip(self):
+    rules = [Recurrence("daily", 5),
+             Recurrence("daily", 5, weekdays_only=True),
+             Recurrence("weekly", 3),
+             Recurrence("monthly", 6, week_number=3, weekday=4)]
+    for rule in rules:
+      self.assertEqual(rule, Recurrence.from_rrule(rule.rrule().ical()))
+
+  """ Tests that we can read rules written by other programs. """
+  def test_parse(self):
+    self.assertEqual(Recurrence("monthly", 4, week_number=2, weekday=1),
+                     Recurrence.from_rrule("FREQ=MONTHLY;BYDAY=2TU;COUNT=4"))
+    self.assertEqual(Recurrence("daily", 10, weekdays_only=True),
+        Recurrence.from_rrule("FREQ=DAILY;COUNT=10;BYDAY=MO,TU,WE,TH,FR"))
+
+  """ Tests that rules we can't handle are rejected. """
+  def test_unsupported(self):
+    for rrule in ("FREQ=DAILY", "FREQ=YEARLY;COUNT=2",
+                  "FREQ=WEEKLY;COUNT=2;INTERVAL=2",
+                  "FREQ=WEEKLY;COUNT=2;BYDAY=MO,WE",
+                  "FREQ=MONTHLY;COUNT=2;BYDAY=-1FR",
+                  "FREQ=DAILY;COUNT=2;UNTIL=20150101T000000",
+                  "not a rule"):
+      self.assertRaises(ValueError, Recurrence.from_rrule, rrule)
@@ -3,7 +3,7 @@
 # This needs to be at the top so that we have all our externals.
 import appengine_config
 
-import unittest, utils
+import gzip, StringIO, unittest, utils, zlib
 
 
 """ Tests to make sure phone number validation works properly. """
@@ -22,3 +22,51 @@ class TestPhoneNumbers(unittest.TestCase):
     self.assertTrue(utils.is_phone_valid('6508987925x1234'))
     self.assertFalse(utils.is_phone_valid('89879251234'))
     self.assertFalse(utils.is_phone_valid('foo bar'))
+
+
+""" Tests for the LRU cache. """
+class TestLRUCache(unittest.TestCase):
+  """ Tests that it forgets the least recently used item when it's full. """
+  def test_eviction(self):
+    cache = utils.LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    self.assertEqual(1, cache.get("a"))
+
+    # Now "b" is the one that hasn't been used in the longest time.
+    cache.put("c", 3)
+    self.assertEqual(2, len(cache))
+    self.assertEqual(None, cache.get("b"))
+    self.assertEqual(1, cache.get("a"))
+    self.assertEqual(3, cache.get("c"))
+    self.assertEqual("default", cache.get("b", "default"))
+
+
+""" Tests for compressing things once and sending them with any encoding. """
+class TestPrecompress(unittest.TestCase):
+  """ Tests that every encoding decompresses back to the original. """
+  def test_encodings(self):
+    text = (u"Caf\xe9 event " * 1000).encode("utf-8")
+    for data in ("", "a", text):
+      compressed = utils.precompress(data)
+      gzipped = utils.encode_precompressed(compressed, "gzip")
+      self.assertEqual(data, gzip.GzipFile(fileobj=StringIO.StringIO(gzipped)).read())
+      deflated = utils.encode_precompressed(compressed, "deflate")
+      self.assertEqual(data, zlib.decompress(deflated))
+
+    self.assertLess(len(utils.encode_precompressed(utils.precompress(text), "gzip")),
+                    len(text) / 10)
+    self.assertRaises(ValueError, utils.encode_precompressed,
+                      utils.precompress(text), "br")
+
+
+
+""" Tests for comparing signatures without leaking where they differ. """
+class TestConstantTimeEqual(unittest.TestCase):
+  """ Tests that the fallback for older runtimes gives the same answers as
+  hmac.compare_digest(). """
+  def test_fallback(self):
+    for a, b in (("", ""), ("abc", "abc"), ("abc", "abd"), ("abc", "ab"),
+                 ("xbc", "abc"), ("a" * 32, "a" * 31 + "b")):
+      self.assertEqual(a == b, utils._compare_digest(a, b))
+      self.assertEqual(a == b, utils.constant_time_equal(a, b))
@@ -3,8 +3,13 @@ from datetime import datetime, timedelta
 import re
 import pytz
 
+import hmac
 import random
 import string
+import struct
+import threading
+import zlib
+from collections import OrderedDict
 from shared.api import domain
 import json
 import logging
@@ -143,3 +148,101 @@ class UserRights(object):
                               and self.user not in self.event.staff)
             self.can_unstaff = (self.event.status not in ['canceled', 'deleted']
                                 and self.user in self.event.staff)
+
+
+class LRUCache(object):
+    def __init__(self, size):
+        """Constructor
+
+        A small thread-safe cache that forgets the least recently used items
+        once it gets full.
+
+        Args:
+            size: The most items to keep.
+        """
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._items.pop(key, self)
+            if value is self:
+                return default
+            # Move it back to the most recently used end.
+            self._items[key] = value
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+
+# The content encodings that precompress() output can be sent with.
+COMPRESSED_ENCODINGS = ('gzip', 'deflate')
+
+
+def precompress(data):
+    """Compress something once, so that it can be sent with any of
+    COMPRESSED_ENCODINGS. They all use the same compressed stream, and only
+    differ in the header and checksums around it.
+
+    Args:
+        data: The string to compress.
+
+    Returns: A tuple to pass to encode_precompressed().
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+    stream = compressor.compress(data) + compressor.flush()
+    return (stream, zlib.crc32(data) & 0xffffffff,
+            zlib.adler32(data) & 0xffffffff, len(data) & 0xffffffff)
+
+
+def encode_precompressed(compressed, encoding):
+    """Wrap up something from precompress() for a particular content encoding.
+
+    Args:
+        compressed: The tuple from precompress().
+        encoding: One of COMPRESSED_ENCODINGS.
+
+    Returns: The encoded string.
+    """
+    stream, crc, adler, size = compressed
+    if encoding == 'gzip':
+        # No file name or modification time, and an unknown OS.
+        return '\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff' + stream + \
+            struct.pack('<II', crc, size)
+    if encoding == 'deflate':
+        # A zlib header for the default compression level.
+        return '\x78\x9c' + stream + struct.pack('>I', adler)
+    raise ValueError('Unknown content encoding: %s' % encoding)
+
+
+def _compare_digest(a, b):
+    """Compare two strings in an amount of time that only depends on their
+    length, and not on where they differ, so that it can't be used to guess a
+    signature one character at a time.
+
+    Args:
+        a: One string.
+        b: The other string.
+
+    Returns: True if they are the same.
+    """
+    if len(a) != len(b):
+        return False
+    result = 0
+    for x, y in zip(a, b):
+        result |= ord(x) ^ ord(y)
+    return result == 0
+
+
+# hmac.compare_digest() only showed up in Python 2.7.7, and we can't count on
+# the runtime being that new.
+constant_time_equal = getattr(hmac, 'compare_digest', _compare_digest)